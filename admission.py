@@ -0,0 +1,296 @@
+import math
+import os
+import time
+
+import config
+import metrics
+
+logger = config.get_logger()
+
+# cgroup v1 reports an unlimited memory limit as a huge page-aligned number
+UNLIMITED = 2 ** 60
+
+# Retry-After bounds in seconds, and the value used when no running meeting has a known end
+MIN_RETRY_AFTER = 5
+MAX_RETRY_AFTER = 3600
+DEFAULT_RETRY_AFTER = 60
+
+
+class AdmissionError(Exception):
+    """Raised when a recording request is refused, carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, message, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CgroupStats:
+    """
+    Memory and CPU usage and limits of this container
+
+    Read from the cgroup v2 or v1 files under CGROUP_ROOT. Without a cgroup
+    limit the host's memory and CPU count are used instead.
+    """
+
+    def __init__(self, root: str = None):
+        """
+        Args:
+            root (str): cgroup mount point, taken from config when omitted
+        """
+        self.root = root or config.get_cgroup_root()
+        self.v2 = os.path.exists(os.path.join(self.root, "cgroup.controllers"))
+
+    def _path(self, controller: str, name: str) -> str:
+        """Path of a cgroup file, in this process' own cgroup when it is visible"""
+        base = self.root if self.v2 else os.path.join(self.root, controller)
+        own = _own_cgroup("" if self.v2 else controller)
+        if own and os.path.exists(os.path.join(base + own, name)):
+            return os.path.join(base + own, name)
+        return os.path.join(base, name)
+
+    def _read(self, controller: str, name: str):
+        try:
+            with open(self._path(controller, name)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def memory(self) -> tuple:
+        """
+        Memory in use and the limit, in bytes
+
+        Page cache that can be reclaimed without swapping is not counted as
+        in use, recordings written to disk would fill it otherwise.
+
+        Returns:
+            tuple: (bytes in use, limit in bytes), None for values that could not be read
+        """
+        if self.v2:
+            usage, limit = self._read("memory", "memory.current"), self._read("memory", "memory.max")
+            inactive = _stat(self._read("memory", "memory.stat"), "inactive_file")
+        else:
+            usage = self._read("memory", "memory.usage_in_bytes")
+            limit = self._read("memory", "memory.limit_in_bytes")
+            inactive = _stat(self._read("memory", "memory.stat"), "total_inactive_file")
+        limit = int(limit) if limit and limit != "max" and int(limit) < UNLIMITED else None
+        if usage is not None and limit is not None:
+            return int(usage) - (inactive or 0), limit
+
+        # No limit on the cgroup, the host's memory is what runs out
+        meminfo = _meminfo()
+        if "MemTotal" in meminfo and "MemAvailable" in meminfo:
+            return meminfo["MemTotal"] - meminfo["MemAvailable"], meminfo["MemTotal"]
+        return None, None
+
+    def cpu_seconds(self):
+        """CPU time used so far in seconds, None when it cannot be read"""
+        if self.v2:
+            usage = _stat(self._read("cpu", "cpu.stat"), "usage_usec")
+            return usage / 1e6 if usage is not None else None
+        usage = self._read("cpuacct", "cpuacct.usage")
+        if usage is not None:
+            return int(usage) / 1e9
+        try:
+            with open("/proc/stat") as f:
+                fields = [int(value) for value in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        # Everything but idle and iowait
+        busy = sum(fields) - sum(fields[3:5])
+        return busy / os.sysconf("SC_CLK_TCK")
+
+    def cpu_limit(self) -> float:
+        """CPU cores the container may use"""
+        if self.v2:
+            value = (self._read("cpu", "cpu.max") or "max").split()
+            quota, period = value[0], value[1] if len(value) > 1 else "100000"
+        else:
+            quota, period = self._read("cpu", "cpu.cfs_quota_us") or "-1", self._read("cpu", "cpu.cfs_period_us")
+        if quota not in ("max", "-1") and period:
+            return int(quota) / int(period)
+        return float(os.cpu_count() or 1)
+
+
+def _own_cgroup(controller: str):
+    """This process' cgroup path for a v1 controller, or the v2 path for an empty name"""
+    try:
+        with open("/proc/self/cgroup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if (controller in controllers.split(",")) if controller else controllers == "":
+            return path.rstrip("/") or None
+    return None
+
+
+def _stat(text: str, key: str):
+    """Value of one key in a flat cgroup stat file such as memory.stat"""
+    for line in (text or "").splitlines():
+        name, _, value = line.partition(" ")
+        if name == key:
+            return int(value)
+    return None
+
+
+def _meminfo() -> dict:
+    try:
+        with open("/proc/meminfo") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return {}
+    values = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        values[name] = int(value.split()[0]) * 1024
+    return values
+
+
+class AdmissionController:
+    """
+    Decides whether this node has room for another recording
+
+    Usage is sampled from the cgroup on every job store heartbeat. A
+    recording is assumed to cost ADMISSION_JOB_MEMORY_MB and
+    ADMISSION_JOB_CPU, raised to what running recordings are measured to
+    use above the idle node. A recording that was just started is counted
+    at that cost on top of the measured usage, fading out over
+    WARMUP_SECONDS while its browser and ffmpeg grow.
+    """
+
+    WARMUP_SECONDS = 60
+    # Weight of the newest sample in the CPU rate and cost averages
+    SMOOTHING = 0.3
+
+    def __init__(self, cgroup: CgroupStats = None, job_memory: int = None, job_cpu: float = None):
+        """
+        Args:
+            cgroup (CgroupStats): Source of usage and limits, the container's cgroup when omitted
+            job_memory (int): Assumed bytes of memory per recording
+            job_cpu (float): Assumed CPU cores per recording
+        """
+        self.cgroup = cgroup or CgroupStats()
+        self.min_job_memory = job_memory or config.get_admission_job_memory()
+        self.min_job_cpu = job_cpu or config.get_admission_job_cpu()
+        self.job_memory = self.min_job_memory
+        self.job_cpu = self.min_job_cpu
+        self.memory_high = config.get_admission_memory_high()
+        self.memory_critical = config.get_admission_memory_critical()
+        self.cpu_high = config.get_admission_cpu_high()
+        self.max_queued = config.get_admission_max_queued()
+        self.memory = None
+        self.memory_limit = None
+        self.cpu = None
+        self.cpu_limit = None
+        self._cpu_sample = None
+        self._idle = None
+        self._started = []
+
+    def sample(self, running: int):
+        """
+        Read the cgroup and update the per-recording cost
+
+        Args:
+            running (int): Recordings running on this node
+        """
+        self.memory, self.memory_limit = self.cgroup.memory()
+        self.cpu_limit = self.cgroup.cpu_limit()
+        now = time.monotonic()
+        used = self.cgroup.cpu_seconds()
+        if used is not None:
+            if self._cpu_sample and now > self._cpu_sample[0]:
+                rate = max(0.0, (used - self._cpu_sample[1]) / (now - self._cpu_sample[0]))
+                self.cpu = rate if self.cpu is None else self.cpu + self.SMOOTHING * (rate - self.cpu)
+            self._cpu_sample = (now, used)
+
+        self._started = [started for started in self._started if now - started < self.WARMUP_SECONDS]
+        if self.memory is not None and self.cpu is not None:
+            self._learn(running)
+        metrics.ADMISSION_HEADROOM.set(min(self.headroom(), 1000))
+
+    def _learn(self, running: int):
+        if running == 0:
+            self._idle = (self.memory, self.cpu)
+        elif self._idle and not self._started:
+            # Only settled recordings say what one really costs
+            memory = (self.memory - self._idle[0]) / running
+            cpu = (self.cpu - self._idle[1]) / running
+            self.job_memory = max(self.min_job_memory, self.job_memory + self.SMOOTHING * (memory - self.job_memory))
+            self.job_cpu = max(self.min_job_cpu, self.job_cpu + self.SMOOTHING * (cpu - self.job_cpu))
+
+    def started(self):
+        """Count a recording that was just started until its cost shows in the samples"""
+        self._started.append(time.monotonic())
+
+    def headroom(self):
+        """Further recordings that fit, math.inf while no usage could be read"""
+        fits = math.inf
+        if self.memory is not None and self.memory_limit:
+            fits = (self.memory_limit * self.memory_high - self.memory) / self.job_memory
+        if self.cpu is not None and self.cpu_limit:
+            fits = min(fits, (self.cpu_limit * self.cpu_high - self.cpu) / self.job_cpu)
+        if fits == math.inf:
+            return fits
+        # A recording just started has not grown yet, its share fades out over WARMUP_SECONDS
+        now = time.monotonic()
+        warming = sum(max(0.0, 1 - (now - started) / self.WARMUP_SECONDS) for started in self._started)
+        return max(0, math.floor(fits - warming + 1e-9))
+
+    def critical(self) -> bool:
+        """Whether memory is so short that recordings due now are refused outright"""
+        return (self.memory is not None and bool(self.memory_limit)
+                and self.memory >= self.memory_limit * self.memory_critical)
+
+    def check(self, due: bool, ahead: int, free: int, deadlines: list, now: float = None):
+        """
+        Refuse a new recording that cannot start in time
+
+        Recordings due later are always accepted, they are only started
+        once a node has room. Jobs are started in the order of their start
+        time, so a recording due now only waits for the jobs ahead of it.
+
+        Args:
+            due (bool): Whether the recording should start right away
+            ahead (int): Queued jobs due now that start before it
+            free (int): Free recorders on every live node, with room to spare
+            deadlines (list): Sorted epoch times at which running meetings end
+
+        Raises:
+            AdmissionError: 503 when this node is out of memory and no node has a free recorder,
+                429 when more than ADMISSION_MAX_QUEUED jobs already wait for one
+        """
+        if not due:
+            return
+        now = now or time.time()
+        if free == 0 and self.critical():
+            retry_after = _retry_after(deadlines, 0, now)
+            metrics.record_rejection(503)
+            raise AdmissionError(
+                f"Recorder out of memory ({self.memory // 2 ** 20} of {self.memory_limit // 2 ** 20} MiB used), "
+                f"retry in {retry_after} seconds", 503, retry_after)
+        waiting = ahead - free
+        if waiting >= self.max_queued:
+            # Enough running meetings have to end for this one to be within the limit
+            retry_after = _retry_after(deadlines, waiting - self.max_queued, now)
+            metrics.record_rejection(429)
+            raise AdmissionError(
+                f"{waiting} recording(s) already wait for a recorder, retry in {retry_after} seconds", 429, retry_after)
+
+    def stats(self):
+        return {
+            "memory_bytes": self.memory,
+            "memory_limit_bytes": self.memory_limit,
+            "cpu_cores": round(self.cpu, 2) if self.cpu is not None else None,
+            "cpu_limit_cores": self.cpu_limit,
+            "job_memory_bytes": int(self.job_memory),
+            "job_cpu_cores": round(self.job_cpu, 2),
+            "headroom": None if self.headroom() == math.inf else self.headroom(),
+        }
+
+
+def _retry_after(deadlines: list, index: int, now: float) -> int:
+    """Seconds until the index-th running meeting ends, within the Retry-After bounds"""
+    seconds = deadlines[index] - now if index < len(deadlines) else DEFAULT_RETRY_AFTER
+    return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(seconds))))
@@ -4,17 +4,35 @@ FastAPI application for Google Meet recording
 Provides API endpoints to start and manage Google Meet recordings
 """
 
-import uvicorn
+import asyncio
+import json
+
 import config
 
-from fastapi import FastAPI, HTTPException
+# Load .env and logging before the modules below read their settings
+config.setup()
+
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+from jobs import JobQueue
+
+from admission import AdmissionError
 
-from google_meet import record_meeting
+from scheduler import CalendarScheduler
 
-from models import MeetingRequest, MeetingResponse
+from google_meet import browser_pool, session_store, spool, upload_manager, recover_recordings
+
+import executors
+import metrics
+
+from models import MeetingRequest, JobResponse, JobListResponse
 
 logger = config.get_logger()
 
+job_queue = JobQueue()
+scheduler = CalendarScheduler(job_queue)
+
 app = FastAPI(
     title="Google Meet Recording API",
     description="API for recording Google Meet sessions and uploading to Google Drive",
@@ -23,48 +41,167 @@ app = FastAPI(
 
 @app.get("/")
 async def root():
-    """Health check endpoint"""
+    """Liveness check, answers as soon as the server runs"""
     return {
         "message": "Google Meet Recording API",
         "status": "running",
         "version": "1.0.0"
     }
 
-@app.post("/record-meeting", response_model=MeetingResponse)
+@app.get("/stats")
+async def stats():
+    """Executor queue depths, pool usage and spool usage"""
+    return {
+        "executors": executors.get_stats(),
+        "browser_pool": browser_pool.stats(),
+        "session_cache": session_store.get_stats(),
+        "pending_uploads": upload_manager.pending_count(),
+        "calendar_scheduler": scheduler.stats() if config.get_calendar_scheduler() else None,
+        "node": {"node_id": job_queue.node_id, "workers": job_queue.worker_count,
+                 "free": job_queue.free_workers()},
+        "admission": job_queue.admission.stats() if job_queue.admission else None,
+        "spool": await executors.run_io(spool.stats),
+    }
+
+@app.get("/nodes")
+async def list_nodes():
+    """Recorder nodes sharing the job store and their free workers"""
+    return {"nodes": await job_queue.nodes()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Phase latencies, active recordings, live processes and failures in the Prometheus format"""
+    # The gauge callbacks scan /proc and walk the spool, keep them off the loop
+    body, content_type = await executors.run_io(metrics.render)
+    return Response(content=body, media_type=content_type)
+
+@app.get("/ready")
+async def ready():
+    """Readiness check, 503 until startup has finished and while the job store does not answer"""
+    if startup_task is None or not startup_task.done():
+        raise HTTPException(status_code=503, detail="Starting up")
+    if startup_task.exception():
+        raise HTTPException(status_code=503, detail=f"Startup failed: {startup_task.exception()}")
+    try:
+        await job_queue.nodes()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Job store unavailable: {str(e)}")
+    return {"status": "ready", "browser_pool": browser_pool.stats()}
+
+# Background startup, the server answers liveness checks while it runs
+startup_task = None
+
+@app.on_event("startup")
+async def start_workers():
+    """Start the warm-up in the background so the server starts serving right away"""
+    global startup_task
+    startup_task = asyncio.create_task(warm_up())
+
+async def warm_up():
+    """Warm up the browser pool, resume interrupted uploads and start the recording workers"""
+    try:
+        browser_pool.start()
+        upload_manager.resume_pending()
+        await executors.run_io(recover_recordings)
+        job_queue.start()
+    except Exception as e:
+        logger.error(f"Startup failed: {str(e)}")
+        raise
+    if config.get_calendar_scheduler():
+        scheduler.start()
+        webhook_url = config.get_calendar_webhook_url()
+        if webhook_url:
+            try:
+                await executors.run_io(scheduler.watch_calendars, webhook_url)
+            except Exception as e:
+                logger.warning(f"Calendar push notifications unavailable, polling only: {e}")
+    logger.info("Startup finished, ready for recordings")
+
+@app.on_event("shutdown")
+async def stop_workers():
+    """Stop the recording workers and quit the pooled browsers"""
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    await scheduler.stop()
+    await job_queue.stop()
+    browser_pool.close()
+    upload_manager.shutdown()
+    executors.shutdown()
+
+@app.post("/record-meeting", response_model=JobResponse, status_code=202)
 async def record_meeting_endpoint(request: MeetingRequest):
-    """Record a Google Meet session and upload to Google Drive"""
+    """
+    Queue a Google Meet recording and return the job right away
+
+    Answers 429 when too many recordings already wait for a recorder, 503
+    when the recorder is out of memory and 507 when its spool has no room
+    for the recording, all with Retry-After.
+    """
     try:
         # Validate
         duration_minutes = request.duration_minutes or 30
         folder_name = request.folder_name or "Meeting Recordings"
-        
-        # Record the meeting
-        result = await record_meeting(request.meeting_url, duration_minutes, folder_name)
-
-        if result["success"]:
-            return MeetingResponse(
-                status="completed",
-                message=result["message"],
-                meeting_url=request.meeting_url,
-                duration_minutes=duration_minutes,
-                recording_file=result["recording_file"],
-                drive_link=result["drive_link"]
-            )
-        else:
-            return MeetingResponse(
-                status="failed",
-                message=result["message"],
-                meeting_url=request.meeting_url,
-                duration_minutes=duration_minutes,
-                recording_file=result["recording_file"],
-                drive_link=result["drive_link"]
-            )
-        
+
+        # Queue the meeting, a worker records and uploads it
+        job = await job_queue.submit(request.meeting_url, duration_minutes, folder_name,
+                               request.upload_mode, request.encoding_profile, request.start_at)
+        return JobResponse(**job.to_dict())
+
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid meeting URL: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid meeting request: {str(e)}")
     except Exception as e:
-        logger.error(f"Failed to record meeting: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to record meeting: {str(e)}")
+        logger.error(f"Failed to queue meeting: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue meeting: {str(e)}")
+
+@app.get("/jobs", response_model=JobListResponse)
+async def list_jobs():
+    """List queued, running and finished recording jobs"""
+    return JobListResponse(jobs=[JobResponse(**job.to_dict()) for job in await job_queue.list()])
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Get the state and result of a recording job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return JobResponse(**job.to_dict())
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancel a job that has not started recording yet, or withdraw one of its requests"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already recording or finished: {job_id}")
+    return JobResponse(**(await job_queue.get(job_id)).to_dict())
+
+@app.post("/calendar/notifications")
+async def calendar_notification():
+    """Push notification endpoint for calendar watches, triggers a poll"""
+    scheduler.wake()
+    return {"status": "ok"}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream a job's status and recording progress as server-sent events until it finishes"""
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    async def events():
+        async for state in job_queue.watch(job_id, keepalive=config.get_event_keepalive()):
+            if state is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,120 @@
+import asyncio
+import re
+import subprocess
+
+import config
+
+from executors import run_io
+
+logger = config.get_logger()
+
+
+def pactl(*args) -> str:
+    """Run a pactl command and return its output"""
+    result = subprocess.run(["pactl", *args], capture_output=True, text=True, timeout=10)
+    if result.returncode != 0:
+        raise RuntimeError(f"pactl {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def list_sink_inputs():
+    """
+    List playback streams with the process that owns them
+
+    Returns:
+        list: (sink input index, process id or None) tuples
+    """
+    streams = []
+    for block in re.split(r"^Sink Input #", pactl("list", "sink-inputs"), flags=re.M)[1:]:
+        index = block.split("\n", 1)[0].strip()
+        pid = re.search(r'application\.process\.id = "(\d+)"', block)
+        streams.append((index, int(pid.group(1)) if pid else None))
+    return streams
+
+
+def get_parent_pid(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, the fields after it do not
+            return int(f.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def is_descendant(pid: int, root_pid: int) -> bool:
+    """Check whether a process was started, directly or not, by root_pid"""
+    seen = set()
+    while pid and pid not in seen:
+        if pid == root_pid:
+            return True
+        seen.add(pid)
+        pid = get_parent_pid(pid)
+    return False
+
+
+class JobAudioSink:
+    """A PulseAudio null sink that receives the audio of a single job's browser"""
+
+    def __init__(self, job_name: str):
+        """
+        Args:
+            job_name (str): Unique name of the job, used for the sink name
+        """
+        self.sink_name = "rec_" + re.sub(r"[^A-Za-z0-9_]", "_", job_name)
+        self.module_index = None
+        self.routed = set()
+
+    @property
+    def monitor(self) -> str:
+        """PulseAudio source that ffmpeg records from"""
+        return f"{self.sink_name}.monitor"
+
+    def create(self):
+        """Load the null sink module"""
+        self.module_index = pactl(
+            "load-module", "module-null-sink",
+            f"sink_name={self.sink_name}",
+            f"sink_properties=device.description={self.sink_name}"
+        ).strip()
+        logger.info(f"Created audio sink {self.sink_name} (module {self.module_index})")
+
+    def route(self, root_pid: int) -> int:
+        """
+        Move the playback streams of a browser process tree into this sink
+
+        Args:
+            root_pid (int): Process id of the chromedriver or browser that owns the job
+
+        Returns:
+            int: Number of streams moved by this call
+        """
+        moved = 0
+        for index, pid in list_sink_inputs():
+            if index in self.routed or pid is None or not is_descendant(pid, root_pid):
+                continue
+            pactl("move-sink-input", index, self.sink_name)
+            self.routed.add(index)
+            moved += 1
+        return moved
+
+    async def follow(self, root_pid: int, interval: float = None):
+        """Keep routing the browser's new streams until cancelled"""
+        interval = interval or config.get_audio_route_interval()
+        while True:
+            try:
+                if await run_io(self.route, root_pid):
+                    logger.info(f"Routed browser audio into {self.sink_name}")
+            except Exception as e:
+                logger.warning(f"Failed to route browser audio: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        """Unload the sink, PulseAudio moves any remaining streams back to the default sink"""
+        if self.module_index is None:
+            return
+        try:
+            pactl("unload-module", self.module_index)
+            logger.info(f"Removed audio sink {self.sink_name}")
+        except Exception as e:
+            logger.warning(f"Failed to remove audio sink {self.sink_name}: {e}")
+        self.module_index = None
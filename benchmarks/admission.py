@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Check admission control against an emulated container cgroup
+
+Runs one JobQueue node on a scratch job store with more workers than its
+memory allows, like RECORDER_WORKERS set too high for the docker-compose
+limits. The cgroup v2 files it reads live in a scratch directory, and every
+fake recording grows to --job-mb of memory and --job-cpu cores in them
+while it runs. A burst of requests is sent, then calendar jobs that start
+shortly, then one more request for a meeting that is on now. The check
+fails unless:
+
+- memory stays below the limit, where the workers alone would exceed it,
+- requests beyond ADMISSION_MAX_QUEUED waiting jobs get 429 with a
+  Retry-After,
+- the last request is accepted although more calendar jobs than that wait,
+  and starts before them because its meeting starts first,
+- a request due now gets 503 once memory is critical and no recorder is free,
+- every accepted job completes.
+
+    python benchmarks/admission.py --workers 8 --burst 12
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["JOB_LEASE_SECONDS"] = "2"
+os.environ["JOB_HEARTBEAT_INTERVAL"] = "0.2"
+os.environ["JOB_POLL_INTERVAL"] = "0.2"
+os.environ["ADMISSION_MAX_QUEUED"] = "4"
+
+import executors  # noqa: E402
+import jobs  # noqa: E402
+from admission import AdmissionController, AdmissionError, CgroupStats  # noqa: E402
+from job_store import SQLiteJobStore  # noqa: E402
+
+MIB = 1024 ** 2
+
+
+class FakeCgroup:
+    """cgroup v2 files of a container with the docker-compose limits"""
+
+    def __init__(self, root, memory_limit, cpus, idle_memory):
+        self.root = root
+        self.memory_limit = memory_limit
+        self.idle_memory = idle_memory
+        self.extra = 0
+        self.usage = 0.0
+        self.peak = 0
+        self._write("cgroup.controllers", "cpu memory")
+        self._write("memory.max", str(memory_limit))
+        self._write("cpu.max", f"{int(cpus * 100000)} 100000")
+        self.update(0, 0)
+
+    def _write(self, name, text):
+        # Replaced in one go, the node may read them at any time
+        path = os.path.join(self.root, name)
+        with open(path + ".tmp", "w") as f:
+            f.write(text + "\n")
+        os.replace(path + ".tmp", path)
+
+    def update(self, memory, cpu_seconds):
+        current = self.idle_memory + memory + self.extra
+        self.peak = max(self.peak, current)
+        self.usage += cpu_seconds
+        self._write("memory.current", str(current))
+        self._write("memory.stat", f"anon {current}\ninactive_file 0")
+        self._write("cpu.stat", f"usage_usec {int(self.usage * 1e6)}")
+
+
+async def main(workers, burst, seconds, job_mb, job_cpu):
+    workdir = tempfile.mkdtemp(prefix="admission-")
+    cgroup = FakeCgroup(workdir, 3 * 1024 * MIB, 2.0, 600 * MIB)
+    admission = AdmissionController(CgroupStats(workdir))
+    # Short fake recordings grow sooner than real ones
+    admission.WARMUP_SECONDS = seconds / 2
+    node = jobs.JobQueue(worker_count=workers, store=SQLiteJobStore(os.path.join(workdir, "jobs.db")),
+                         node_id="node-0", admission=admission)
+    original = jobs.record_meeting
+    running = {}
+    started = []
+
+    async def record(meeting_url, duration_minutes, folder_name, *args, **kwargs):
+        running[meeting_url] = time.monotonic()
+        started.append(meeting_url)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            running.pop(meeting_url)
+        return {"success": True, "recording_file": f"{meeting_url.rsplit('/', 1)[-1]}.ogg",
+                "drive_link": None, "message": "Recording completed and uploaded to Google Drive"}
+
+    async def usage():
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.05)
+            now = time.monotonic()
+            # A recording reaches its full size a quarter of the way in, like a browser joining
+            grown = sum(min(1.0, (now - since) / (seconds / 4)) for since in running.values())
+            cgroup.update(int(grown * job_mb * MIB), grown * job_cpu * (now - last))
+            last = now
+
+    async def submit(name, start_at=None, admit=True):
+        try:
+            return await node.submit(f"https://meet.google.com/{name}", 1, "Admission", start_at=start_at,
+                                     admit=admit)
+        except AdmissionError as e:
+            refused.append((name, e.status_code, e.retry_after))
+            return None
+
+    jobs.record_meeting = record
+    refused = []
+    accepted = []
+    usage_task = asyncio.create_task(usage())
+    try:
+        node.start()
+        await asyncio.sleep(0.5)
+
+        for n in range(burst):
+            job = await submit(f"burst-{n:02d}")
+            if job:
+                accepted.append(job.job_id)
+            await asyncio.sleep(0.02)
+        burst_refused = [item for item in refused if item[1] == 429]
+        print(f"burst of {burst}: {len(accepted)} accepted, {len(burst_refused)} refused with 429, "
+              f"Retry-After: {sorted({item[2] for item in burst_refused})}")
+
+        # Calendar jobs are never refused, they start a minute from now
+        start_at = datetime.now(timezone.utc) + timedelta(seconds=60)
+        scheduled = [await submit(f"calendar-{n}", start_at=start_at, admit=False) for n in range(5)]
+        accepted += [job.job_id for job in scheduled]
+
+        # Once a burst job leaves the queue only jobs starting later than a meeting on now are over the limit
+        while True:
+            states = [await node.get(job_id) for job_id in accepted]
+            if sum(1 for job in states if job.status == jobs.QUEUED and "burst" in job.meeting_url) < 4:
+                break
+            await asyncio.sleep(0.05)
+        waiting = sum(1 for job in states if job.status == jobs.QUEUED)
+        late = await submit("on-now")
+        if late:
+            accepted.append(late.job_id)
+
+        started_at = time.time()
+        while time.time() - started_at < 60:
+            states = [await node.get(job_id) for job_id in accepted]
+            if all(job.status in jobs.FINISHED for job in states):
+                break
+            await asyncio.sleep(0.2)
+
+        # Memory taken by something else while every recorder is busy
+        cgroup.extra = int(cgroup.memory_limit * 0.97) - cgroup.idle_memory
+        node.worker_count = 0
+        await asyncio.sleep(0.5)
+        critical = await submit("out-of-memory")
+        await node.stop()
+    finally:
+        usage_task.cancel()
+        jobs.record_meeting = original
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    completed = sum(1 for job in states if job.status == jobs.COMPLETED)
+    order = [url.rsplit("/", 1)[-1] for url in started]
+    late_index = order.index("on-now") if late else None
+    calendar_indexes = [i for i, name in enumerate(order) if name.startswith("calendar-")]
+    unbounded = cgroup.idle_memory + workers * job_mb * MIB
+    print(f"peak memory: {cgroup.peak / MIB:.0f} of {cgroup.memory_limit / MIB:.0f} MiB "
+          f"(all {workers} workers busy would need {unbounded / MIB:.0f} MiB)")
+    print(f"learned cost per recording: {admission.job_memory / MIB:.0f} MiB, {admission.job_cpu:.2f} cores")
+    print(f"late request with {waiting} jobs waiting accepted: {late is not None}, started as #{late_index}, "
+          f"the calendar jobs as {calendar_indexes}")
+    print(f"completed: {completed}/{len(accepted)}, critical memory: {refused[-1] if critical is None else 'accepted'}")
+
+    ok = cgroup.peak < cgroup.memory_limit < unbounded
+    ok &= bool(burst_refused) and all(5 <= item[2] <= 3600 for item in burst_refused)
+    ok &= waiting >= 4 and late is not None and all(late_index < index for index in calendar_indexes)
+    ok &= critical is None and refused[-1][1] == 503
+    ok &= completed == len(accepted)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8, help="RECORDER_WORKERS of the node")
+    parser.add_argument("--burst", type=int, default=12, help="requests sent at once")
+    parser.add_argument("--seconds", type=float, default=2.0, help="how long each fake recording takes")
+    parser.add_argument("--job-mb", type=int, default=700, help="memory of one recording")
+    parser.add_argument("--job-cpu", type=float, default=0.4, help="CPU cores of one recording")
+    args = parser.parse_args()
+
+    ok = asyncio.run(main(args.workers, args.burst, args.seconds, args.job_mb, args.job_cpu))
+    executors.shutdown()
+    if not ok:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
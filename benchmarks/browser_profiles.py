@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Compare Chromium CPU and memory per session for each browser profile
+
+Serves a local page that stands in for a Meet call: it connects several
+RTCPeerConnection pairs in the page, each sending an animated 720p canvas
+and a tone, and shows every received stream in a <video> element next to
+images and CSS animations. Each profile in config.BROWSER_PROFILES opens
+the page in a fresh browser. After a warm-up the benchmark reports the CPU
+used by the browser's processes and their resident memory. The sending side
+costs the same in every profile, so the difference between rows is what
+the profile saves on receiving.
+
+    python benchmarks/browser_profiles.py --participants 4 --seconds 20
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from audio_sink import is_descendant  # noqa: E402
+from browser_pool import create_driver  # noqa: E402
+
+PAGE = """<!doctype html>
+<html>
+<head>
+<style>
+  .spinner { width: 64px; height: 64px; border-radius: 50%; background: conic-gradient(red, blue, red);
+             animation: spin 1s linear infinite; display: inline-block; }
+  @keyframes spin { to { transform: rotate(360deg); } }
+  video { width: 320px; height: 180px; }
+</style>
+</head>
+<body>
+<div id="spinners"></div>
+<div id="grid"></div>
+<script>
+for (let i = 0; i < 12; i++) {
+  const spinner = document.createElement('div');
+  spinner.className = 'spinner';
+  document.getElementById('spinners').appendChild(spinner);
+  const img = document.createElement('img');
+  img.src = '/avatar.svg?' + i;
+  document.getElementById('spinners').appendChild(img);
+}
+
+async function start(participants) {
+  const canvas = document.createElement('canvas');
+  canvas.width = 1280;
+  canvas.height = 720;
+  const ctx = canvas.getContext('2d');
+  let frame = 0;
+  (function draw() {
+    frame++;
+    for (let i = 0; i < 16; i++) {
+      ctx.fillStyle = `hsl(${(frame * 3 + i * 23) % 360}, 80%, 50%)`;
+      ctx.fillRect((i % 4) * 320 + (frame % 40), Math.floor(i / 4) * 180, 300, 160);
+    }
+    requestAnimationFrame(draw);
+  })();
+
+  const audio = new AudioContext();
+  const tone = audio.createOscillator();
+  const output = audio.createMediaStreamDestination();
+  tone.connect(output);
+  tone.start();
+  audio.resume();
+  const source = new MediaStream([...canvas.captureStream(30).getVideoTracks(), ...output.stream.getAudioTracks()]);
+
+  for (let n = 0; n < participants; n++) {
+    const sender = new RTCPeerConnection();
+    const receiver = new RTCPeerConnection();
+    sender.onicecandidate = (e) => e.candidate && receiver.addIceCandidate(e.candidate);
+    receiver.onicecandidate = (e) => e.candidate && sender.addIceCandidate(e.candidate);
+    source.getTracks().forEach((track) => sender.addTrack(track, source));
+    receiver.ontrack = (e) => {
+      let video = document.getElementById('remote' + n);
+      if (!video) {
+        video = document.createElement('video');
+        video.id = 'remote' + n;
+        video.autoplay = true;
+        video.muted = true;
+        document.getElementById('grid').appendChild(video);
+      }
+      video.srcObject = e.streams[0];
+    };
+    const offer = await sender.createOffer();
+    await sender.setLocalDescription(offer);
+    await receiver.setRemoteDescription(offer);
+    const answer = await receiver.createAnswer();
+    await receiver.setLocalDescription(answer);
+    await sender.setRemoteDescription(answer);
+  }
+  window.connectedParticipants = participants;
+}
+start(PARTICIPANTS);
+</script>
+</body>
+</html>
+"""
+
+AVATAR = (b'<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64">'
+          b'<circle cx="32" cy="32" r="30" fill="teal"/></svg>')
+
+
+def serve_page(participants):
+    page = PAGE.replace("PARTICIPANTS", str(participants)).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            body, content_type = (AVATAR, "image/svg+xml") if self.path.startswith("/avatar") else (page, "text/html")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def browser_pids(driver):
+    """Chromium processes started by this driver's chromedriver"""
+    root = driver.service.process.pid
+    return [int(p) for p in os.listdir("/proc") if p.isdigit() and int(p) != root and is_descendant(int(p), root)]
+
+
+def cpu_seconds(pids):
+    ticks = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime and stime, fields 14 and 15 of stat
+            ticks += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+
+def measure(profile, url, warmup, seconds):
+    driver = create_driver(profile)
+    try:
+        driver.get(url)
+        time.sleep(warmup)
+        connected = driver.execute_script("return window.connectedParticipants || 0")
+        pids = browser_pids(driver)
+        cpu_before = cpu_seconds(pids)
+        time.sleep(seconds)
+        pids = browser_pids(driver)
+        cpu = cpu_seconds(pids) - cpu_before
+        return connected, len(pids), cpu / seconds, rss_bytes(pids)
+    finally:
+        driver.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=4, help="received video streams")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--profiles", nargs="*", default=list(config.BROWSER_PROFILES))
+    args = parser.parse_args()
+
+    server, url = serve_page(args.participants)
+    print(f"{'profile':<8} {'streams':>8} {'procs':>6} {'cpu cores':>10} {'rss MiB':>9}")
+    for profile in args.profiles:
+        connected, procs, cores, rss = measure(profile, url, args.warmup, args.seconds)
+        print(f"{profile:<8} {connected:>8} {procs:>6} {cores:>10.2f} {rss / 1024 ** 2:>9.0f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
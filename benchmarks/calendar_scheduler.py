@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Check the calendar scheduler against the fake Calendar server
+
+Creates a few events a handful of seconds ahead, then duplicates one on a
+second calendar, moves one before and one after its job was submitted,
+and cancels another. The job queue is replaced by a stub that records when
+each job is submitted, and that fails its first submit and its first cancel
+with a locked database as another node's job store might. The check fails
+unless every meeting is submitted exactly once, the pre-warm lead before its
+current start time, with both failures retried.
+
+    python benchmarks/calendar_scheduler.py --lead 2 --poll 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_calendar import start_fake_calendar  # noqa: E402
+
+
+class RecordingQueue:
+    """Stands in for JobQueue and remembers submissions and cancellations"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.cancelled = []
+        self.failing = {"submit", "cancel"}
+
+    def _fail_once(self, call):
+        if call in self.failing:
+            self.failing.discard(call)
+            raise sqlite3.OperationalError("database is locked")
+
+    async def submit(self, meeting_url, duration_minutes, folder_name, upload_mode=None, encoding_profile=None,
+               start_at=None, admit=True):
+        self._fail_once("submit")
+        job = type("Job", (), {"job_id": uuid.uuid4().hex})()
+        self.jobs[job.job_id] = {"url": meeting_url, "start_at": start_at, "submitted_at": time.time(),
+                                 "duration_minutes": duration_minutes}
+        return job
+
+    async def cancel(self, job_id):
+        self._fail_once("cancel")
+        job = self.jobs.get(job_id)
+        if job is None or job["start_at"].timestamp() <= time.time():
+            return False
+        self.cancelled.append(self.jobs.pop(job_id))
+        return True
+
+
+async def main(lead, poll):
+    server, state, url = start_fake_calendar()
+    os.environ.update(CALENDAR_API_ROOT=url, DRIVE_ANONYMOUS="true", CALENDAR_SCHEDULER="true")
+    from scheduler import CalendarScheduler
+    import executors
+
+    # Calendar times have whole seconds
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    at = lambda seconds: now + timedelta(seconds=seconds)  # noqa: E731
+    shared = state.add_event("primary", "Shared", at(lead + 2), minutes=1)
+    state.add_event("team", "Shared copy", at(lead + 2), minutes=1,
+                    meeting_url=state.events["primary"][shared]["hangoutLink"])
+    moved_early = state.add_event("primary", "Moved before submit", at(lead + 4))
+    moved_late = state.add_event("primary", "Moved after submit", at(lead + 3))
+    cancelled = state.add_event("primary", "Cancelled", at(lead + 5))
+
+    queue = RecordingQueue()
+    scheduler = CalendarScheduler(queue, calendar_ids=["primary", "team"], poll_interval=poll, lead_seconds=lead)
+    scheduler.start()
+
+    await asyncio.sleep(1)
+    state.move_event("primary", moved_early, at(lead + 7))
+    state.cancel_event("primary", cancelled)
+    await asyncio.sleep(3.5 - 1)
+    state.move_event("primary", moved_late, at(lead + 8))
+    await asyncio.sleep(lead + 8 - 3.5 + poll + 0.5)
+    await scheduler.stop()
+    server.shutdown()
+    executors.shutdown()
+
+    expected = {"Shared": at(lead + 2), "Moved before submit": at(lead + 7), "Moved after submit": at(lead + 8)}
+    urls = {e["hangoutLink"]: e["summary"] for e in state.events["primary"].values()}
+    ok = True
+    print(f"{'meeting':<22} {'start in':>9} {'lead':>7}")
+    for job in queue.jobs.values():
+        summary = urls[job["url"]]
+        actual_lead = job["start_at"].timestamp() - job["submitted_at"]
+        print(f"{summary:<22} {job['start_at'].timestamp() - now.timestamp():>8.1f}s {actual_lead:>6.2f}s")
+        ok &= expected.pop(summary, None) == job["start_at"] and lead - poll - 0.3 <= actual_lead <= lead + 0.3
+    print(f"cancelled before start: {len(queue.cancelled)}, stats: {scheduler.stats()}")
+    ok &= not expected and len(queue.cancelled) == 1 and scheduler.stats()["polls"] > 1
+    ok &= not queue.failing and scheduler.stats()["errors"] == 2
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lead", type=float, default=2.0, help="pre-warm lead in seconds")
+    parser.add_argument("--poll", type=float, default=0.5, help="calendar poll interval in seconds")
+    args = parser.parse_args()
+
+    if not asyncio.run(main(args.lead, args.poll)):
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
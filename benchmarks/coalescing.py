@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Check that duplicate recording requests share one job
+
+Starts two JobQueue nodes in this process on a scratch SQLite job store, or
+a scratch schema of the Postgres database at --store-url, with record_meeting replaced by a fake recording that runs until its
+monitor says stop, one minute of meeting lasting --minute seconds, then
+spends UPLOAD_SECONDS post-processing and uploading. The check fails
+unless:
+
+- a second request for a running meeting, through the other node and with
+  a differently written URL, gets the same job and extends the recording,
+- the meeting is recorded once and both requests see the same file,
+- a different meeting still gets a job of its own,
+- a request for a meeting whose recording already stopped early, while its
+  job is still uploading, gets a job of its own,
+- withdrawing one of two requests for a scheduled job keeps it queued, and
+  withdrawing the last one cancels it,
+- simultaneous first requests for a meeting through both nodes get one job.
+
+    python benchmarks/coalescing.py
+    python benchmarks/coalescing.py --store-url postgresql://recorder@localhost/recorder
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["JOB_LEASE_SECONDS"] = "2"
+os.environ["JOB_HEARTBEAT_INTERVAL"] = "0.3"
+os.environ["JOB_POLL_INTERVAL"] = "0.2"
+# The fake recordings use no memory or CPU, only the worker counts limit them
+os.environ["ADMISSION_CONTROL"] = "false"
+
+import executors  # noqa: E402
+import jobs  # noqa: E402
+from scratch_store import scratch_stores  # noqa: E402
+
+runs = Counter()
+recorded = {}
+monitors = {}
+# Seconds a fake recording spends after its capture, like post-processing and the upload
+UPLOAD_SECONDS = 1
+
+
+class FakeMonitor:
+    """Stands in for MeetingMonitor, stops once the extended duration has passed"""
+
+    def __init__(self, duration_minutes, minute):
+        self.minute = minute
+        self.ends_at = time.monotonic() + duration_minutes * minute
+        self.stop_event = asyncio.Event()
+
+    def extend(self, seconds):
+        # Extensions arrive in meeting seconds
+        self.ends_at += seconds / 60 * self.minute
+
+
+async def wait_for(condition, timeout=30):
+    started = time.time()
+    while time.time() - started < timeout:
+        if await condition():
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def main(minute, store_url):
+    with scratch_stores(2, store_url) as stores:
+        nodes = [jobs.JobQueue(worker_count=2, store=store, node_id=f"node-{n}") for n, store in enumerate(stores)]
+        return await run(nodes, minute)
+
+
+async def run(nodes, minute):
+    original = jobs.record_meeting
+
+    async def record(meeting_url, duration_minutes, folder_name, *args, on_monitor=None, on_captured=None,
+                     **kwargs):
+        key = jobs.meeting_id_from_url(meeting_url)
+        runs[key] += 1
+        started = time.monotonic()
+        monitor = FakeMonitor(duration_minutes, minute)
+        monitors[key] = monitor
+        on_monitor(monitor)
+        while time.monotonic() < monitor.ends_at and not monitor.stop_event.is_set():
+            await asyncio.sleep(0.05)
+        monitor.stop_event.set()
+        recorded[key] = (time.monotonic() - started) / minute
+        on_captured()
+        await asyncio.sleep(UPLOAD_SECONDS)
+        return {"success": True, "recording_file": f"{key}.ogg", "drive_link": f"https://drive.test/{key}",
+                "message": "Recording completed and uploaded to Google Drive"}
+
+    jobs.record_meeting = record
+    ok = True
+    try:
+        for node in nodes:
+            node.start()
+
+        first = await nodes[0].submit("https://meet.google.com/abc-defg-hij", 10, "Coalescing")
+        await wait_for(lambda: running(nodes, first.job_id))
+        owner = next(node for node in nodes if first.job_id in node.running)
+        other = nodes[1] if owner is nodes[0] else nodes[0]
+        second = await other.submit("https://meet.google.com/ABC-DEFG-HIJ/?authuser=1", 20, "Elsewhere")
+        separate = await other.submit("https://meet.google.com/xyz-abcd-efg", 1, "Coalescing")
+        print(f"first: {first.job_id}, second: {second.job_id} ({second.requests} requests, "
+              f"{second.duration_minutes} minutes), other meeting: {separate.job_id}")
+        ok &= second.job_id == first.job_id and second.requests == 2 and second.duration_minutes >= 20
+        ok &= separate.job_id != first.job_id
+
+        early = await nodes[0].submit("https://meet.google.com/ear-lyen-ded", 30, "Coalescing")
+        await wait_for(lambda: started_recording("ear-lyen-ded"))
+        # The meeting ends early, the job goes on uploading
+        monitors["ear-lyen-ded"].stop_event.set()
+        await asyncio.sleep(0.3)
+        late = await nodes[1].submit("https://meet.google.com/ear-lyen-ded", 30, "Coalescing")
+        uploading = await nodes[1].get(early.job_id)
+        print(f"after an early end: {early.job_id} {uploading.status}, a new request got {late.job_id}")
+        ok &= uploading.status == jobs.RUNNING and late.job_id != early.job_id
+
+        start_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        scheduled = await nodes[0].submit("https://meet.google.com/sch-edul-eds", 30, "Coalescing", start_at=start_at)
+        again = await nodes[1].submit("https://meet.google.com/sch-edul-eds", 30, "Coalescing", start_at=start_at)
+        ok &= again.job_id == scheduled.job_id
+        ok &= await nodes[1].cancel(scheduled.job_id)
+        kept = await nodes[0].get(scheduled.job_id)
+        ok &= await nodes[0].cancel(scheduled.job_id)
+        cancelled = await nodes[0].get(scheduled.job_id)
+        print(f"scheduled job after one withdrawal: {kept.status} ({kept.requests} request), "
+              f"after both: {cancelled.status}")
+        ok &= kept.status == jobs.QUEUED and kept.requests == 1 and cancelled.status == jobs.CANCELLED
+
+        together = await asyncio.gather(*[
+            nodes[n % 2].submit("https://meet.google.com/sim-ulta-neo", 30, "Coalescing", start_at=start_at)
+            for n in range(6)])
+        shared = await nodes[0].get(together[0].job_id)
+        print(f"simultaneous requests: {len({job.job_id for job in together})} job(s), "
+              f"{shared.requests} requests on it")
+        ok &= len({job.job_id for job in together}) == 1 and shared.requests == 6
+
+        await wait_for(lambda: finished(nodes[0], [first.job_id, separate.job_id, early.job_id, late.job_id]),
+                       timeout=60 * minute)
+        results = [await node.get(first.job_id) for node in nodes]
+        for node in nodes:
+            await node.stop()
+    finally:
+        jobs.record_meeting = original
+
+    print(f"recordings per meeting: {dict(runs)}")
+    print(f"recorded minutes: { {key: round(value, 1) for key, value in recorded.items()} }")
+    print(f"results seen by each node: {[(job.status, job.recording_file) for job in results]}")
+    ok &= runs["abc-defg-hij"] == 1 and runs["xyz-abcd-efg"] == 1 and "sch-edul-eds" not in runs
+    ok &= runs["ear-lyen-ded"] == 2
+    ok &= recorded.get("abc-defg-hij", 0) >= 19.5
+    ok &= all(job.status == jobs.COMPLETED and job.recording_file == "abc-defg-hij.ogg" for job in results)
+    return ok
+
+
+async def running(nodes, job_id):
+    return any(job_id in node.running for node in nodes)
+
+
+async def started_recording(key):
+    return key in monitors
+
+
+async def finished(node, job_ids):
+    states = [await node.get(job_id) for job_id in job_ids]
+    return all(job.status in jobs.FINISHED for job in states)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minute", type=float, default=0.1, help="seconds one meeting minute takes")
+    parser.add_argument("--store-url", help="postgresql:// DSN to run the nodes on Postgres instead of SQLite")
+    args = parser.parse_args()
+
+    ok = asyncio.run(main(args.minute, args.store_url))
+    executors.shutdown()
+    if not ok:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
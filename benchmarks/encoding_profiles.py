@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare the CPU and storage cost of the encoding profiles
+
+Encodes the same synthetic stereo 48 kHz source (pink noise with a moving
+tone, harder to encode than real speech) through every profile in
+encoding.PROFILES and reports ffmpeg CPU seconds and output bytes per
+recorded minute. Generating the source costs the same in every row, run
+with --profiles to compare a subset.
+
+    python benchmarks/encoding_profiles.py --seconds 120
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoding import PROFILES  # noqa: E402
+
+SOURCE = (
+    "anoisesrc=color=pink:amplitude=0.2:sample_rate=48000[noise];"
+    "sine=frequency=220:sample_rate=48000,vibrato=f=4:d=0.5[tone];"
+    "[noise][tone]amix=inputs=2,aformat=channel_layouts=stereo"
+)
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def encode(profile, seconds, output_dir):
+    output_file = os.path.join(output_dir, f"{profile.name}{profile.extension}")
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-t", str(seconds), "-i", SOURCE,
+        *profile.codec_args,
+        output_file,
+    ]
+    cpu_before = children_cpu_seconds()
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    wall = time.perf_counter() - started
+    cpu = children_cpu_seconds() - cpu_before
+    return cpu, wall, os.path.getsize(output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=120, help="length of the synthetic recording")
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES), help="profiles to compare")
+    args = parser.parse_args()
+
+    minutes = args.seconds / 60
+    print(f"{'profile':<14} {'cpu s/min':>10} {'realtime x':>11} {'KiB/min':>10} {'MiB/hour':>9}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name in args.profiles:
+            cpu, wall, size = encode(PROFILES[name], args.seconds, output_dir)
+            print(f"{name:<14} {cpu / minutes:>10.3f} {args.seconds / wall:>11.1f} "
+                  f"{size / minutes / 1024:>10.1f} {size / minutes * 60 / 1024 ** 2:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
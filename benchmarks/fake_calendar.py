@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Calendar v3 endpoints used by the scheduler
+
+Supports listing events in a time window and starting a watch channel.
+Events are added, moved and cancelled from code through FakeCalendarState.
+Point the recorder at it with:
+
+    CALENDAR_API_ROOT=http://127.0.0.1:8766/ DRIVE_ANONYMOUS=true
+"""
+
+import argparse
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+def _format(moment):
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class FakeCalendarState:
+    """Events per calendar held by the fake server"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}
+        self.channels = []
+        self.requests = 0
+
+    def add_event(self, calendar_id, summary, start, minutes=30, meeting_url=None):
+        """Add a Meet event, returns its ID"""
+        event_id = uuid.uuid4().hex[:16]
+        with self.lock:
+            self.events.setdefault(calendar_id, {})[event_id] = {
+                "id": event_id,
+                "status": "confirmed",
+                "summary": summary,
+                "start": {"dateTime": _format(start)},
+                "end": {"dateTime": _format(start + timedelta(minutes=minutes))},
+                "hangoutLink": meeting_url or f"https://meet.google.com/{event_id[:3]}-{event_id[3:7]}-{event_id[7:10]}",
+            }
+        return event_id
+
+    def move_event(self, calendar_id, event_id, start, minutes=30):
+        with self.lock:
+            event = self.events[calendar_id][event_id]
+            event["start"] = {"dateTime": _format(start)}
+            event["end"] = {"dateTime": _format(start + timedelta(minutes=minutes))}
+
+    def cancel_event(self, calendar_id, event_id):
+        with self.lock:
+            self.events[calendar_id][event_id]["status"] = "cancelled"
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _calendar_id(self, path, suffix):
+        prefix = "/calendar/v3/calendars/"
+        if not path.startswith(prefix) or not path.endswith(suffix):
+            return None
+        return unquote(path[len(prefix):-len(suffix)])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        calendar_id = self._calendar_id(url.path, "/events")
+        if calendar_id is None:
+            return self._send_json(404, {"error": "not found"})
+        params = parse_qs(url.query)
+        time_min = _parse(params["timeMin"][0]) if "timeMin" in params else None
+        time_max = _parse(params["timeMax"][0]) if "timeMax" in params else None
+        with self.state.lock:
+            self.state.requests += 1
+            items = [
+                dict(e) for e in self.state.events.get(calendar_id, {}).values()
+                # Cancelled single events are left out unless showDeleted is set
+                if e["status"] != "cancelled"
+                and (time_min is None or _parse(e["end"]["dateTime"]) > time_min)
+                and (time_max is None or _parse(e["start"]["dateTime"]) < time_max)
+            ]
+        items.sort(key=lambda e: e["start"]["dateTime"])
+        self._send_json(200, {"kind": "calendar#events", "items": items})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        calendar_id = self._calendar_id(urlparse(self.path).path, "/events/watch")
+        if calendar_id is None:
+            return self._send_json(404, {"error": "not found"})
+        with self.state.lock:
+            self.state.channels.append((calendar_id, body.get("address")))
+        self._send_json(200, {"kind": "api#channel", "id": body.get("id"), "resourceId": uuid.uuid4().hex})
+
+
+def start_fake_calendar(host="127.0.0.1", port=0):
+    """
+    Run the fake Calendar server in a background thread
+
+    Returns:
+        tuple: (server, state, root URL to use as CALENDAR_API_ROOT)
+    """
+    state = FakeCalendarState()
+    handler = type("Handler", (FakeCalendarHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_port}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google Calendar v3 server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--demo-events", type=int, default=0, help="add events starting every minute")
+    args = parser.parse_args()
+
+    server, state, url = start_fake_calendar(args.host, args.port)
+    now = datetime.now(timezone.utc)
+    for n in range(args.demo_events):
+        state.add_event("primary", f"Demo meeting {n + 1}", now + timedelta(minutes=n + 1), minutes=1)
+    print(f"Fake Calendar listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
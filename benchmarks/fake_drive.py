@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Drive v3 endpoints used by the recorder
+
+Supports folder lookup and creation, file listing and deletion, and the
+resumable upload protocol. Upload requests can be slowed to emulate a link
+with a given round trip time and bandwidth that drops now and then, failing
+the chunk being sent. Point the recorder at it with:
+
+    DRIVE_API_ROOT=http://127.0.0.1:8765/ DRIVE_ANONYMOUS=true
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeDriveState:
+    """Files and upload sessions held by the fake server"""
+
+    def __init__(self, latency: float = 0, bandwidth: float = 0, failure_rate: float = 0):
+        """
+        Args:
+            latency (float): Seconds added to every upload request, the emulated round trip
+            bandwidth (float): Bytes per second of the emulated link, 0 for no limit
+            failure_rate (float): Chance per second of sending that the link drops, failing the chunk with a 503
+        """
+        self.lock = threading.Lock()
+        self.files = {}
+        self.sessions = {}
+        self.requests = []
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.failures = 0
+        # Upload requests share the emulated link one at a time
+        self.link = threading.Lock()
+
+    def transmit(self, size: int) -> bool:
+        """Sleep for as long as sending size bytes over the emulated link takes, False if it dropped"""
+        seconds = size / self.bandwidth if self.bandwidth else 0
+        if seconds:
+            with self.link:
+                time.sleep(seconds)
+        if self.latency:
+            time.sleep(self.latency)
+        dropped = size > 0 and random.random() < 1 - (1 - self.failure_rate) ** (seconds + self.latency)
+        if dropped:
+            with self.lock:
+                self.failures += 1
+        return not dropped
+
+    def add_file(self, metadata, size=0):
+        file_id = uuid.uuid4().hex[:16]
+        record = {
+            "id": file_id,
+            "name": metadata.get("name", "untitled"),
+            "mimeType": metadata.get("mimeType", "application/octet-stream"),
+            "parents": metadata.get("parents", []),
+            "size": str(size),
+            "webViewLink": f"https://drive.example.invalid/file/d/{file_id}/view",
+        }
+        self.files[file_id] = record
+        return record
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _record(self, body=b""):
+        with self.state.lock:
+            self.state.requests.append((self.command, self.path, len(body)))
+
+    def do_GET(self):
+        self._record()
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/drive/v3/files":
+            return self._send_json(404, {"error": "not found"})
+        query = parse_qs(url.query).get("q", [""])[0]
+        name = re.search(r"name='([^']*)'", query)
+        with self.state.lock:
+            files = [
+                f for f in self.state.files.values()
+                if (not name or f["name"] == name.group(1))
+                and ("folder" not in query or f["mimeType"] == "application/vnd.google-apps.folder")
+            ]
+        self._send_json(200, {"files": files})
+
+    def do_POST(self):
+        body = self._read_body()
+        self._record(body)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        metadata = json.loads(body or b"{}")
+
+        if url.path == "/upload/drive/v3/files" and params.get("uploadType") == ["resumable"]:
+            self.state.transmit(0)
+            upload_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.sessions[upload_id] = {"metadata": metadata, "received": 0}
+            location = f"http://{self.headers['Host']}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            return self._send_json(200, {}, {"Location": location})
+
+        if url.path.rstrip("/") == "/drive/v3/files":
+            with self.state.lock:
+                record = self.state.add_file(metadata)
+            return self._send_json(200, record)
+
+        self._send_json(404, {"error": "not found"})
+
+    def do_PUT(self):
+        body = self._read_body()
+        self._record(body)
+        if not self.state.transmit(len(body)):
+            return self._send_json(503, {"error": "backend error"})
+        params = parse_qs(urlparse(self.path).query)
+        upload_id = params.get("upload_id", [None])[0]
+        with self.state.lock:
+            session = self.state.sessions.get(upload_id)
+            if session is None:
+                return self._send_json(404, {"error": "unknown upload session"})
+
+            match = re.match(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", self.headers.get("Content-Range", ""))
+            if not match:
+                return self._send_json(400, {"error": "bad Content-Range"})
+            start, end, total = match.groups()
+            if start is not None:
+                if int(start) != session["received"]:
+                    return self._send_json(400, {"error": "non-contiguous chunk"})
+                session["received"] = int(end) + 1
+
+            if total != "*" and session["received"] == int(total):
+                record = self.state.add_file(session["metadata"], session["received"])
+                del self.state.sessions[upload_id]
+                return self._send_json(200, record)
+            received = session["received"]
+
+        self.send_response(308)
+        if received:
+            self.send_header("Range", f"bytes=0-{received - 1}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_DELETE(self):
+        self._record()
+        file_id = urlparse(self.path).path.rsplit("/", 1)[-1]
+        with self.state.lock:
+            found = self.state.files.pop(file_id, None)
+        if not found:
+            return self._send_json(404, {"error": "not found"})
+        self.send_response(204)
+        self.end_headers()
+
+
+def start_fake_drive(host="127.0.0.1", port=0, latency=0, bandwidth=0, failure_rate=0):
+    """
+    Run the fake Drive server in a background thread
+
+    Returns:
+        tuple: (server, state, root URL to use as DRIVE_API_ROOT)
+    """
+    state = FakeDriveState(latency, bandwidth, failure_rate)
+    handler = type("Handler", (FakeDriveHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_port}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google Drive v3 server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every upload request")
+    parser.add_argument("--bandwidth", type=float, default=0, help="upload link speed in MiB/s, 0 for no limit")
+    parser.add_argument("--failure-rate", type=float, default=0, help="chance per second that the link drops")
+    args = parser.parse_args()
+
+    server, state, url = start_fake_drive(args.host, args.port, args.latency, args.bandwidth * 1024 ** 2,
+                                          args.failure_rate)
+    print(f"Fake Drive listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
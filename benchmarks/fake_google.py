@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Google sign-in, account and Meet pages used by the recorder
+
+The sign-in page has the same element IDs as accounts.google.com and sets
+an SID cookie. The account page redirects signed-out browsers to sign-in.
+Meet pages have a "Join now" button; after joining they show three
+participant tiles and loop a 440 Hz tone through an <audio> element.
+When meeting_seconds is set, every meeting shows "The meeting has ended"
+that many seconds after joining. Point the recorder at it with:
+
+    GOOGLE_LOGIN_URL=http://127.0.0.1:8767/signin
+    GOOGLE_ACCOUNT_URL=http://127.0.0.1:8767/myaccount/
+    meeting URLs of the form http://127.0.0.1:8767/meet/abc-defg-hij
+"""
+
+import argparse
+import io
+import json
+import math
+import struct
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+TONE_HZ = 440
+TONE_RATE = 48000
+
+SIGNIN_PAGE = """<!doctype html>
+<html><head><title>Sign in</title></head>
+<body>
+<div id="email-step">
+  <input id="identifierId" type="email">
+  <button id="identifierNext" onclick="nextStep()">Next</button>
+</div>
+<script>
+function nextStep() {
+  // Like Google, the password field only appears after the account step
+  setTimeout(() => {
+    document.body.insertAdjacentHTML('beforeend',
+      '<input name="Passwd" type="password"><button id="passwordNext" onclick="signIn()">Next</button>');
+  }, 300);
+}
+function signIn() {
+  document.cookie = 'SID=fake-session; path=/; max-age=86400';
+  setTimeout(() => { location.href = '/myaccount/'; }, 300);
+}
+</script>
+</body></html>
+"""
+
+ACCOUNT_PAGE = """<!doctype html>
+<html><head><title>Google Account</title></head><body><h1>Welcome</h1></body></html>
+"""
+
+MEET_PAGE = """<!doctype html>
+<html><head><title>Meet</title></head>
+<body>
+<button id="join"><span>Join now</span></button>
+<div id="call" style="display: none">
+  <div data-participant-id="recorder">You</div>
+  <div data-participant-id="alice">Alice</div>
+  <div data-participant-id="bob">Bob</div>
+  <audio id="remote-audio" src="/tone.wav" loop></audio>
+</div>
+<script>
+const code = location.pathname.split('/').pop();
+const endAfter = END_AFTER;
+document.getElementById('join').addEventListener('click', () => {
+  fetch('/meet/' + code + '/joined', {method: 'POST'});
+  document.getElementById('join').remove();
+  document.getElementById('call').style.display = 'block';
+  document.getElementById('remote-audio').play();
+  if (endAfter > 0) {
+    setTimeout(() => {
+      document.getElementById('remote-audio').pause();
+      document.body.insertAdjacentHTML('beforeend', '<h1>The meeting has ended</h1>');
+    }, endAfter * 1000);
+  }
+});
+</script>
+</body></html>
+"""
+
+
+def make_tone(seconds=10):
+    """A looping 16-bit mono sine wave as WAV bytes"""
+    frames = b"".join(
+        struct.pack("<h", int(12000 * math.sin(2 * math.pi * TONE_HZ * n / TONE_RATE)))
+        for n in range(TONE_RATE * seconds)
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(TONE_RATE)
+        f.writeframes(frames)
+    return buffer.getvalue()
+
+
+class FakeGoogleState:
+    """Page loads and joins seen by the fake server"""
+
+    def __init__(self, meeting_seconds: float = 0):
+        self.lock = threading.Lock()
+        self.meeting_seconds = meeting_seconds
+        self.sign_ins = 0
+        self.meet_loads = {}
+        self.joins = {}
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    state = None
+    tone = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/signin":
+            with self.state.lock:
+                self.state.sign_ins += 1
+            return self._send(200, SIGNIN_PAGE.encode())
+        if path.startswith("/myaccount"):
+            if "SID=" not in (self.headers.get("Cookie") or ""):
+                return self._send(302, b"", headers={"Location": "/signin"})
+            return self._send(200, ACCOUNT_PAGE.encode())
+        if path.startswith("/meet/"):
+            with self.state.lock:
+                self.state.meet_loads[path.rsplit("/", 1)[-1]] = time.time()
+            return self._send(200, MEET_PAGE.replace("END_AFTER", str(self.state.meeting_seconds)).encode())
+        if path == "/tone.wav":
+            return self._send(200, self.tone, "audio/wav")
+        self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "meet" and parts[2] == "joined":
+            with self.state.lock:
+                self.state.joins[parts[1]] = time.time()
+            return self._send(200, json.dumps({"ok": True}).encode(), "application/json")
+        self._send(404, b"not found", "text/plain")
+
+
+def start_fake_google(host="127.0.0.1", port=0, meeting_seconds=0):
+    """
+    Run the fake Google pages in a background thread
+
+    Args:
+        meeting_seconds (float): End every meeting this long after joining, 0 to never end
+
+    Returns:
+        tuple: (server, state, root URL)
+    """
+    state = FakeGoogleState(meeting_seconds)
+    handler = type("Handler", (FakeGoogleHandler,), {"state": state, "tone": make_tone()})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_port}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google sign-in and Meet pages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--meeting-seconds", type=float, default=0, help="end meetings after this long")
+    args = parser.parse_args()
+
+    server, state, url = start_fake_google(args.host, args.port, args.meeting_seconds)
+    print(f"Fake Google listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
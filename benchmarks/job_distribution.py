@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Check job distribution over several recorder nodes sharing one job store
+
+Starts N JobQueue nodes in this process on a scratch SQLite job store, or
+a scratch schema of the Postgres database at --store-url, with
+record_meeting replaced by a sleep, and submits jobs through different
+nodes. One node is killed partway, without handing back its leases, like a
+crashed container. The check fails unless every job completes, only the
+killed node's jobs run twice, they are claimed again by the other nodes
+once their lease runs out, and no node runs more jobs than it has workers.
+
+    python benchmarks/job_distribution.py --nodes 3 --jobs 12
+    python benchmarks/job_distribution.py --store-url postgresql://recorder@localhost/recorder
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["JOB_LEASE_SECONDS"] = "2"
+os.environ["JOB_HEARTBEAT_INTERVAL"] = "0.5"
+os.environ["JOB_POLL_INTERVAL"] = "0.3"
+# The fake recordings use no memory or CPU, only the worker counts limit them
+os.environ["ADMISSION_CONTROL"] = "false"
+
+import executors  # noqa: E402
+import jobs  # noqa: E402
+from scratch_store import scratch_stores  # noqa: E402
+
+runs = Counter()
+peak = Counter()
+active = Counter()
+
+
+def kill(node):
+    """Stop a node the way a crash would, its leases stay in the store"""
+    for task in node._tasks:
+        task.cancel()
+    for job in list(node.running.values()):
+        job.released = True
+        job.task.cancel()
+
+
+async def main(node_count, job_count, workers, seconds, store_url):
+    with scratch_stores(node_count, store_url) as stores:
+        nodes = [jobs.JobQueue(worker_count=workers, store=store, node_id=f"node-{n}")
+                 for n, store in enumerate(stores)]
+        return await run(nodes, job_count, workers, seconds)
+
+
+async def run(nodes, job_count, workers, seconds):
+    node_count = len(nodes)
+    original = jobs.record_meeting
+
+    async def record(meeting_url, duration_minutes, folder_name, *args, **kwargs):
+        # Jobs run in the task their node started for them
+        node_id = next(n.node_id for n in nodes if asyncio.current_task() in [j.task for j in n.running.values()])
+        runs[meeting_url] += 1
+        active[node_id] += 1
+        peak[node_id] = max(peak[node_id], active[node_id])
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            active[node_id] -= 1
+        return {"success": True, "recording_file": f"{meeting_url.rsplit('/', 1)[-1]}.ogg",
+                "drive_link": None, "message": "Recording completed and uploaded to Google Drive"}
+
+    jobs.record_meeting = record
+    try:
+        for node in nodes:
+            node.start()
+        submitted = []
+        for n in range(job_count):
+            job = await nodes[n % node_count].submit(f"https://meet.google.com/job-{n:03d}", 1, "Distribution")
+            submitted.append(job.job_id)
+
+        await asyncio.sleep(seconds / 2)
+        victim = nodes[0]
+        lost = {job.meeting_url for job in victim.running.values()}
+        kill(victim)
+        print(f"killed {victim.node_id} while it ran {len(lost)} job(s)")
+
+        started = time.time()
+        while time.time() - started < 60:
+            states = [await nodes[1].get(job_id) for job_id in submitted]
+            if all(job.status in jobs.FINISHED for job in states):
+                break
+            await asyncio.sleep(0.2)
+        listed = await nodes[1].nodes()
+        for node in nodes[1:]:
+            await node.stop()
+    finally:
+        jobs.record_meeting = original
+
+    by_node = Counter(job.node_id for job in states)
+    completed = sum(1 for job in states if job.status == jobs.COMPLETED)
+    print(f"completed: {completed}/{job_count}, finished on: {dict(sorted(by_node.items()))}")
+    print(f"peak running per node: {dict(sorted(peak.items()))} (workers: {workers})")
+    print(f"nodes seen: {[(n['node_id'], n['free'], n['alive']) for n in listed]}")
+    reclaimed = [job for job in states if job.meeting_url in lost]
+    print(f"jobs of the killed node: {len(reclaimed)}, attempts: {[job.attempts for job in reclaimed]}")
+
+    ok = completed == job_count
+    ok &= all(runs[url] == (2 if url in lost else 1) for url in runs) and len(runs) == job_count
+    ok &= all(job.node_id != victim.node_id and job.attempts == 2 for job in reclaimed)
+    ok &= all(count <= workers for count in peak.values())
+    ok &= len(by_node) == node_count - 1
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2, help="workers per node")
+    parser.add_argument("--seconds", type=float, default=2.0, help="how long each fake recording takes")
+    parser.add_argument("--store-url", help="postgresql:// DSN to run the nodes on Postgres instead of SQLite")
+    args = parser.parse_args()
+
+    ok = asyncio.run(main(args.nodes, args.jobs, args.workers, args.seconds, args.store_url))
+    executors.shutdown()
+    if not ok:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
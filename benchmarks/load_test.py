@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the recorder against local fakes
+
+Starts the fake Google pages (benchmarks/fake_google.py) and the fake
+Drive (benchmarks/fake_drive.py), then runs the API with uvicorn in a
+scratch directory, pointed at both through configuration. Submits N
+concurrent /record-meeting jobs and reports:
+
+- join latency, from submitting the job to clicking "Join now"
+- the mean of each phase from /metrics
+- CPU cores and peak RSS per session for chromium, ffmpeg and the API
+- audio dropouts, gaps in the fake meeting's continuous tone
+- upload throughput
+
+Needs Chromium, chromedriver, ffmpeg and PulseAudio, as in the Docker image.
+
+    python benchmarks/load_test.py --jobs 4 --meeting-seconds 60
+"""
+
+import argparse
+import math
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from audio_sink import is_descendant  # noqa: E402
+from fake_drive import start_fake_drive  # noqa: E402
+from fake_google import start_fake_google  # noqa: E402
+
+PROCESS_GROUPS = {"chromium": ("chromium", "chrome", "chromedriver"), "ffmpeg": ("ffmpeg",)}
+
+
+def process_group(pid):
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            comm = f.read().strip()
+    except OSError:
+        return None
+    for group, names in PROCESS_GROUPS.items():
+        if comm in names:
+            return group
+    return "api"
+
+
+def process_usage(pid):
+    """(CPU seconds, RSS bytes) of one process"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0.0, 0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"), rss_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class Sampler(threading.Thread):
+    """Samples CPU and memory of the API process tree by process group"""
+
+    def __init__(self, root_pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.cpu = {}
+        self.peak_rss = {}
+        self._last = {}
+        self.started = time.time()
+        self.finished = None
+
+    def sample(self):
+        rss = {}
+        for pid in [int(p) for p in os.listdir("/proc") if p.isdigit()]:
+            if pid != self.root_pid and not is_descendant(pid, self.root_pid):
+                continue
+            group = process_group(pid)
+            if group is None:
+                continue
+            cpu, memory = process_usage(pid)
+            # Count only CPU used since the first sample of each process
+            self.cpu[group] = self.cpu.get(group, 0.0) + cpu - self._last.get(pid, cpu)
+            self._last[pid] = cpu
+            rss[group] = rss.get(group, 0) + memory
+        for group, memory in rss.items():
+            self.peak_rss[group] = max(self.peak_rss.get(group, 0), memory)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+        self.finished = time.time()
+
+
+def count_dropouts(path):
+    """Silent gaps inside a recording, leading and trailing silence excluded"""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-i", path, "-af", "silencedetect=noise=-40dB:d=0.05", "-f", "null", "-"],
+        capture_output=True, text=True)
+    duration = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr)
+    total = int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3)) if duration else 0
+    starts = [float(s) for s in re.findall(r"silence_start: ([\d.]+)", result.stderr)]
+    ends = [float(e) for e in re.findall(r"silence_end: ([\d.]+)", result.stderr)]
+    gaps = [(s, e) for s, e in zip(starts, ends) if s > 0.1 and e < total - 0.1]
+    return len(gaps), sum(e - s for s, e in gaps)
+
+
+def phase_means(metrics_text):
+    sums, counts = {}, {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "recorder_phase_seconds":
+            continue
+        for sample in family.samples:
+            phase = sample.labels.get("phase")
+            if sample.name.endswith("_sum"):
+                sums[phase] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[phase] = sample.value
+    return {phase: sums[phase] / counts[phase] for phase in sums if counts.get(phase)}
+
+
+def upload_throughput(metrics_text):
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name == "recorder_upload_throughput_bytes_per_second":
+            values = {s.name: s.value for s in family.samples}
+            count = values.get(f"{family.name}_count", 0)
+            return values.get(f"{family.name}_sum", 0) / count if count else None
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=4, help="concurrent recordings")
+    parser.add_argument("--meeting-seconds", type=float, default=60, help="how long each fake meeting lasts")
+    parser.add_argument("--upload-mode", default="file", choices=("file", "stream"))
+    parser.add_argument("--encoding-profile", default=None)
+    parser.add_argument("--port", type=int, default=8799, help="port for the API under test")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    google, google_state, google_url = start_fake_google(meeting_seconds=args.meeting_seconds)
+    drive, drive_state, drive_url = start_fake_drive()
+    workdir = tempfile.mkdtemp(prefix="recorder-load-")
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        GOOGLE_LOGIN_URL=f"{google_url}signin",
+        GOOGLE_ACCOUNT_URL=f"{google_url}myaccount/",
+        GMAIL_ADDRESS="loadtest@example.com",
+        GMAIL_PASSWORD="not-a-password",
+        DRIVE_API_ROOT=drive_url,
+        DRIVE_ANONYMOUS="true",
+        RECORDER_WORKERS=str(args.jobs),
+        BROWSER_POOL_SIZE=str(args.jobs),
+        MEETING_POLL_INTERVAL="1",
+        CALENDAR_SCHEDULER="false",
+        # Run every job at once, admission control would cap them at what fits
+        ADMISSION_CONTROL="false",
+        SESSION_DIR=os.path.join(workdir, "sessions"),
+        FOLDER_CACHE_DIR=os.path.join(workdir, "cache"),
+        UPLOAD_STATE_DIR=os.path.join(workdir, "uploads"),
+        SEGMENT_DIR=os.path.join(workdir, "segments"),
+        # Keep the uploaded recordings, their audio is checked for dropouts
+        SPOOL_DIR=os.path.join(workdir, "recordings"),
+        SPOOL_EVICTION="lru",
+        SPOOL_KEEP_MB="100000",
+    )
+    api_url = f"http://127.0.0.1:{args.port}"
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=workdir, env=env)
+    try:
+        for _ in range(120):
+            try:
+                requests.get(api_url, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.5)
+
+        sampler = Sampler(api.pid)
+        sampler.start()
+        submitted = {}
+        duration_minutes = max(1, math.ceil(args.meeting_seconds / 60) + 1)
+        for n in range(args.jobs):
+            code = f"load-{n:03d}-test"
+            response = requests.post(f"{api_url}/record-meeting", json={
+                "meeting_url": f"{google_url}meet/{code}",
+                "duration_minutes": duration_minutes,
+                "folder_name": "Load Test",
+                "upload_mode": args.upload_mode,
+                "encoding_profile": args.encoding_profile,
+            })
+            response.raise_for_status()
+            submitted[code] = (response.json()["job_id"], time.time())
+
+        results = {}
+        while len(results) < len(submitted):
+            time.sleep(1)
+            for code, (job_id, _) in submitted.items():
+                job = requests.get(f"{api_url}/jobs/{job_id}").json()
+                if job["status"] in ("completed", "failed", "cancelled"):
+                    results[code] = job
+        sampler.stop_event.set()
+        sampler.join()
+        metrics_text = requests.get(f"{api_url}/metrics").text
+    finally:
+        api.send_signal(signal.SIGINT)
+        try:
+            api.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            api.kill()
+        google.shutdown()
+        drive.shutdown()
+
+    ok = sum(1 for job in results.values() if job["status"] == "completed")
+    print(f"jobs: {args.jobs}, completed: {ok}, sign-ins: {google_state.sign_ins}")
+    for code, job in results.items():
+        if job["status"] != "completed":
+            print(f"  {code}: {job['status']}: {job['message']}")
+
+    latencies = sorted(google_state.joins[code] - submitted[code][1] for code in google_state.joins if code in submitted)
+    if latencies:
+        print(f"join latency: min {latencies[0]:.1f}s, median {latencies[len(latencies) // 2]:.1f}s, "
+              f"max {latencies[-1]:.1f}s")
+    for phase, mean in sorted(phase_means(metrics_text).items()):
+        print(f"  {phase:<15} mean {mean:.2f}s")
+
+    elapsed = (sampler.finished or time.time()) - sampler.started
+    print(f"per session over {elapsed:.0f}s:")
+    for group in sorted(sampler.cpu):
+        print(f"  {group:<9} {sampler.cpu[group] / elapsed / args.jobs:.2f} cores, "
+              f"peak {sampler.peak_rss.get(group, 0) / args.jobs / 1024 ** 2:.0f} MiB")
+
+    dropouts, dropout_seconds = 0, 0.0
+    for job in results.values():
+        path = job.get("recording_file") and os.path.join(workdir, "recordings", job["recording_file"])
+        if path and os.path.exists(path):
+            gaps, seconds = count_dropouts(path)
+            dropouts += gaps
+            dropout_seconds += seconds
+    print(f"audio dropouts: {dropouts} ({dropout_seconds:.2f}s)")
+
+    throughput = upload_throughput(metrics_text)
+    uploaded = sum(int(f["size"]) for f in drive_state.files.values()
+                   if f["mimeType"] != "application/vnd.google-apps.folder")
+    print(f"uploaded: {uploaded / 1024 ** 2:.1f} MiB"
+          + (f", mean throughput {throughput / 1024 ** 2:.1f} MiB/s" if throughput else ""))
+
+    if args.keep:
+        print(f"scratch directory: {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok == args.jobs else 1)
+
+
+if __name__ == "__main__":
+    main()
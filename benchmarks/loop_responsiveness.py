@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Check that the event loop stays responsive while recordings run
+
+Runs several record_meeting jobs at once with the browser, login, join and
+upload steps replaced by blocking sleeps and ffmpeg writing a tone for the
+post-processing, and samples how late a 10 ms timer fires on the loop
+meanwhile. Exits non-zero when the worst lag goes
+over the budget, which happens as soon as a blocking call runs on the loop.
+
+    python benchmarks/loop_responsiveness.py --jobs 6 --budget-ms 100
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GMAIL_ADDRESS", "loadtest@example.com")
+os.environ.setdefault("GMAIL_PASSWORD", "not-a-password")
+os.environ["AUDIO_ISOLATION"] = "false"
+# fake_recording writes nothing, there are no segments to join
+os.environ["SEGMENT_SECONDS"] = "0"
+os.environ["SPOOL_DIR"] = tempfile.mkdtemp(prefix="loop-")
+
+import google_meet  # noqa: E402
+import executors  # noqa: E402
+
+
+class BlockingDriver:
+    """Answers the meeting monitor's page checks after a blocking delay"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def execute_script(self, script, *args):
+        time.sleep(self.delay)
+        return {"ended": False, "participants": 2}
+
+
+class BlockingPool:
+    """Stands in for BrowserPool, every call blocks like Selenium does"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def lease(self):
+        time.sleep(self.delay)
+        return type("Pooled", (), {"driver": BlockingDriver(self.delay)})()
+
+    def release(self, pooled, healthy=True):
+        time.sleep(self.delay)
+
+    def is_healthy(self, pooled):
+        return True
+
+
+class BlockingUploads:
+    """Stands in for UploadManager with a blocking upload on the I/O executor"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def upload(self, file_path, folder_name=None, file_name=None, mime_type=None, on_progress=None):
+        await executors.run_io(time.sleep, self.delay)
+        return {"webViewLink": f"https://drive.example.invalid/{file_name}"}
+
+
+async def fake_recording(output_file, duration_seconds, pulse_source="default", stop_event=None, profile=None,
+                         **kwargs):
+    # Like ffmpeg, record until the meeting monitor says stop
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(stop_event.wait(), duration_seconds)
+    except asyncio.TimeoutError:
+        pass
+    # A tone as long as the recording, for the post-processing that follows
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+        "-i", f"sine=frequency=440:duration={time.monotonic() - started:.2f}", *profile.codec_args, output_file)
+    return await process.wait() == 0
+
+
+async def measure_lag(stop, interval=0.01):
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def main(jobs, delay, recording_seconds):
+    google_meet.browser_pool = BlockingPool(delay)
+    google_meet.upload_manager = BlockingUploads(delay)
+    google_meet.ensure_logged_in = lambda driver, mail, password: time.sleep(delay) or True
+    google_meet.join_meeting = lambda driver, url: time.sleep(delay)
+    google_meet.start_recording_async = fake_recording
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(measure_lag(stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        google_meet.record_meeting(f"https://meet.google.com/load-{n}", recording_seconds / 60, "Load Test")
+        for n in range(jobs)
+    ])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst = await sampler
+
+    ok = sum(1 for r in results if r["success"])
+    print(f"jobs: {jobs}, succeeded: {ok}, wall time: {elapsed:.2f}s")
+    print(f"worst event loop lag: {worst * 1000:.1f} ms")
+    print(f"executors: {executors.get_stats()}")
+    return worst, ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=6)
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds each blocking step takes")
+    parser.add_argument("--recording-seconds", type=float, default=1.0)
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    worst, ok = asyncio.run(main(args.jobs, args.delay, args.recording_seconds))
+    executors.shutdown()
+    shutil.rmtree(os.environ["SPOOL_DIR"], ignore_errors=True)
+    if ok != args.jobs or worst * 1000 > args.budget_ms:
+        print("FAIL: event loop was blocked")
+        sys.exit(1)
+    print("OK")
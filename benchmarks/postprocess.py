@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Measure post-processing of a finished recording and its effect on capture
+
+Writes a --minutes long test recording with ffmpeg, a tone whose level
+rises and falls like speech, well below the loudness target. It then runs
+loudness normalization, the waveform peaks and the --formats transcodes on
+the post-processing pool. Meanwhile a real-time ffmpeg stands in for a
+capture. The peak decimation is also timed against a plain Python loop on
+the same samples. The check fails unless:
+
+- the normalized recording measures within 1 LU of LOUDNORM_TARGET_LUFS,
+- the peaks have one min/max pair per pixel, and the NumPy decimation
+  matches the Python loop,
+- the capture kept up with real time while post-processing ran.
+
+    python benchmarks/postprocess.py --minutes 10 --formats opus-speech
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import config  # noqa: E402
+import executors  # noqa: E402
+import postprocess  # noqa: E402
+from encoding import get_profile  # noqa: E402
+
+PROFILE = get_profile("mp3-192")
+
+
+def write_recording(path, seconds):
+    """A quiet tone with a level that rises and falls every few seconds"""
+    subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"sine=frequency=220:duration={seconds}:sample_rate=48000",
+         "-af", "volume='0.02+0.015*sin(2*PI*t/7)':eval=frame", "-ac", "2", *PROFILE.codec_args, path],
+        check=True)
+
+
+def python_peaks(samples, samples_per_pixel):
+    """The decimation as a plain loop, for comparison"""
+    peaks = []
+    for start in range(0, len(samples), samples_per_pixel):
+        pixel = samples[start:start + samples_per_pixel]
+        peaks += [min(pixel) >> 8, max(pixel) >> 8]
+    return peaks
+
+
+async def capture(seconds):
+    """Encode a tone in real time like a capturing ffmpeg, return how far behind it finished"""
+    started = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-re", "-f", "lavfi",
+        "-i", f"sine=frequency=440:duration={seconds}", *PROFILE.codec_args, "-f", "null", "-")
+    await process.wait()
+    return time.monotonic() - started - seconds
+
+
+async def main(minutes, formats):
+    workdir = tempfile.mkdtemp(prefix="postprocess-")
+    path = os.path.join(workdir, f"recording{PROFILE.extension}")
+    seconds = minutes * 60
+    ok = True
+    try:
+        write_recording(path, seconds)
+        print(f"recording: {minutes} minutes, {os.path.getsize(path) / 1024 ** 2:.1f} MiB, "
+              f"{executors.postprocess_executor.workers} post-processing worker(s)")
+        # Start the pool before timing
+        await executors.run_cpu(os.getpid)
+
+        capturing = asyncio.create_task(capture(20))
+        timings = {}
+        started = time.perf_counter()
+        before = await executors.run_cpu(postprocess.normalize_loudness, path, PROFILE.name,
+                                         config.get_loudnorm_target(), config.get_loudnorm_true_peak())
+        timings["normalize"] = time.perf_counter() - started
+
+        async def timed(name, fn, *args):
+            step_started = time.perf_counter()
+            result = await executors.run_cpu(fn, *args)
+            timings[name] = time.perf_counter() - step_started
+            return result
+
+        outputs = await asyncio.gather(
+            timed("peaks", postprocess.write_peaks, path, config.get_peaks_per_second()),
+            *[timed(name, postprocess.transcode, path, name) for name in formats])
+        total = time.perf_counter() - started
+        behind = await capturing
+
+        for name, elapsed in timings.items():
+            print(f"  {name:<16} {elapsed:>7.2f}s  {seconds / elapsed:>6.0f}x real time")
+        print(f"total {total:.2f}s for {minutes} minutes of audio, capture finished {behind:.2f}s behind real time")
+
+        after = await executors.run_cpu(postprocess.normalize_loudness, path, PROFILE.name,
+                                        config.get_loudnorm_target(), config.get_loudnorm_true_peak())
+        print(f"loudness: {before['input_i']} LUFS before, {after['input_i']} LUFS after, "
+              f"target {config.get_loudnorm_target()}")
+        ok &= abs(float(after["input_i"]) - config.get_loudnorm_target()) <= 1
+
+        with open(outputs[0]) as f:
+            peaks = json.load(f)
+        expected = seconds * config.get_peaks_per_second()
+        print(f"peaks: {peaks['length']} pixels of {peaks['samples_per_pixel']} samples, "
+              f"{os.path.getsize(outputs[0]) / 1024:.0f} KiB")
+        ok &= abs(peaks["length"] - expected) <= 1 and len(peaks["data"]) == 2 * peaks["length"]
+        for output in outputs[1:]:
+            print(f"  {os.path.basename(output)}: {os.path.getsize(output) / 1024 ** 2:.1f} MiB")
+
+        # Decimation alone on the first minute of decoded samples
+        pcm = subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path, "-t", "60", "-ac", "1",
+                              "-ar", str(postprocess.PEAKS_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+                             capture_output=True, check=True).stdout
+        samples = np.frombuffer(pcm, dtype="<i2")
+        spp = peaks["samples_per_pixel"]
+        whole = samples.size - samples.size % spp
+        started = time.perf_counter()
+        pixels = samples[:whole].reshape(-1, spp)
+        vectorized = np.empty(2 * pixels.shape[0], dtype=np.int8)
+        vectorized[0::2] = pixels.min(axis=1) >> 8
+        vectorized[1::2] = pixels.max(axis=1) >> 8
+        numpy_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        looped = python_peaks(samples[:whole].tolist(), spp)
+        loop_seconds = time.perf_counter() - started
+        print(f"decimating one minute: NumPy {numpy_seconds * 1000:.1f} ms, Python loop {loop_seconds * 1000:.1f} ms")
+        ok &= vectorized.tolist() == looped
+        # A separate decode may dither differently by a step
+        ok &= bool(np.all(np.abs(vectorized - np.array(peaks["data"][:vectorized.size])) <= 1))
+
+        ok &= behind < 1.0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=3, help="length of the test recording")
+    parser.add_argument("--formats", nargs="*", default=["opus-speech"], help="encoding profiles to transcode to")
+    args = parser.parse_args()
+
+    ok = asyncio.run(main(args.minutes, args.formats))
+    executors.shutdown()
+    if not ok:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
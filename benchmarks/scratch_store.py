@@ -0,0 +1,43 @@
+"""
+Scratch job stores for the benchmarks that run several nodes
+
+Without a URL the nodes share a SQLite file in a temporary directory. With
+a postgresql:// URL each run gets a schema of its own in that database,
+dropped afterwards, so the benchmarks leave an existing store alone.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_store import SQLiteJobStore  # noqa: E402
+
+
+@contextmanager
+def scratch_stores(count, url=None):
+    """Yield count job stores on one scratch database, one per node"""
+    if not url:
+        directory = tempfile.mkdtemp(prefix="job-store-")
+        try:
+            yield [SQLiteJobStore(os.path.join(directory, "jobs.db")) for _ in range(count)]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return
+
+    import psycopg
+    from job_store_postgres import PostgresJobStore
+
+    schema = f"scratch_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+        try:
+            conninfo = psycopg.conninfo.make_conninfo(url, options=f"-c search_path={schema}")
+            stores = [PostgresJobStore(conninfo) for _ in range(count)]
+            yield stores
+        finally:
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Measure the speech index's analysis cost and check silence trimming
+
+Feeds --hours of synthetic 8 kHz PCM, bursts of noise at speech level with
+pauses of random length over a quiet background, to a SpeechDetector in the
+chunk size the PCM tap is read in, and reports the CPU time per recorded
+hour. The same frames are also measured with a plain Python loop.
+
+Then ffmpeg encodes a two minute test signal with each --profiles encoding
+profile while writing the PCM tap, read by recording.read_pcm_tap as
+during a recording. Each recording is trimmed with the index built from its
+tap and its speech index measured again. The check fails unless:
+
+- the detected segments match the synthetic bursts within two frames, and
+  the NumPy detector finds the same segments as a plain Python loop,
+- the MP3 and FLAC recordings were trimmed with a stream copy and the Ogg
+  ones re-encoded,
+- each trimmed recording lasts as long as its kept ranges, and its speech
+  sits where the cuts moved it, within a tenth of a second per cut,
+- the kept ranges never overlap, even with a padding over half the
+  shortest silence cut.
+
+    python benchmarks/speech_index.py --hours 2 --profiles mp3-192 opus-speech flac-archive
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import postprocess  # noqa: E402
+import speech  # noqa: E402
+from encoding import get_profile  # noqa: E402
+from recording import PCM_TAP_RATE, READ_SIZE, pcm_tap_args, read_pcm_tap  # noqa: E402
+
+# Speech in the test signal, [start, end] seconds of a 120 second recording
+TONES = [[20, 23], [25, 28], [30, 33], [60, 70], [100, 104]]
+SIGNAL_SECONDS = 120
+MIN_SILENCE = 5
+PADDING = 1
+
+
+def synthetic_pcm(seconds, seed=1):
+    """
+    Noise bursts of 0.3 to 8 seconds at about -20 dBFS, apart by 0.6 to 20 seconds, over -65 dBFS noise
+
+    Returns:
+        tuple: (PCM bytes, [start, end] seconds of every burst)
+    """
+    rng = np.random.default_rng(seed)
+    randoms = random.Random(seed)
+    samples = rng.normal(0, 32768 * 10 ** (-65 / 20), int(seconds * PCM_TAP_RATE))
+    bursts = []
+    position = randoms.uniform(0.6, 20)
+    while True:
+        length = randoms.uniform(0.3, 8)
+        if position + length > seconds:
+            break
+        start, end = int(position * PCM_TAP_RATE), int((position + length) * PCM_TAP_RATE)
+        samples[start:end] += rng.normal(0, 32768 * 10 ** (-20 / 20), end - start)
+        bursts.append([start / PCM_TAP_RATE, end / PCM_TAP_RATE])
+        position += length + randoms.uniform(0.6, 20)
+    return np.clip(samples, -32768, 32767).astype("<i2").tobytes(), bursts
+
+
+def python_segments(pcm, detector):
+    """The detector's segments, measured and merged with a plain loop, for comparison"""
+    samples = np.frombuffer(pcm, dtype="<i2").tolist()
+    size = detector.frame_samples
+    threshold = (speech.FULL_SCALE * 10 ** (detector.threshold_db / 20)) ** 2
+    gap = round(speech.MERGE_GAP_SECONDS * 1000 / detector.frame_ms)
+    segments = []
+    for frame, i in enumerate(range(0, len(samples) - len(samples) % size, size)):
+        if sum(s * s for s in samples[i:i + size]) / size <= threshold:
+            continue
+        if segments and frame - segments[-1][1] <= gap:
+            segments[-1][1] = frame + 1
+        else:
+            segments.append([frame, frame + 1])
+    seconds = detector.frame_ms / 1000
+    return [[round(start * seconds, 2), round(end * seconds, 2)] for start, end in segments
+            if end - start >= speech.MIN_SPEECH_SECONDS / seconds]
+
+
+def matches(found, expected, tolerance):
+    return len(found) == len(expected) and all(
+        abs(a[0] - b[0]) <= tolerance and abs(a[1] - b[1]) <= tolerance for a, b in zip(found, expected))
+
+
+def moved(segments, ranges):
+    """Where segments end up once only ranges of the recording are kept"""
+    result = []
+    offset = 0
+    for range_start, range_end in ranges:
+        result += [[start - range_start + offset, end - range_start + offset]
+                   for start, end in segments if range_start <= start < range_end]
+        offset += range_end - range_start
+    return result
+
+
+def tone_expression():
+    gate = "+".join(f"between(t,{start},{end})" for start, end in TONES)
+    return f"aevalsrc='0.3*sin(2*PI*220*t)*({gate})':s=48000:d={SIGNAL_SECONDS}"
+
+
+async def record_with_tap(path, profile):
+    """Encode the test signal like a recording, analysing its PCM tap, and return the speech index"""
+    detector = speech.SpeechDetector()
+    tap_read, tap_write = os.pipe()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi", "-i", tone_expression(),
+            *profile.codec_args, path, *pcm_tap_args(tap_write), pass_fds=(tap_write,))
+    finally:
+        os.close(tap_write)
+    await asyncio.gather(process.wait(), read_pcm_tap(tap_read, detector.feed))
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed writing {path}")
+    return detector.index()
+
+
+def decode(path):
+    """The recording as tap-format PCM"""
+    return subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path, "-ac", "1",
+                           "-ar", str(PCM_TAP_RATE), "-f", "s16le", "pipe:1"],
+                          capture_output=True, check=True).stdout
+
+
+async def check_trimming(profiles):
+    workdir = tempfile.mkdtemp(prefix="speech-")
+    ok = True
+    try:
+        for profile in profiles:
+            path = os.path.join(workdir, f"recording{profile.extension}")
+            index = await record_with_tap(path, profile)
+            ok &= matches(index["segments"], TONES, 0.1)
+            ranges = speech.keep_ranges(index, MIN_SILENCE, PADDING)
+            kept = sum(end - start for start, end in ranges)
+
+            started = time.perf_counter()
+            copied = postprocess.trim(path, profile.name, ranges)
+            elapsed = time.perf_counter() - started
+            trimmed = postprocess.speech_index(path, index["threshold_db"])
+            print(f"  {profile.name:<14} {index['duration_seconds']:.0f}s to {trimmed['duration_seconds']:.1f}s "
+                  f"(kept {kept:.1f}s) in {elapsed * 1000:.0f} ms, {'stream copy' if copied else 're-encoded'}, "
+                  f"speech at {trimmed['segments']}")
+            slack = 0.1 * len(ranges)
+            ok &= copied == (profile.container in postprocess.STREAM_COPY_CUTS)
+            ok &= abs(trimmed["duration_seconds"] - kept) <= slack
+            ok &= matches(trimmed["segments"], moved(TONES, ranges), slack)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return ok
+
+
+def main(hours, profiles):
+    ok = True
+    seconds = hours * 3600
+    pcm, bursts = synthetic_pcm(seconds)
+    detector = speech.SpeechDetector()
+    # Warm up NumPy before timing
+    speech.SpeechDetector().feed(pcm[:READ_SIZE])
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for offset in range(0, len(pcm), READ_SIZE):
+        detector.feed(pcm[offset:offset + READ_SIZE])
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    print(f"synthetic audio: {hours:g} hours, {len(bursts)} bursts, {len(pcm) / 1024 ** 2:.0f} MiB of tap PCM "
+          f"in {math.ceil(len(pcm) / READ_SIZE)} chunks")
+    print(f"analysis: {cpu / hours * 1000:.0f} ms CPU per recorded hour ({elapsed:.2f}s wall), "
+          f"{seconds / elapsed:.0f}x real time")
+
+    frame = detector.frame_ms / 1000
+    print(f"index: {len(detector.segments())} segments, {detector.index()['speech_seconds']:.0f}s of speech, "
+          f"expected {len(bursts)} and {sum(end - start for start, end in bursts):.0f}s")
+    ok &= matches(detector.segments(), bursts, 2 * frame)
+
+    minute = pcm[:60 * PCM_TAP_RATE * 2]
+    started = time.perf_counter()
+    looped = python_segments(minute, detector)
+    loop_seconds = time.perf_counter() - started
+    one = speech.SpeechDetector()
+    started = time.perf_counter()
+    one.feed(minute)
+    numpy_seconds = time.perf_counter() - started
+    print(f"one minute: NumPy {numpy_seconds * 1000:.1f} ms, Python loop {loop_seconds * 1000:.0f} ms "
+          f"({loop_seconds * 60:.1f}s CPU per recorded hour)")
+    ok &= one.segments() == looped
+
+    # Padding around the 2 s pauses overlaps, they must still come out as one range
+    overlapping = speech.keep_ranges({"duration_seconds": SIGNAL_SECONDS, "segments": TONES}, 1, 1.5)
+    print(f"ranges kept with 1.5s of padding and 1s silences cut: {overlapping}")
+    ok &= overlapping == [[18.5, 34.5], [58.5, 71.5], [98.5, 105.5]]
+
+    print(f"trimming the {SIGNAL_SECONDS}s test signal, speech at {TONES}:")
+    ok &= asyncio.run(check_trimming(profiles))
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=1, help="length of the synthetic audio")
+    parser.add_argument("--profiles", nargs="*", default=["mp3-192", "opus-speech", "flac-archive"],
+                        help="encoding profiles to trim")
+    args = parser.parse_args()
+
+    if not main(args.hours, [get_profile(name) for name in args.profiles]):
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
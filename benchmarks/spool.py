@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Check the recording spool's quota and eviction policies
+
+Runs one JobQueue node on a scratch job store and spool, with a capture
+directory of its own like a tmpfs mount. record_meeting is replaced by a
+fake recording that writes as many bytes as the encoding profile's
+estimate in --seconds, moves the file to the spool and reports an upload,
+with Drive either confirming the full size or, for meetings named
+"unverified", a short one. The check fails unless:
+
+- with the "uploaded" policy every verified recording is deleted and the
+  spool never goes over its quota,
+- recordings whose upload was not verified stay, and once they fill the
+  quota new requests get 507 with a Retry-After,
+- with the "lru" policy only the most recently uploaded recordings that fit
+  in SPOOL_KEEP_MB stay, and they are evicted to make room for a new one.
+
+    python benchmarks/spool.py --quota-recordings 4
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from prometheus_client import REGISTRY
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["JOB_LEASE_SECONDS"] = "2"
+os.environ["JOB_HEARTBEAT_INTERVAL"] = "0.2"
+os.environ["JOB_POLL_INTERVAL"] = "0.1"
+# Only the spool limits the fake recordings
+os.environ["ADMISSION_CONTROL"] = "false"
+
+import executors  # noqa: E402
+import jobs  # noqa: E402
+from admission import AdmissionError  # noqa: E402
+from encoding import get_profile  # noqa: E402
+from job_store import SQLiteJobStore  # noqa: E402
+from spool import Spool  # noqa: E402
+
+MIB = 1024 ** 2
+PROFILE = get_profile("mp3-192")
+# Bytes of a one minute recording
+RECORDING = PROFILE.estimate_bytes(60)
+
+
+async def run(spool, names, seconds, store_path):
+    """
+    Submit one recording per name, one after the other as the previous one is queued
+
+    Returns:
+        tuple: (names refused with their status and Retry-After, peak bytes in the spool, jobs)
+    """
+    node = jobs.JobQueue(worker_count=2, store=SQLiteJobStore(store_path), node_id="node-0", spool=spool)
+    original = jobs.record_meeting
+
+    async def record(meeting_url, duration_minutes, folder_name, *args, **kwargs):
+        name = meeting_url.rsplit("/", 1)[-1]
+        path = spool.capture_path(f"{name}{PROFILE.extension}")
+        expected = PROFILE.estimate_bytes(duration_minutes * 60)
+        await executors.run_io(spool.reserve, path, expected)
+        try:
+            with open(path, "wb") as f:
+                for _ in range(10):
+                    f.write(b"\0" * (expected // 10))
+                    f.flush()
+                    await asyncio.sleep(seconds / 10)
+        finally:
+            spool.release(path)
+        path = await executors.run_io(spool.finish, path)
+        size = os.path.getsize(path)
+        drive_size = size // 2 if name.startswith("unverified") else size
+        await executors.run_io(spool.uploaded, path, {"id": name, "size": str(drive_size)})
+        return {"success": True, "recording_file": os.path.basename(path), "drive_link": None,
+                "message": "Recording completed and uploaded to Google Drive"}
+
+    async def usage():
+        nonlocal peak
+        while True:
+            peak = max(peak, await executors.run_io(spool.usage))
+            await asyncio.sleep(0.02)
+
+    peak = 0
+    refused = []
+    accepted = []
+    jobs.record_meeting = record
+    usage_task = asyncio.create_task(usage())
+    try:
+        node.start()
+        for name in names:
+            try:
+                accepted.append(await node.submit(f"https://meet.google.com/{name}", 1, "Spool"))
+            except AdmissionError as e:
+                refused.append((name, e.status_code, e.retry_after))
+            await asyncio.sleep(seconds / 2)
+        started = time.time()
+        while time.time() - started < 30:
+            states = [await node.get(job.job_id) for job in accepted]
+            if all(job.status in jobs.FINISHED for job in states):
+                break
+            await asyncio.sleep(0.1)
+        await node.stop()
+    finally:
+        usage_task.cancel()
+        jobs.record_meeting = original
+    return refused, peak, states
+
+
+def evicted_bytes(policy):
+    return REGISTRY.get_sample_value("recorder_spool_evicted_bytes_total", {"policy": policy}) or 0
+
+
+def files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(PROFILE.extension))
+
+
+async def main(quota_recordings, seconds):
+    workdir = tempfile.mkdtemp(prefix="spool-")
+    store_path = os.path.join(workdir, "jobs.db")
+    quota = quota_recordings * RECORDING
+    ok = True
+    try:
+        print(f"one recording: {RECORDING / MIB:.1f} MiB, quota: {quota / MIB:.1f} MiB")
+
+        # Every upload verified, nothing stays
+        uploaded = Spool(os.path.join(workdir, "uploaded"), os.path.join(workdir, "capture"), quota, "uploaded")
+        evicted = evicted_bytes("uploaded")
+        refused, peak, states = await run(uploaded, [f"verified-{n}" for n in range(6)], seconds, store_path)
+        evicted = evicted_bytes("uploaded") - evicted
+        left = files(uploaded.directory)
+        print(f"uploaded policy: {len(states)} completed, {len(refused)} refused, peak {peak / MIB:.1f} MiB, "
+              f"evicted {evicted / MIB:.1f} MiB, left in the spool: {left}")
+        ok &= not refused and all(job.status == jobs.COMPLETED for job in states)
+        ok &= not left and peak <= quota and evicted == 6 * RECORDING
+
+        # Unverified uploads stay until the quota is full
+        names = [f"unverified-{n}" for n in range(quota_recordings)] + ["verified-late"]
+        refused, peak, states = await run(uploaded, names, seconds, store_path)
+        left = files(uploaded.directory)
+        print(f"unverified uploads: kept {left}, refused {refused}")
+        ok &= len(left) == quota_recordings and all(name.startswith("unverified") for name in left)
+        ok &= [item[:2] for item in refused] == [("verified-late", 507)] and refused[0][2] > 0
+
+        # The most recent uploads stay as long as they fit in keep
+        keep = 2 * RECORDING
+        lru = Spool(os.path.join(workdir, "lru"), os.path.join(workdir, "capture-lru"), quota, "lru", keep)
+        refused, peak, states = await run(lru, [f"verified-{n}" for n in range(5)], seconds, store_path)
+        kept = files(lru.directory)
+        print(f"lru policy, keeping {keep / MIB:.1f} MiB: kept {kept}, peak {peak / MIB:.1f} MiB")
+        ok &= not refused and kept == ["verified-3.mp3", "verified-4.mp3"] and peak <= quota
+
+        # Kept recordings make room for a new one on a full quota
+        small = Spool(lru.directory, lru.capture_dir, int(2.5 * RECORDING), "lru", keep)
+        refused, peak, states = await run(small, ["verified-5"], seconds, store_path)
+        kept = files(small.directory)
+        print(f"lru policy on a quota of 2.5 recordings: kept {kept}, refused {refused}, peak {peak / MIB:.1f} MiB")
+        ok &= not refused and states[0].status == jobs.COMPLETED
+        ok &= kept == ["verified-4.mp3", "verified-5.mp3"] and peak <= small.quota
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quota-recordings", type=int, default=4, help="quota in one minute recordings")
+    parser.add_argument("--seconds", type=float, default=0.4, help="how long each fake recording takes")
+    args = parser.parse_args()
+
+    ok = asyncio.run(main(args.quota_recordings, args.seconds))
+    executors.shutdown()
+    if not ok:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Measure how fast the API process starts, against a budget kept in the repo
+
+Imports app in fresh interpreters with `python -X importtime` and reports
+the median import time and the packages that take longest. Then starts the
+API with uvicorn and times the first answer to the liveness check `GET /`
+and to the readiness check `GET /ready`, with Google and Drive left
+unconfigured. The check fails when a median is over its budget in
+benchmarks/startup_budget.json, or when importing app loads one of the
+modules the budget lists as lazy (Selenium and the Google client
+libraries, which are only needed once a browser or Drive is used).
+
+    python benchmarks/startup_time.py --runs 5
+    python benchmarks/startup_time.py --update   # write the current medians plus headroom as the budget
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(ROOT, "benchmarks", "startup_budget.json")
+# Budgets written by --update leave this much room for slower machines
+HEADROOM = 1.5
+
+
+def import_profile(env):
+    """
+    Import app once with -X importtime
+
+    Returns:
+        tuple: (milliseconds to import app, {module: cumulative milliseconds} of its direct imports,
+                every module imported)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app failed:\n{result.stderr[-2000:]}")
+    total = None
+    children = {}
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules.add(name)
+        if name == "app" and depth == 0:
+            total = int(cumulative) / 1000
+        elif depth == 0:
+            # Imported by the interpreter before app, such as site
+            children = {}
+        elif depth == 1:
+            # Direct imports of app are listed before it
+            children[name] = int(cumulative) / 1000
+    return total, children, modules
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_profile(env, timeout=60):
+    """
+    Start the API and wait for its liveness and readiness checks
+
+    Returns:
+        tuple: (milliseconds to the first GET / answer, milliseconds to the first 200 from GET /ready)
+    """
+    port = free_port()
+    started = time.perf_counter()
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+                           cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live = ready = None
+    try:
+        while time.perf_counter() - started < timeout and ready is None:
+            path = "/" if live is None else "/ready"
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        elapsed = (time.perf_counter() - started) * 1000
+                        if live is None:
+                            live = elapsed
+                        else:
+                            ready = elapsed
+                        continue
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.02)
+    finally:
+        api.terminate()
+        api.wait(timeout=10)
+    return live, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=8, help="direct imports of app to list")
+    parser.add_argument("--update", action="store_true", help="write the budget from this run")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        CALENDAR_SCHEDULER="false",
+        BROWSER_POOL_SIZE="0",
+        JOB_STORE_PATH=os.path.join(workdir, "jobs.db"),
+        SESSION_DIR=os.path.join(workdir, "sessions"),
+        FOLDER_CACHE_DIR=os.path.join(workdir, "cache"),
+        UPLOAD_STATE_DIR=os.path.join(workdir, "uploads"),
+        SEGMENT_DIR=os.path.join(workdir, "segments"),
+    )
+    try:
+        imports = [import_profile(env) for _ in range(args.runs)]
+        serves = [serve_profile(env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    measured = {
+        "import_app_ms": statistics.median(total for total, _, _ in imports),
+        "first_live_ms": statistics.median(live for live, _ in serves if live is not None),
+        "first_ready_ms": statistics.median(ready for _, ready in serves if ready is not None),
+    }
+    children = {name: statistics.median(run[1].get(name, 0) for run in imports) for name in imports[0][1]}
+    print(f"direct imports of app, median cumulative ms over {args.runs} runs:")
+    for name, ms in sorted(children.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<28} {ms:>8.1f}")
+    loaded = sorted({name.split(".")[0] for _, _, modules in imports for name in modules}
+                    & set(budget["lazy_modules"]))
+
+    ok = not loaded
+    print(f"lazy modules loaded by importing app: {loaded or 'none'}")
+    for key, value in measured.items():
+        within = value <= budget[key]
+        ok &= within
+        print(f"{key:<16} {value:>8.1f} ms  budget {budget[key]:>8.1f} ms  {'ok' if within else 'OVER'}")
+
+    if args.update:
+        budget.update({key: round(value * HEADROOM) for key, value in measured.items()})
+        with open(BUDGET_FILE, "w") as f:
+            json.dump(budget, f, indent=2)
+            f.write("\n")
+        print(f"wrote {os.path.relpath(BUDGET_FILE, ROOT)}")
+    return ok
+
+
+if __name__ == "__main__":
+    if not main():
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
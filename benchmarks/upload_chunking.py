@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare fixed and adaptive upload chunk sizes against the fake Drive
+
+Uploads a file through UploadManager over links emulated by
+benchmarks/fake_drive.py: a fast link with a noticeable round trip, a slow
+one, and one that drops now and then, failing the chunk in flight. Each
+link is tried with fixed UPLOAD_CHUNK_KB chunks and with adaptive chunks,
+and the benchmark reports the time, the number of chunks, failed chunks
+and the last chunk size. It fails unless every upload arrives complete and
+progress was reported after every chunk.
+
+    python benchmarks/upload_chunking.py --fast-mib 256
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_drive import start_fake_drive  # noqa: E402
+
+# (name, round trip seconds, MiB/s, chance per second that the link drops)
+LINKS = [
+    ("fast", 0.15, 400, 0),
+    ("slow", 0.3, 2, 0),
+    ("flaky", 0.1, 8, 0.15),
+]
+
+
+def upload(url, path, adaptive):
+    os.environ.update(DRIVE_API_ROOT=url, DRIVE_ANONYMOUS="true", UPLOAD_RETRY_BASE_DELAY="0.05",
+                      UPLOAD_RETRY_MAX_DELAY="0.5")
+    import config
+    from upload_manager import UploadManager
+
+    fixed = config.get_upload_chunk_size()
+    bounds = {} if adaptive else {"min_chunk_size": fixed, "max_chunk_size": fixed}
+    state_dir = tempfile.mkdtemp(prefix="upload-state-")
+    manager = UploadManager(workers=1, state_dir=state_dir, max_attempts=20, **bounds)
+    reports = []
+    try:
+        started = time.perf_counter()
+        result = manager.submit(path, file_name=os.path.basename(path), on_progress=reports.append).result()
+        elapsed = time.perf_counter() - started
+    finally:
+        manager.shutdown()
+        shutil.rmtree(state_dir, ignore_errors=True)
+    return result, elapsed, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fast-mib", type=int, default=256, help="file size on the fast link")
+    parser.add_argument("--slow-mib", type=int, default=48, help="file size on the slow and flaky links")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the emulated link drops")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="upload-chunking-")
+    ok = True
+    print(f"{'link':<6} {'mode':<9} {'MiB':>5} {'seconds':>8} {'MiB/s':>7} {'chunks':>7} {'failed':>7} {'last chunk':>11}")
+    try:
+        for name, latency, mib_per_second, failure_rate in LINKS:
+            size = (args.fast_mib if name == "fast" else args.slow_mib) * 1024 ** 2
+            path = os.path.join(workdir, f"{name}.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+            for adaptive in (False, True):
+                random.seed(args.seed)
+                server, state, url = start_fake_drive(latency=latency, bandwidth=mib_per_second * 1024 ** 2,
+                                                      failure_rate=failure_rate)
+                try:
+                    result, elapsed, reports = upload(url, path, adaptive)
+                finally:
+                    server.shutdown()
+                chunks = sum(1 for method, _, length in state.requests if method == "PUT" and length)
+                chunks -= state.failures
+                mode = "adaptive" if adaptive else "fixed"
+                last_chunk = reports[-1]["chunk_bytes"] / 1024 ** 2 if reports else 0
+                print(f"{name:<6} {mode:<9} {size / 1024 ** 2:>5.0f} {elapsed:>8.2f} "
+                      f"{size / 1024 ** 2 / elapsed:>7.1f} {chunks:>7} {state.failures:>7} {last_chunk:>9.2f}Mi")
+                ok &= (result is not None and int(result["size"]) == size
+                       and reports[-1]["bytes_sent"] == size and len(reports) == chunks)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return ok
+
+
+if __name__ == "__main__":
+    if not main():
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
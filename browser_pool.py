@@ -0,0 +1,277 @@
+import threading
+import time
+
+import config
+import metrics
+
+logger = config.get_logger()
+
+
+# Runs before any page script in audio profile tabs. Remote video tracks are
+# disabled and never attached to a <video> element, so no frames are decoded
+# for display, and CSS animations and transitions are switched off.
+AUDIO_ONLY_SCRIPT = """
+(() => {
+  const NativePeerConnection = window.RTCPeerConnection;
+  if (NativePeerConnection) {
+    const PeerConnection = function (...args) {
+      const pc = new NativePeerConnection(...args);
+      pc.addEventListener('track', (event) => {
+        if (event.track.kind === 'video') event.track.enabled = false;
+      });
+      return pc;
+    };
+    PeerConnection.prototype = NativePeerConnection.prototype;
+    Object.setPrototypeOf(PeerConnection, NativePeerConnection);
+    window.RTCPeerConnection = PeerConnection;
+  }
+
+  const srcObject = Object.getOwnPropertyDescriptor(HTMLMediaElement.prototype, 'srcObject');
+  Object.defineProperty(HTMLVideoElement.prototype, 'srcObject', {
+    configurable: true,
+    get() { return srcObject.get.call(this); },
+    set(stream) {
+      if (stream && stream.getVideoTracks && stream.getVideoTracks().length) {
+        stream = new MediaStream(stream.getAudioTracks());
+      }
+      srcObject.set.call(this, stream);
+    },
+  });
+
+  const style = document.createElement('style');
+  style.textContent = '*, *::before, *::after { animation: none !important; transition: none !important; }'
+    + ' video { display: none !important; }';
+  const addStyle = () => (document.head || document.documentElement).appendChild(style);
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', addStyle);
+  } else {
+    addStyle();
+  }
+})();
+"""
+
+
+def prepare_tab(driver, profile: str = None):
+    """Apply the DevTools side of the browser profile to the current tab"""
+    if (profile or config.get_browser_profile()) != "audio":
+        return
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": AUDIO_ONLY_SCRIPT})
+    driver.execute_cdp_cmd("Emulation.setEmulatedMedia", {
+        "features": [{"name": "prefers-reduced-motion", "value": "reduce"}]
+    })
+
+
+def create_driver(profile: str = None):
+    """
+    Launch a Chromium WebDriver with the recorder options
+
+    Args:
+        profile (str): Browser profile, audio or video, BROWSER_PROFILE when omitted
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    opt = config.get_chrome_options(profile)
+
+    try:
+        opt.binary_location = "/usr/bin/chromium"
+        service = Service("/usr/bin/chromedriver")
+        driver = webdriver.Chrome(service=service, options=opt)
+    except Exception as e:
+        logger.warning(f"Failed to use chromium-browser, trying default: {e}")
+        # Fallback to default Chrome
+        driver = webdriver.Chrome(options=config.get_chrome_options(profile))
+    prepare_tab(driver, profile)
+    return driver
+
+
+class PooledDriver:
+    """A WebDriver owned by the pool together with its usage counters"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created_at
+
+
+class BrowserPool:
+    """Keeps a set of warm Chromium drivers that jobs lease and hand back"""
+
+    def __init__(self, size: int = None, max_uses: int = None, max_age_seconds: int = None,
+                 health_interval: int = None, factory=create_driver):
+        """
+        Args:
+            size (int): Number of drivers kept warm, and the most that can exist at once
+            max_uses (int): Jobs a driver may serve before it is recycled
+            max_age_seconds (int): Seconds a driver may live before it is recycled
+            health_interval (int): Seconds between health checks of idle drivers
+            factory (callable): Function that launches a new WebDriver
+        """
+        self.size = max(1, size or config.get_browser_pool_size())
+        self.max_uses = max_uses or config.get_browser_max_uses()
+        self.max_age_seconds = max_age_seconds or config.get_browser_max_age_seconds()
+        self.health_interval = health_interval or config.get_browser_health_interval()
+        self.factory = factory
+        self._idle = []
+        self._total = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._maintainer = None
+        self._wake = threading.Event()
+
+    def start(self):
+        """Launch the warm drivers and the health check thread in the background"""
+        with self._cond:
+            if self._maintainer or self._closed:
+                return
+            self._maintainer = threading.Thread(target=self._maintain, name="browser-pool", daemon=True)
+        self._maintainer.start()
+        logger.info(f"Browser pool started with {self.size} drivers")
+
+    def stats(self):
+        with self._cond:
+            return {"size": self.size, "total": self._total, "idle": len(self._idle)}
+
+    def lease(self, timeout: float = None) -> PooledDriver:
+        """
+        Take a healthy driver from the pool, launching one if there is room
+
+        Blocks until a driver is free when the pool is at its size limit.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                elif self._total < self.size:
+                    self._total += 1
+                    pooled = None
+                else:
+                    remaining = deadline - time.monotonic() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No browser available in the pool")
+                    self._cond.wait(remaining)
+                    continue
+
+            if pooled is None:
+                return self._launch()
+            if self.is_healthy(pooled):
+                return pooled
+            logger.warning("Discarding unhealthy browser from the pool")
+            self._discard(pooled)
+
+    def release(self, pooled: PooledDriver, healthy: bool = True):
+        """Hand a driver back, recycling it when it is worn out or broken"""
+        pooled.uses += 1
+        recycle = (
+            not healthy
+            or self._closed
+            or pooled.uses >= self.max_uses
+            or pooled.age >= self.max_age_seconds
+        )
+        if not recycle:
+            try:
+                self._fresh_tab(pooled.driver)
+            except Exception as e:
+                logger.warning(f"Failed to reset browser tab: {e}")
+                recycle = True
+
+        if recycle:
+            self._discard(pooled)
+            return
+        self._put_idle(pooled)
+
+    def close(self):
+        """Quit every idle driver, leased drivers are quit when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        self._wake.set()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def _launch(self) -> PooledDriver:
+        try:
+            with metrics.phase("browser_launch"):
+                return PooledDriver(self.factory())
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    def _put_idle(self, pooled: PooledDriver):
+        """Make a driver available to acquire, or quit it when the pool closed meanwhile"""
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                self._idle.append(pooled)
+                self._cond.notify()
+        # close() has already drained the idle list, nothing else would quit it
+        if closed:
+            self._discard(pooled)
+
+    def _discard(self, pooled: PooledDriver):
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit browser: {e}")
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+        # Let the maintainer launch a replacement right away
+        self._wake.set()
+
+    def is_healthy(self, pooled: PooledDriver) -> bool:
+        """Check that the browser still answers WebDriver commands"""
+        try:
+            pooled.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _fresh_tab(self, driver):
+        """Open a blank tab for the next job and close everything else"""
+        old_handles = driver.window_handles
+        driver.switch_to.new_window('tab')
+        fresh = driver.current_window_handle
+        for handle in old_handles:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(fresh)
+        # DevTools settings belong to a tab, apply them to the new one
+        prepare_tab(driver)
+
+    def _maintain(self):
+        """Top the pool up to its size and drop idle drivers that died"""
+        while not self._closed:
+            with self._cond:
+                idle, self._idle = self._idle, []
+            for pooled in idle:
+                if pooled.age < self.max_age_seconds and self.is_healthy(pooled):
+                    self._put_idle(pooled)
+                else:
+                    logger.info("Recycling idle browser")
+                    self._discard(pooled)
+
+            while True:
+                with self._cond:
+                    if self._closed or self._total >= self.size:
+                        break
+                    self._total += 1
+                try:
+                    pooled = self._launch()
+                except Exception as e:
+                    logger.error(f"Failed to launch warm browser: {e}")
+                    break
+                self._put_idle(pooled)
+
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
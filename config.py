@@ -1,7 +1,12 @@
-from selenium import webdriver
-
 from dotenv import load_dotenv
 import logging
+import os
+import socket
+
+DEFAULT_DRIVE_API_ROOT = "https://www.googleapis.com/"
+
+BROWSER_PROFILES = ("audio", "video")
+
 
 def setup():
     """Load environment variables and setup logging"""
@@ -15,8 +20,444 @@ def get_logger():
     return logger
 
 
-def get_chrome_options():
-    """Configure Chrome options for headless operation"""
+def get_worker_count():
+    """Number of recording jobs processed concurrently"""
+    return int(os.getenv("RECORDER_WORKERS", "2"))
+
+
+def get_job_history_limit():
+    """Number of finished jobs kept in the job store for the /jobs endpoints"""
+    return int(os.getenv("JOB_HISTORY_LIMIT", "1000"))
+
+
+def get_job_store_url():
+    """postgresql:// DSN of a job store shared by recorder nodes on any host, unset for the SQLite store"""
+    return os.getenv("JOB_STORE_URL", "")
+
+
+def get_job_store_path():
+    """SQLite job store used when JOB_STORE_URL is unset, nodes on one host can share it"""
+    return os.getenv("JOB_STORE_PATH", "data/jobs.db")
+
+
+def get_node_id():
+    """Name of this recorder node in the job store, stable across restarts"""
+    return os.getenv("NODE_ID") or socket.gethostname()
+
+
+def get_job_lease_seconds():
+    """Seconds a claimed job stays leased to its node without a heartbeat"""
+    return float(os.getenv("JOB_LEASE_SECONDS", "30"))
+
+
+def get_job_heartbeat_interval():
+    """Seconds between heartbeats renewing the leases of running jobs"""
+    return float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+
+
+def get_job_poll_interval():
+    """Seconds between checks of the job store for claimable jobs"""
+    return float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+
+def get_job_max_attempts():
+    """Times a job is claimed again after its node was lost before it fails"""
+    return int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+def get_admission_control():
+    """Start and accept jobs only while the container's memory and CPU have room for them"""
+    return os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+
+
+def get_cgroup_root():
+    """Mount point of the cgroup filesystem the container's usage and limits are read from"""
+    return os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+
+
+def get_admission_job_memory():
+    """Bytes of memory one recording is assumed to need until its real cost is measured"""
+    return int(os.getenv("ADMISSION_JOB_MEMORY_MB", "700")) * 1024 * 1024
+
+
+def get_admission_job_cpu():
+    """CPU cores one recording is assumed to need until its real cost is measured"""
+    return float(os.getenv("ADMISSION_JOB_CPU", "0.5"))
+
+
+def get_admission_memory_high():
+    """Share of the memory limit up to which new recordings are started"""
+    return float(os.getenv("ADMISSION_MEMORY_HIGH", "0.85"))
+
+
+def get_admission_memory_critical():
+    """Share of the memory limit above which recordings due now are refused with 503"""
+    return float(os.getenv("ADMISSION_MEMORY_CRITICAL", "0.95"))
+
+
+def get_admission_cpu_high():
+    """Share of the CPU limit up to which new recordings are started"""
+    return float(os.getenv("ADMISSION_CPU_HIGH", "0.9"))
+
+
+def get_admission_max_queued():
+    """Jobs due now allowed to wait for a recorder before new ones are refused with 429"""
+    return int(os.getenv("ADMISSION_MAX_QUEUED", "10"))
+
+
+def get_browser_pool_size():
+    """Number of Chromium drivers kept warm for recordings"""
+    return int(os.getenv("BROWSER_POOL_SIZE", str(get_worker_count())))
+
+
+def get_browser_max_uses():
+    """Recordings a pooled driver serves before it is replaced"""
+    return int(os.getenv("BROWSER_MAX_USES", "10"))
+
+
+def get_browser_max_age_seconds():
+    """Seconds a pooled driver lives before it is replaced"""
+    return int(os.getenv("BROWSER_MAX_AGE_MINUTES", "240")) * 60
+
+
+def get_browser_health_interval():
+    """Seconds between health checks of idle pooled drivers"""
+    return int(os.getenv("BROWSER_HEALTH_INTERVAL", "30"))
+
+
+def get_browser_executor_workers():
+    """Threads running blocking Selenium calls, one per job that can hold a browser"""
+    default = max(get_worker_count(), get_browser_pool_size()) + 1
+    return int(os.getenv("BROWSER_EXECUTOR_WORKERS", str(default)))
+
+
+def get_io_executor_workers():
+    """Threads running blocking Drive and subprocess calls"""
+    return int(os.getenv("IO_EXECUTOR_WORKERS", "8"))
+
+
+def get_postprocess_workers():
+    """Processes normalizing recordings and computing peaks, 0 for the cores the recorders leave free"""
+    return int(os.getenv("POSTPROCESS_WORKERS", "0"))
+
+
+def get_session_dir():
+    """Directory where authenticated Google sessions are cached"""
+    return os.getenv("SESSION_DIR", "sessions")
+
+
+def get_session_max_age_seconds():
+    """Longest time a cached Google session is reused before a full login"""
+    return int(os.getenv("SESSION_MAX_AGE_HOURS", "72")) * 3600
+
+
+def get_audio_isolation():
+    """Whether each job records from its own PulseAudio null sink"""
+    return os.getenv("AUDIO_ISOLATION", "true").lower() in ("1", "true", "yes")
+
+
+def get_audio_route_interval():
+    """Seconds between scans for new browser audio streams to route"""
+    return float(os.getenv("AUDIO_ROUTE_INTERVAL", "1"))
+
+
+def get_event_keepalive():
+    """Seconds between keepalive comments on an idle job event stream"""
+    return float(os.getenv("EVENT_KEEPALIVE", "15"))
+
+
+def get_meeting_poll_interval():
+    """Seconds between checks of the Meet page for the end of the meeting"""
+    return float(os.getenv("MEETING_POLL_INTERVAL", "5"))
+
+
+def get_meeting_alone_timeout():
+    """Seconds the recorder stays once every other participant has left"""
+    return float(os.getenv("MEETING_ALONE_TIMEOUT", "120"))
+
+
+def get_silence_timeout():
+    """Seconds of silence after which a recording stops, 0 to never stop on silence"""
+    return int(os.getenv("SILENCE_TIMEOUT", "600"))
+
+
+def get_silence_threshold_db():
+    """Audio level in dB below which the recording counts as silent"""
+    return int(os.getenv("SILENCE_THRESHOLD_DB", "-50"))
+
+
+def get_segment_seconds():
+    """Length of one recording segment in seconds, 0 to write a single file"""
+    return int(os.getenv("SEGMENT_SECONDS", "60"))
+
+
+def get_segment_dir():
+    """Directory holding the segments of recordings in progress, inside the capture directory by default"""
+    return os.getenv("SEGMENT_DIR") or os.path.join(get_spool_capture_dir(), "segments")
+
+
+def get_spool_dir():
+    """Directory holding finished recordings until they are uploaded or evicted"""
+    return os.getenv("SPOOL_DIR", "recordings")
+
+
+def get_spool_capture_dir():
+    """Directory recordings are written to while capturing, such as a tmpfs mount, the spool directory when unset"""
+    return os.getenv("SPOOL_CAPTURE_DIR") or get_spool_dir()
+
+
+def get_spool_quota():
+    """Bytes the spool and capture directories may use together, 0 for no limit but the free disk space"""
+    return int(os.getenv("SPOOL_QUOTA_MB", "0")) * 1024 * 1024
+
+
+def get_spool_eviction():
+    """When uploaded recordings are deleted: "uploaded" right after a verified upload, "lru" beyond SPOOL_KEEP_MB"""
+    return os.getenv("SPOOL_EVICTION", "uploaded")
+
+
+def get_spool_keep():
+    """Bytes of uploaded recordings kept for re-upload with the "lru" eviction policy"""
+    return int(os.getenv("SPOOL_KEEP_MB", "2048")) * 1024 * 1024
+
+
+def get_loudnorm():
+    """Whether recordings are normalized to EBU R128 loudness before upload"""
+    return os.getenv("LOUDNORM", "false").lower() in ("1", "true", "yes")
+
+
+def get_loudnorm_target():
+    """Integrated loudness recordings are normalized to, in LUFS"""
+    return float(os.getenv("LOUDNORM_TARGET_LUFS", "-16"))
+
+
+def get_loudnorm_true_peak():
+    """Highest true peak after normalization, in dBTP"""
+    return float(os.getenv("LOUDNORM_TRUE_PEAK", "-1.5"))
+
+
+def get_extra_formats():
+    """Encoding profiles each recording is also transcoded to and uploaded in, see encoding.PROFILES"""
+    return [name.strip() for name in os.getenv("EXTRA_FORMATS", "").split(",") if name.strip()]
+
+
+def get_waveform_peaks():
+    """Whether a waveform peaks JSON is computed and uploaded next to each recording"""
+    return os.getenv("WAVEFORM_PEAKS", "false").lower() in ("1", "true", "yes")
+
+
+def get_peaks_per_second():
+    """Min/max pairs per second of audio in the waveform peaks"""
+    return int(os.getenv("WAVEFORM_PEAKS_PER_SECOND", "10"))
+
+
+def get_speech_index():
+    """Whether a speech segment index is built from a PCM tap while recording and uploaded next to it"""
+    return os.getenv("SPEECH_INDEX", "false").lower() in ("1", "true", "yes")
+
+
+def get_speech_threshold_db():
+    """RMS level in dBFS above which a frame of the PCM tap counts as speech"""
+    return float(os.getenv("SPEECH_THRESHOLD_DB", "-45"))
+
+
+def get_trim_silence():
+    """Whether leading, trailing and long internal silences are cut from recordings before upload"""
+    return os.getenv("TRIM_SILENCE", "false").lower() in ("1", "true", "yes")
+
+
+def get_trim_min_silence():
+    """Seconds an internal silence must last to be cut"""
+    return float(os.getenv("TRIM_MIN_SILENCE_SECONDS", "5"))
+
+
+def get_trim_padding():
+    """Seconds of silence left around the speech when trimming"""
+    return float(os.getenv("TRIM_PADDING_SECONDS", "1"))
+
+
+def get_upload_mode():
+    """Default upload mode: "file" uploads after recording, "stream" uploads while recording"""
+    return os.getenv("UPLOAD_MODE", "file")
+
+
+def get_encoding_profile():
+    """Default encoding profile for recordings, see encoding.PROFILES"""
+    return os.getenv("ENCODING_PROFILE", "mp3-192")
+
+
+def get_drive_api_root():
+    """Root URL of the Drive API, point it at a local fake server for testing"""
+    root = os.getenv("DRIVE_API_ROOT", DEFAULT_DRIVE_API_ROOT)
+    return root if root.endswith("/") else root + "/"
+
+
+def get_drive_api_endpoint():
+    """Drive v3 endpoint for the API client, None to use the discovery default"""
+    root = get_drive_api_root()
+    return None if root == DEFAULT_DRIVE_API_ROOT else root + "drive/v3/"
+
+
+def get_drive_upload_url():
+    """Drive v3 media upload endpoint"""
+    return get_drive_api_root() + "upload/drive/v3/files"
+
+
+def get_calendar_api_endpoint():
+    """Calendar v3 endpoint for the API client, None to use the discovery default"""
+    root = os.getenv("CALENDAR_API_ROOT", DEFAULT_DRIVE_API_ROOT)
+    root = root if root.endswith("/") else root + "/"
+    return None if root == DEFAULT_DRIVE_API_ROOT else root + "calendar/v3/"
+
+
+def get_calendar_scheduler():
+    """Whether meetings on the configured calendars are recorded automatically"""
+    return os.getenv("CALENDAR_SCHEDULER", "false").lower() in ("1", "true", "yes")
+
+
+def get_calendar_ids():
+    """Calendars the scheduler reads meetings from"""
+    return [c.strip() for c in os.getenv("CALENDAR_IDS", "primary").split(",") if c.strip()]
+
+
+def get_calendar_poll_interval():
+    """Seconds between calendar polls"""
+    return float(os.getenv("CALENDAR_POLL_INTERVAL", "60"))
+
+
+def get_calendar_lookahead_minutes():
+    """How far ahead the scheduler looks for meetings"""
+    return int(os.getenv("CALENDAR_LOOKAHEAD_MINUTES", "60"))
+
+
+def get_calendar_folder_name():
+    """Drive folder for recordings started from the calendar"""
+    return os.getenv("CALENDAR_FOLDER_NAME", "Meeting Recordings")
+
+
+def get_calendar_webhook_url():
+    """Public URL of POST /calendar/notifications for push updates, None to only poll"""
+    return os.getenv("CALENDAR_WEBHOOK_URL") or None
+
+
+def get_prewarm_lead_seconds():
+    """Seconds before a scheduled start at which the browser is leased and logged in"""
+    return float(os.getenv("PREWARM_LEAD_SECONDS", "90"))
+
+
+def get_drive_anonymous():
+    """Send Drive requests without credentials, only useful against a fake server"""
+    return os.getenv("DRIVE_ANONYMOUS", "false").lower() in ("1", "true", "yes")
+
+
+def get_drive_auth():
+    """Drive authentication used for uploads: oauth or service_account"""
+    return os.getenv("DRIVE_AUTH", "oauth")
+
+
+def get_drive_http_timeout():
+    """Seconds before a Drive API request times out"""
+    return int(os.getenv("DRIVE_HTTP_TIMEOUT", "60"))
+
+
+def get_drive_connection_pool_size():
+    """Keep-alive connections pooled for Drive uploads"""
+    return int(os.getenv("DRIVE_CONNECTION_POOL_SIZE", "10"))
+
+
+def get_credential_refresh_margin():
+    """Seconds before expiry at which Drive credentials are refreshed in the background"""
+    return int(os.getenv("CREDENTIAL_REFRESH_MARGIN", "300"))
+
+
+def get_folder_cache_file(name: str):
+    """JSON file that keeps resolved Drive folder IDs across restarts"""
+    return os.path.join(os.getenv("FOLDER_CACHE_DIR", "cache"), f"drive_folders_{name}.json")
+
+
+def get_folder_cache_ttl():
+    """Seconds a cached Drive folder ID is used before it is looked up again"""
+    return int(os.getenv("FOLDER_CACHE_TTL", "86400"))
+
+
+def get_upload_workers():
+    """Uploads to Drive running at once"""
+    return int(os.getenv("UPLOAD_WORKERS", "2"))
+
+
+def get_upload_state_dir():
+    """Directory where resumable upload sessions are saved until they finish"""
+    return os.getenv("UPLOAD_STATE_DIR", "uploads")
+
+
+def get_upload_max_attempts():
+    """Failed upload attempts in a row before an upload is given up"""
+    return int(os.getenv("UPLOAD_MAX_ATTEMPTS", "10"))
+
+
+def get_upload_chunk_size():
+    """Bytes sent in the first request of an upload, later chunks adapt to the link"""
+    return int(os.getenv("UPLOAD_CHUNK_KB", "8192")) * 1024
+
+
+def get_upload_chunk_min_size():
+    """Smallest upload chunk in bytes, used on slow or failing links"""
+    return int(os.getenv("UPLOAD_CHUNK_MIN_KB", "256")) * 1024
+
+
+def get_upload_chunk_max_size():
+    """Largest upload chunk in bytes, each one is held in memory while it is sent"""
+    return int(os.getenv("UPLOAD_CHUNK_MAX_KB", "65536")) * 1024
+
+
+def get_upload_chunk_target_seconds():
+    """How long one upload request should take at the measured throughput"""
+    return float(os.getenv("UPLOAD_CHUNK_TARGET_SECONDS", "4"))
+
+
+def get_upload_retry_base_delay():
+    """Seconds of the first upload retry delay, doubled on every attempt"""
+    return float(os.getenv("UPLOAD_RETRY_BASE_DELAY", "2"))
+
+
+def get_upload_retry_max_delay():
+    """Longest delay between upload retries in seconds"""
+    return float(os.getenv("UPLOAD_RETRY_MAX_DELAY", "300"))
+
+
+def get_stream_chunk_size():
+    """Bytes sent per request when streaming a recording to Drive"""
+    return int(os.getenv("STREAM_CHUNK_KB", "1024")) * 1024
+
+
+def get_google_login_url():
+    """Google sign-in page, point it at a local fake (benchmarks/fake_google.py) for load tests"""
+    return os.getenv("GOOGLE_LOGIN_URL", "https://accounts.google.com/")
+
+
+def get_google_account_url():
+    """Page that only opens for a signed-in browser, used to check the session"""
+    return os.getenv("GOOGLE_ACCOUNT_URL", "https://myaccount.google.com/")
+
+
+def get_browser_profile():
+    """Chromium profile: audio (no incoming video, images or animations) or video"""
+    return os.getenv("BROWSER_PROFILE", "audio")
+
+
+def get_chrome_options(profile: str = None):
+    """
+    Configure Chrome options for headless operation
+
+    Args:
+        profile (str): audio or video, BROWSER_PROFILE when omitted
+    """
+    profile = profile or get_browser_profile()
+    if profile not in BROWSER_PROFILES:
+        raise ValueError(f"BROWSER_PROFILE must be one of: {', '.join(BROWSER_PROFILES)}")
+    # Selenium takes a while to import, only load it once a browser is launched
+    from selenium import webdriver
+
     opt = webdriver.ChromeOptions()
     opt.add_argument('--disable-blink-features=AutomationControlled')
     # Recommended way for headless mode
@@ -49,12 +490,24 @@ def get_chrome_options():
     # opt.add_argument('--remote-debugging-port=9222')
     # opt.add_argument('--disable-web-security')
     # opt.add_argument('--allow-running-insecure-content')
-    opt.add_experimental_option("prefs", {
+    prefs = {
         "profile.default_content_setting_values.media_stream_mic": 0,
         "profile.default_content_setting_values.media_stream_camera": 0,
         "profile.default_content_setting_values.geolocation": 0,
         "profile.default_content_setting_values.notifications": 0
-    })
+    }
+    if profile == "audio":
+        # Nothing is captured from the screen, skip the work of drawing it.
+        # Incoming video is detached in the page, see browser_pool.prepare_tab
+        opt.add_argument('--window-size=640,360')
+        opt.add_argument('--blink-settings=imagesEnabled=false')
+        opt.add_argument('--force-prefers-reduced-motion')
+        opt.add_argument('--disable-gpu')
+        opt.add_argument('--autoplay-policy=no-user-gesture-required')
+        # Block the camera so no fake video stream is generated and encoded
+        prefs["profile.default_content_setting_values.media_stream_camera"] = 2
+        prefs["profile.managed_default_content_settings.images"] = 2
+    opt.add_experimental_option("prefs", prefs)
     # opt.add_experimental_option("excludeSwitches", ["enable-automation"])
     # opt.add_experimental_option('useAutomationExtension', False)
     return opt
\ No newline at end of file
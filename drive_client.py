@@ -0,0 +1,175 @@
+import threading
+import time
+from datetime import datetime
+
+import config
+
+logger = config.get_logger()
+
+# Shortest wait between background refreshes, for tokens that never outlive CREDENTIAL_REFRESH_MARGIN
+MIN_REFRESH_INTERVAL = 60
+
+_lock = threading.Lock()
+_clients = {}
+_sessions = {}
+_refreshers = {}
+
+
+def build_drive_service(credentials):
+    """
+    Build a Drive v3 service that is safe to share between threads
+
+    The discovery document bundled with the client library is used instead of
+    fetching it, and each thread reuses its own keep-alive HTTP connection.
+    """
+    return _build_service('drive', 'v3', credentials, config.get_drive_api_endpoint())
+
+
+def build_calendar_service(credentials):
+    """Build a Calendar v3 service the same way as build_drive_service"""
+    return _build_service('calendar', 'v3', credentials, config.get_calendar_api_endpoint())
+
+
+def _build_service(api: str, version: str, credentials, api_endpoint: str = None):
+    # The Google client libraries take a while to import, load them on the first Drive call
+    import google_auth_httplib2
+    import httplib2
+    from googleapiclient.discovery import build
+    from googleapiclient.http import HttpRequest
+
+    local = threading.local()
+
+    def build_request(http, *args, **kwargs):
+        # httplib2 is not thread safe, give every thread its own connection
+        if not hasattr(local, "http"):
+            local.http = google_auth_httplib2.AuthorizedHttp(
+                credentials, http=httplib2.Http(timeout=config.get_drive_http_timeout()))
+        return HttpRequest(local.http, *args, **kwargs)
+
+    return build(
+        api, version,
+        credentials=credentials,
+        requestBuilder=build_request,
+        static_discovery=True,
+        cache_discovery=False,
+        client_options={'api_endpoint': api_endpoint},
+    )
+
+
+class CredentialRefresher:
+    """Refreshes shared credentials in the background shortly before they expire"""
+
+    def __init__(self, credentials, margin_seconds: int = None, on_refresh=None):
+        """
+        Args:
+            credentials: google-auth credentials shared by the Drive clients
+            margin_seconds (int): Seconds before expiry at which to refresh
+            on_refresh (callable): Called with the credentials after each refresh
+        """
+        self.credentials = credentials
+        self.margin_seconds = margin_seconds or config.get_credential_refresh_margin()
+        self.on_refresh = on_refresh
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="credential-refresh", daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        """Refresh now, concurrent callers share a single token request"""
+        from google.auth.transport.requests import Request
+
+        with self.lock:
+            if self.credentials.valid and self._seconds_left() > self.margin_seconds:
+                return
+            self.credentials.refresh(Request())
+            logger.info("Refreshed Google Drive credentials")
+            if self.on_refresh:
+                self.on_refresh(self.credentials)
+
+    def _seconds_left(self):
+        expiry = getattr(self.credentials, "expiry", None)
+        if expiry is None:
+            return float("inf") if self.credentials.token else 0
+        # google-auth keeps expiry as a naive UTC datetime
+        return (expiry - datetime.utcnow()).total_seconds()
+
+    def _run(self):
+        while True:
+            wait = self._seconds_left() - self.margin_seconds
+            if wait > 0:
+                time.sleep(min(wait, 3600))
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to refresh Google Drive credentials: {e}")
+                time.sleep(30)
+                continue
+            if self._seconds_left() <= self.margin_seconds:
+                logger.warning(f"Google Drive credentials expire within CREDENTIAL_REFRESH_MARGIN "
+                               f"({self.margin_seconds}s) right after a refresh, lower the margin")
+                time.sleep(MIN_REFRESH_INTERVAL)
+
+
+def _needs_refresher(credentials):
+    return hasattr(credentials, "refresh") and (
+        getattr(credentials, "refresh_token", None) or hasattr(credentials, "service_account_email"))
+
+
+def _shared(key, factory):
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            on_refresh = getattr(client, "save_credentials", None)
+            if _needs_refresher(client.credentials):
+                refresher = CredentialRefresher(client.credentials, on_refresh=on_refresh)
+                refresher.start()
+                _refreshers[key] = refresher
+            _clients[key] = client
+        return client
+
+
+def get_drive_oauth():
+    """Process-wide GoogleDriveOAuth client"""
+    from google_drive_oauth import GoogleDriveOAuth
+    return _shared("oauth", GoogleDriveOAuth)
+
+
+def get_drive_service_account():
+    """Process-wide GoogleDriveServiceAccount client"""
+    from google_drive_service_account import GoogleDriveServiceAccount
+    return _shared("service_account", GoogleDriveServiceAccount)
+
+
+def get_drive():
+    """Process-wide Drive client for the authentication selected by DRIVE_AUTH"""
+    if config.get_drive_auth() == "service_account":
+        return get_drive_service_account()
+    return get_drive_oauth()
+
+
+def get_authorized_session():
+    """
+    Process-wide requests session for raw Drive calls such as resumable uploads
+
+    Connections are pooled and kept alive across uploads.
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    client = get_drive()
+    with _lock:
+        session = _sessions.get(id(client))
+        if session is None:
+            session = AuthorizedSession(client.credentials)
+            pool_size = config.get_drive_connection_pool_size()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[id(client)] = session
+        return session
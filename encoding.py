@@ -0,0 +1,64 @@
+import config
+
+
+class EncodingProfile:
+    """ffmpeg encoder settings for a recording and the matching file type"""
+
+    def __init__(self, name: str, codec_args: list, extension: str, mime_type: str, container: str,
+                 bitrate_kbps: int):
+        """
+        Args:
+            name (str): Profile name used in API requests
+            codec_args (list): ffmpeg output options selecting codec, rate and channels
+            extension (str): File extension of the recording, with the dot
+            mime_type (str): MIME type sent to Google Drive
+            container (str): ffmpeg muxer, needed when writing to a pipe
+            bitrate_kbps (int): Typical bitrate, used to estimate how large a recording gets
+        """
+        self.name = name
+        self.codec_args = codec_args
+        self.extension = extension
+        self.mime_type = mime_type
+        self.container = container
+        self.bitrate_kbps = bitrate_kbps
+
+    def estimate_bytes(self, seconds: float) -> int:
+        """Expected size of a recording of this length"""
+        return int(self.bitrate_kbps * 1000 / 8 * seconds)
+
+
+PROFILES = {
+    # The original recording format
+    "mp3-192": EncodingProfile(
+        "mp3-192",
+        ["-c:a", "libmp3lame", "-b:a", "192k"],
+        ".mp3", "audio/mpeg", "mp3", 192
+    ),
+    # Mono MP3 for speech, the cheapest profile to encode and still plays everywhere
+    "mp3-speech": EncodingProfile(
+        "mp3-speech",
+        ["-ac", "1", "-ar", "24000", "-c:a", "libmp3lame", "-b:a", "48k"],
+        ".mp3", "audio/mpeg", "mp3", 48
+    ),
+    # Mono wideband Opus, the smallest files for speech
+    "opus-speech": EncodingProfile(
+        "opus-speech",
+        ["-ac", "1", "-ar", "24000", "-c:a", "libopus", "-b:a", "32k", "-application", "voip",
+         "-compression_level", "5"],
+        ".opus", "audio/ogg", "ogg", 32
+    ),
+    # Lossless copy for archiving
+    "flac-archive": EncodingProfile(
+        "flac-archive",
+        ["-c:a", "flac", "-sample_fmt", "s16", "-compression_level", "5"],
+        ".flac", "audio/flac", "flac", 900
+    ),
+}
+
+
+def get_profile(name: str = None) -> EncodingProfile:
+    """Look up an encoding profile, raising ValueError for unknown names"""
+    name = name or config.get_encoding_profile()
+    if name not in PROFILES:
+        raise ValueError(f"encoding_profile must be one of: {', '.join(PROFILES)}")
+    return PROFILES[name]
@@ -0,0 +1,178 @@
+import asyncio
+import functools
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+
+from admission import CgroupStats
+
+logger = config.get_logger()
+
+
+class MonitoredExecutor:
+    """Thread pool for blocking work that counts queued and running calls"""
+
+    def __init__(self, name: str, workers: int):
+        """
+        Args:
+            name (str): Name used for the threads and in stats
+            workers (int): Number of threads
+        """
+        self.name = name
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking function on the pool and await its result"""
+        dequeued = False
+
+        def call():
+            nonlocal dequeued
+            with self._lock:
+                if not dequeued:
+                    dequeued = True
+                    self.queued -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        with self._lock:
+            self.queued += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except asyncio.CancelledError:
+            # A call cancelled before it started never leaves the queue by itself
+            with self._lock:
+                if not dequeued:
+                    dequeued = True
+                    self.queued -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ProcessExecutor:
+    """
+    Process pool for CPU-heavy work, started on first use
+
+    Worker processes run at a lower priority, so browsers and ffmpeg
+    capturing meetings keep the CPU they need.
+    """
+
+    # Added to the niceness of the worker processes and the ffmpeg they start
+    NICENESS = 10
+
+    def __init__(self, name: str, workers: int):
+        """
+        Args:
+            name (str): Name used in stats
+            workers (int): Number of processes
+        """
+        self.name = name
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forked from a clean server process rather than this one with its threads
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("forkserver"),
+                                                     initializer=os.nice, initargs=(self.NICENESS,))
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a picklable module-level function in a worker process and await its result"""
+        with self._lock:
+            self.pending += 1
+        try:
+            # Submitting may start a worker process, which blocks, so it happens on a thread
+            future = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self._pool().submit(functools.partial(fn, *args, **kwargs)))
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            # Calls are not seen leaving the queue, the oldest ones are assumed to run
+            running = min(self.pending, self.workers)
+            return {
+                "workers": self.workers,
+                "queued": self.pending - running,
+                "running": running,
+                "completed": self.completed,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def free_cores() -> int:
+    """Cores the recorders leave free, at least one"""
+    busy = config.get_worker_count() * config.get_admission_job_cpu()
+    return max(1, math.floor(CgroupStats().cpu_limit() - busy))
+
+
+# Selenium calls: browser launch, login, navigation and WebDriverWaits
+browser_executor = MonitoredExecutor("browser", config.get_browser_executor_workers())
+# Drive API calls, pactl and other short blocking I/O
+io_executor = MonitoredExecutor("io", config.get_io_executor_workers())
+# Loudness normalization, transcoding and waveform peaks of finished recordings
+postprocess_executor = ProcessExecutor("postprocess", config.get_postprocess_workers() or free_cores())
+
+
+async def run_browser(fn, *args, **kwargs):
+    """Run a blocking Selenium call off the event loop"""
+    return await browser_executor.run(fn, *args, **kwargs)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking Drive or subprocess I/O off the event loop"""
+    return await io_executor.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run CPU-heavy post-processing in a worker process"""
+    return await postprocess_executor.run(fn, *args, **kwargs)
+
+
+def get_stats():
+    return {
+        "browser": browser_executor.stats(),
+        "io": io_executor.stats(),
+        "postprocess": postprocess_executor.stats(),
+    }
+
+
+def shutdown():
+    browser_executor.shutdown()
+    io_executor.shutdown()
+    postprocess_executor.shutdown()
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+
+import config
+
+logger = config.get_logger()
+
+
+class FolderCache:
+    """Caches Drive folder metadata by (name, parent) in memory and on disk"""
+
+    def __init__(self, path: str = None, ttl_seconds: int = None):
+        """
+        Args:
+            path (str): JSON file that keeps the cache across restarts, None for memory only
+            ttl_seconds (int): Seconds a cached folder is trusted before it is looked up again
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds or config.get_folder_cache_ttl()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = self._load()
+
+    @staticmethod
+    def _key(name: str, parent: str = None) -> str:
+        # JSON object keys must be strings
+        return f"{parent or ''}/{name}"
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable folder cache {self.path}: {e}")
+            return {}
+        now = time.time()
+        return {k: v for k, v in entries.items() if v.get("expires_at", 0) > now}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save folder cache {self.path}: {e}")
+
+    def get(self, name: str, parent: str = None):
+        """Get cached folder metadata, None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(self._key(name, parent))
+        if entry and entry["expires_at"] > time.time():
+            return entry["folder"]
+        return None
+
+    def put(self, name: str, parent: str, folder: dict):
+        with self._lock:
+            self._entries[self._key(name, parent)] = {
+                "folder": {"id": folder["id"], "name": folder.get("name", name)},
+                "expires_at": time.time() + self.ttl_seconds,
+            }
+            self._save()
+
+    def invalidate(self, name: str, parent: str = None):
+        """Forget a folder, for example after Drive reported it missing"""
+        with self._lock:
+            if self._entries.pop(self._key(name, parent), None) is not None:
+                self._save()
+
+    def resolve(self, name: str, parent: str, lookup):
+        """
+        Get a folder from the cache or resolve it with lookup()
+
+        Concurrent misses for the same key wait for a single lookup instead
+        of each listing (and possibly creating) the folder.
+
+        Args:
+            name (str): Folder name
+            parent (str): Parent folder ID, None for the root
+            lookup (callable): Finds or creates the folder, returns its metadata or None
+
+        Returns:
+            dict: Folder metadata, None if lookup failed
+        """
+        folder = self.get(name, parent)
+        if folder:
+            return folder
+
+        key = self._key(name, parent)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have resolved it while we waited
+            folder = self.get(name, parent)
+            if folder:
+                return folder
+            folder = lookup()
+            if folder:
+                self.put(name, parent, folder)
+            return folder
@@ -2,7 +2,6 @@
 import os
 import os
 import pickle
-from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.http import MediaFileUpload
@@ -10,11 +9,18 @@ from google.oauth2.credentials import Credentials
 
 import os
 import pickle
+import uuid
 from datetime import datetime, timedelta
 
-from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google.auth.credentials import AnonymousCredentials
+
+import config
+
+from drive_client import build_drive_service, build_calendar_service
+
+from folder_cache import FolderCache
 
 class GoogleDriveOAuth:
     """Google Drive uploader using OAuth2 authentication"""
@@ -30,17 +36,30 @@ class GoogleDriveOAuth:
         self.credentials_file = credentials_file
         self.token_file = token_file
         self.scopes = ['https://www.googleapis.com/auth/drive']
+        if config.get_calendar_scheduler():
+            self.scopes.append('https://www.googleapis.com/auth/calendar.readonly')
+        self.credentials = None
         self.service = None
+        self.calendar_service = None
+        self.folder_cache = FolderCache(config.get_folder_cache_file("oauth"))
         self._authenticate()
     
     def _authenticate(self):
         """Authenticate with Google Drive API using OAuth2"""
         creds = None
-        
+
+        # Local fake Drive servers accept unauthenticated requests
+        if config.get_drive_anonymous():
+            creds = AnonymousCredentials()
+
         # Load existing token if available
-        if os.path.exists(self.token_file):
+        elif os.path.exists(self.token_file):
             with open(self.token_file, 'rb') as token:
                 creds = pickle.load(token)
+            # Tokens saved before the calendar scope was needed must be authorized again
+            if creds and not creds.has_scopes(self.scopes):
+                print("Saved credentials lack required scopes, authorizing again...")
+                creds = None
         
         # If there are no valid credentials, request authorization
         if not creds or not creds.valid:
@@ -57,19 +76,28 @@ class GoogleDriveOAuth:
                 creds = flow.run_local_server(port=0)
             
             # Save the credentials for the next run
-            with open(self.token_file, 'wb') as token:
-                pickle.dump(creds, token)
-                print(f"Credentials saved to {self.token_file}")
+            self.save_credentials(creds)
         
         # Build the service
-        self.service = build('drive', 'v3', credentials=creds)
+        self.credentials = creds
+        self.service = build_drive_service(creds)
         if not self.service:
             raise Exception("Failed to initialize Google Drive API service")
+        self.calendar_service = build_calendar_service(creds)
         print("Google Drive API service initialized successfully!")
     
+    def save_credentials(self, creds):
+        """Save the credentials so the next run can skip the OAuth flow"""
+        with open(self.token_file, 'wb') as token:
+            pickle.dump(creds, token)
+            print(f"Credentials saved to {self.token_file}")
+
     def create_folder(self, folder_name, parent_folder_id=None):
         """
         Create a folder in Google Drive or return existing one
+
+        Resolved folders are cached by name and parent, so repeated calls
+        skip the Drive lookup.
         
         Args:
             folder_name (str): Name of the folder to create
@@ -78,6 +106,13 @@ class GoogleDriveOAuth:
         Returns:
             dict: Folder metadata if successful, None otherwise
         """
+        return self.folder_cache.resolve(
+            folder_name, parent_folder_id,
+            lambda: self._find_or_create_folder(folder_name, parent_folder_id)
+        )
+
+    def _find_or_create_folder(self, folder_name, parent_folder_id=None):
+        """Look the folder up in Google Drive and create it when missing"""
         try:
             if not self.service:
                 print("Google Drive service not initialized")
@@ -235,7 +270,7 @@ class GoogleDriveOAuth:
     def start_calendar_watch(self, webhook_url, calendar_id='primary'):
         """Start watching the calendar (Google will send POST to webhook_url)"""
         body = {
-            "id": "unique-channel-id-12345",  # must be unique per watch
+            "id": uuid.uuid4().hex,  # must be unique per watch
             "type": "web_hook",
             "address": webhook_url
         }
@@ -247,19 +282,31 @@ class GoogleDriveOAuth:
         return response
 
     def fetch_upcoming_events(self, calendar_id='primary', minutes_ahead=60):
-        """Fetch upcoming events within N minutes"""
+        """
+        Fetch Meet events that are running now or start within N minutes
+
+        Returns:
+            list: Dicts with id, calendar_id, status, summary, start, end and hangoutLink
+        """
         now = datetime.utcnow().isoformat() + 'Z'
         time_max = (datetime.utcnow() + timedelta(minutes=minutes_ahead)).isoformat() + 'Z'
 
-        events_result = self.calendar_service.events().list(
-            calendarId=calendar_id,
-            timeMin=now,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        events = []
+        page_token = None
+        while True:
+            events_result = self.calendar_service.events().list(
+                calendarId=calendar_id,
+                timeMin=now,
+                timeMax=time_max,
+                singleEvents=True,
+                orderBy='startTime',
+                pageToken=page_token
+            ).execute()
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
 
-        events = events_result.get('items', [])
         meet_links = []
 
         for event in events:
@@ -275,8 +322,12 @@ class GoogleDriveOAuth:
 
             if link:
                 meet_links.append({
+                    "id": event.get("id"),
+                    "calendar_id": calendar_id,
+                    "status": event.get("status", "confirmed"),
                     "summary": event.get("summary", "No title"),
                     "start": event["start"].get("dateTime", event["start"].get("date")),
+                    "end": event.get("end", {}).get("dateTime", event.get("end", {}).get("date")),
                     "hangoutLink": link
                 })
 
@@ -1,8 +1,13 @@
 import os
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from google.oauth2 import service_account
 
+from drive_client import build_drive_service
+
+from folder_cache import FolderCache
+
+import config
+
 
 class GoogleDriveServiceAccount:
     """Google Drive uploader using Service Account authentication"""
@@ -16,7 +21,9 @@ class GoogleDriveServiceAccount:
         """
         self.service_account_file = service_account_file
         self.scopes = ['https://www.googleapis.com/auth/drive']
+        self.credentials = None
         self.service = None
+        self.folder_cache = FolderCache(config.get_folder_cache_file("service_account"))
         self._authenticate()
     
     def _authenticate(self):
@@ -34,7 +41,8 @@ class GoogleDriveServiceAccount:
             )
             
             # Build the service
-            self.service = build('drive', 'v3', credentials=credentials)
+            self.credentials = credentials
+            self.service = build_drive_service(credentials)
             if not self.service:
                 raise Exception("Failed to initialize Google Drive API service")
             
@@ -47,6 +55,9 @@ class GoogleDriveServiceAccount:
     def create_folder(self, folder_name, parent_folder_id=None):
         """
         Create a folder in Google Drive or return existing one
+
+        Resolved folders are cached by name and parent, so repeated calls
+        skip the Drive lookup.
         
         Args:
             folder_name (str): Name of the folder to create
@@ -55,6 +66,13 @@ class GoogleDriveServiceAccount:
         Returns:
             dict: Folder metadata if successful, None otherwise
         """
+        return self.folder_cache.resolve(
+            folder_name, parent_folder_id,
+            lambda: self._find_or_create_folder(folder_name, parent_folder_id)
+        )
+
+    def _find_or_create_folder(self, folder_name, parent_folder_id=None):
+        """Look the folder up in Google Drive and create it when missing"""
         try:
             if not self.service:
                 print("Google Drive service not initialized")
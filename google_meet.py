@@ -1,27 +1,95 @@
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium import webdriver
-
 from datetime import datetime
+from urllib.parse import urlparse
+
+import asyncio
+import time
+
+from audio_sink import JobAudioSink
+
+from meeting_monitor import MeetingMonitor
+
+from browser_pool import BrowserPool, create_driver
+
+from session_store import SessionStore
+
+from resumable_upload import StreamingUpload
 
 from recording import start_recording_async
 
-from google_drive_oauth import GoogleDriveOAuth
+from encoding import get_profile
+
+from segments import SegmentedRecording, find_orphans
+
+from drive_client import get_drive, get_authorized_session
+
+from upload_manager import UploadManager
+
+from spool import Spool
+
+from executors import run_browser, run_io, run_cpu
+
+import postprocess
 
 import config
+import metrics
 import os
 
-config.setup()
 logger = config.get_logger()
 
+session_store = SessionStore()
+
+# Fields accepted by CDP Network.setCookies
+COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+
+def get_cookies(driver):
+    """Get the cookies of every domain, not only the current page"""
+    return driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+
+
+def restore_cookies(driver, cookies):
+    """Load saved cookies into the browser without navigating"""
+    params = []
+    for cookie in cookies:
+        param = {k: cookie[k] for k in COOKIE_FIELDS if k in cookie}
+        # Session cookies carry expires=-1, which setCookies rejects
+        if param.get("expires", -1) <= 0:
+            param.pop("expires", None)
+        params.append(param)
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+
+
+def create_logged_in_driver():
+    """Launch a driver with the saved Google session already loaded"""
+    driver = create_driver()
+    mail_address = os.getenv('GMAIL_ADDRESS')
+    cookies = session_store.load(mail_address) if mail_address else None
+    if cookies:
+        try:
+            restore_cookies(driver, cookies)
+        except Exception as e:
+            logger.warning(f"Failed to restore saved Google session: {e}")
+    return driver
+
+
+browser_pool = BrowserPool(factory=create_logged_in_driver)
+
+spool = Spool()
+
+# Recordings are evicted from the spool once their upload is verified
+upload_manager = UploadManager(on_uploaded=spool.uploaded)
+
 
 def google_login(driver, mail_address: str, password: str):
     """Login to Google account"""
+    # Selenium is imported on first use, the API starts without it
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+
     try:
         # Google Account Login ---
-        driver.get("https://accounts.google.com/")
+        driver.get(config.get_google_login_url())
         
         # Input Gmail
         # Wait for email field and enter email
@@ -38,7 +106,7 @@ def google_login(driver, mail_address: str, password: str):
 
         # Wait for login to complete
         WebDriverWait(driver, 15).until(
-            EC.url_contains("myaccount.google.com")
+            EC.url_contains(config.get_google_account_url())
         )
         
         return True
@@ -46,30 +114,297 @@ def google_login(driver, mail_address: str, password: str):
         print(f"Login failed: {e}")
         return False
     
-def upload_to_drive(file_path: str, folder_name: str = "Meeting Recordings"):
-    """Upload file to Google Drive"""
+def join_meeting(driver, meeting_url: str):
+    """Open the meeting and click the join button"""
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+
+    driver.get(meeting_url)
+
+    # Wait for and click join button
+    join_btn = WebDriverWait(driver, 15).until(
+        EC.element_to_be_clickable((By.XPATH,
+            "//span[contains(text(),'Join now') or contains(text(),'Ask to join')]/ancestor::button"
+        ))
+    )
+    join_btn.click()
+
+
+def is_logged_in(driver):
+    """Check whether the browser holds a valid Google session"""
+    account_url = config.get_google_account_url()
+    driver.get(account_url)
+    # Signed-out browsers are redirected to the sign-in page, which may carry account_url in its query
+    expected, current = urlparse(account_url), urlparse(driver.current_url)
+    return current.netloc.lower() == expected.netloc.lower() and current.path.startswith(expected.path)
+
+
+def ensure_logged_in(driver, mail_address: str, password: str):
+    """Reuse the saved Google session, running the full login only when it is invalid"""
+    started = time.monotonic()
+    cookies = session_store.load(mail_address)
+    if cookies:
+        try:
+            restore_cookies(driver, cookies)
+            if is_logged_in(driver):
+                elapsed = time.monotonic() - started
+                session_store.record(True, elapsed)
+                logger.info(f"Reused saved Google session in {elapsed:.1f}s")
+                return True
+        except Exception as e:
+            logger.warning(f"Failed to validate saved Google session: {e}")
+        logger.info("Saved Google session is no longer valid")
+        session_store.invalidate(mail_address)
+
+    if not google_login(driver, mail_address, password):
+        return False
+
     try:
-        google_oauth = GoogleDriveOAuth()
-        
-        # Create or get folder
-        folder = google_oauth.create_folder(folder_name)
-        
+        session_store.save(mail_address, get_cookies(driver))
+    except Exception as e:
+        logger.warning(f"Failed to save Google session: {e}")
+
+    elapsed = time.monotonic() - started
+    session_store.record(False, elapsed)
+    logger.info(f"Logged in to Google in {elapsed:.1f}s")
+    return True
+
+async def upload_to_drive(file_path: str, folder_name: str = "Meeting Recordings", profile=None, on_progress=None):
+    """Upload file to Google Drive, retrying and resuming on the upload workers"""
+    try:
+        profile = profile or get_profile()
+
         # Generate timestamped filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        drive_filename = f"meeting_recording_{timestamp}.mp3"
-        
-        
-        folder_id = folder['id'] if folder else None
-        print(folder_id)
-        result = google_oauth.upload_file(file_path, folder_id=folder_id, file_name=drive_filename)
-        
-        return result
+        drive_filename = f"meeting_recording_{timestamp}{profile.extension}"
+
+        return await upload_manager.upload(file_path, folder_name, drive_filename, profile.mime_type, on_progress)
     except Exception as e:
         print(f"Upload error: {e}")
         return None
 
-async def record_meeting(meeting_url: str, duration_minutes: int, folder_name: str):
-    """Record a meeting session and upload to Google Drive"""
+async def stream_to_drive(output_file: str, duration_seconds: int, pulse_source: str, folder_name: str,
+                          profile, monitor: MeetingMonitor = None, on_progress=None, on_pcm=None):
+    """
+    Record and upload at the same time through a Drive resumable session
+
+    monitor, when given, can end the recording before duration_seconds, and
+    decides when it ends when duration_seconds is None.
+    on_progress receives ffmpeg's progress reports, on_pcm the PCM tap.
+
+    Returns:
+        tuple: (recording succeeded, Drive file metadata or None)
+    """
+    google_oauth = await run_io(get_drive)
+    with metrics.phase("create_folder"):
+        folder = await run_io(google_oauth.create_folder, folder_name)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    metadata = {'name': f"meeting_recording_{timestamp}{profile.extension}"}
+    if folder:
+        metadata['parents'] = [folder['id']]
+
+    upload = StreamingUpload(await run_io(get_authorized_session), metadata, profile.mime_type)
+    uploader = asyncio.create_task(upload.run())
+    try:
+        recording_success = await start_recording_async(output_file, duration_seconds, pulse_source,
+                                                        on_data=upload.feed, profile=profile,
+                                                        on_progress=on_progress, on_pcm=on_pcm,
+                                                        **_stop_signals(monitor))
+    except BaseException:
+        uploader.cancel()
+        raise
+
+    upload.finish()
+    try:
+        upload_result = await uploader
+    except Exception as e:
+        logger.error(f"Streaming upload failed: {e}")
+        upload_result = None
+    return recording_success, upload_result
+
+def new_speech_detector():
+    """A speech.SpeechDetector for a new recording, run on the I/O executor as it loads NumPy the first time"""
+    # Imported on first use, the API starts without NumPy
+    from speech import SpeechDetector
+    return SpeechDetector()
+
+async def trim_silence(output_file: str, profile, speech_index: dict) -> dict:
+    """
+    Cut a finished recording's silences in place, as set by TRIM_MIN_SILENCE_SECONDS and TRIM_PADDING_SECONDS
+
+    Returns:
+        dict: The speech index measured again on the trimmed recording, with the kept parts of the
+            original under "source_ranges", speech_index as it was when nothing was cut
+    """
+    # Loaded by new_speech_detector while recording
+    import speech
+
+    ranges = speech.keep_ranges(speech_index, config.get_trim_min_silence(), config.get_trim_padding())
+    kept = sum(end - start for start, end in ranges)
+    if not ranges or kept >= speech_index["duration_seconds"]:
+        return speech_index
+    copied = await run_cpu(postprocess.trim, output_file, profile.name, ranges)
+    logger.info(f"Trimmed {os.path.basename(output_file)} from {speech_index['duration_seconds']:.0f}s "
+                f"to {kept:.0f}s{'' if copied else ', re-encoded'}")
+    # Cuts on packet boundaries move the speech a little, measure it where it is now
+    trimmed = await run_cpu(postprocess.speech_index, output_file, speech_index["threshold_db"])
+    trimmed["source_ranges"] = ranges
+    return trimmed
+
+async def postprocess_recording(output_file: str, profile, normalize: bool = True, speech_index: dict = None) -> list:
+    """
+    Normalize a finished recording and derive its peaks and extra formats on the process pool
+
+    With speech_index, the speech segments found while recording, the
+    silences are cut first when TRIM_SILENCE is on, and the index is saved
+    next to the recording when SPEECH_INDEX is on. A step that fails is
+    logged and skipped, the recording is uploaded either way.
+
+    Args:
+        output_file (str): Recording in the spool
+        profile: encoding.EncodingProfile of the recording
+        normalize (bool): Normalize and trim in place, off when the recording was already streamed to Drive
+        speech_index (dict): speech.SpeechDetector index of the recording
+
+    Returns:
+        list: (path, Drive name suffix, MIME type) of every file to upload next to the recording
+    """
+    attachments = []
+    with metrics.phase("postprocess"):
+        if speech_index is not None:
+            # Loaded by new_speech_detector while recording
+            import speech
+            if normalize and config.get_trim_silence():
+                try:
+                    speech_index = await trim_silence(output_file, profile, speech_index)
+                except Exception as e:
+                    logger.warning(f"Trimming silence failed, uploading the recording untrimmed: {e}")
+            if config.get_speech_index():
+                try:
+                    attachments.append((await run_io(speech.write_index, output_file, speech_index),
+                                        ".speech.json", "application/json"))
+                except Exception as e:
+                    logger.warning(f"Saving the speech index failed: {e}")
+
+        if normalize and config.get_loudnorm():
+            try:
+                measured = await run_cpu(postprocess.normalize_loudness, output_file, profile.name,
+                                         config.get_loudnorm_target(), config.get_loudnorm_true_peak())
+                logger.info(f"Normalized {os.path.basename(output_file)} from {measured['input_i']} LUFS")
+            except Exception as e:
+                logger.warning(f"Loudness normalization failed, uploading the recording as captured: {e}")
+
+        # Derived from the normalized recording, in parallel on the free cores
+        steps = []
+        if config.get_waveform_peaks():
+            steps.append((run_cpu(postprocess.write_peaks, output_file, config.get_peaks_per_second()),
+                          ".peaks.json", "application/json"))
+        for name in config.get_extra_formats():
+            try:
+                extra = get_profile(name)
+            except ValueError as e:
+                logger.warning(f"Skipping extra format {name}: {e}")
+                continue
+            steps.append((run_cpu(postprocess.transcode, output_file, extra.name),
+                          f".{extra.name}{extra.extension}", extra.mime_type))
+        results = await asyncio.gather(*[step for step, _, _ in steps], return_exceptions=True)
+
+    for result, (_, suffix, mime_type) in zip(results, steps):
+        if isinstance(result, BaseException):
+            logger.warning(f"Post-processing into {suffix} failed: {result}")
+        else:
+            attachments.append((result, suffix, mime_type))
+    return attachments
+
+async def upload_attachments(attachments: list, folder_name: str, drive_name: str):
+    """Upload post-processing outputs next to the recording, named after its Drive file"""
+    stem = os.path.splitext(drive_name)[0]
+    for path, suffix, mime_type in attachments:
+        result = await upload_manager.upload(path, folder_name, f"{stem}{suffix}", mime_type)
+        if not result:
+            logger.warning(f"Failed to upload {os.path.basename(path)} next to {drive_name}")
+
+def _stop_signals(monitor: MeetingMonitor = None) -> dict:
+    """Recording arguments that let a MeetingMonitor end it early"""
+    if monitor is None:
+        return {}
+    return {"stop_event": monitor.stop_event, "on_silence": monitor.on_silence}
+
+async def open_audio_sink(driver, name: str):
+    """
+    Create a null sink for one job and start moving its browser's audio into it
+
+    Returns:
+        tuple: (JobAudioSink, routing task), or (None, None) to record the default source
+    """
+    if not config.get_audio_isolation():
+        return None, None
+
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if process is None:
+        logger.warning("Browser process unknown, recording the default audio source")
+        return None, None
+
+    sink = JobAudioSink(name)
+    try:
+        await run_io(sink.create)
+    except Exception as e:
+        logger.warning(f"Audio isolation unavailable, recording the default audio source: {e}")
+        return None, None
+    return sink, asyncio.create_task(sink.follow(process.pid))
+
+async def close_audio_sink(sink, follower):
+    """Stop routing and remove a job's null sink"""
+    if follower:
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+    if sink:
+        await run_io(sink.close)
+
+def recover_recordings():
+    """
+    Join and upload recordings whose segments were left behind by a crash
+
+    Returns:
+        int: Number of recordings recovered
+    """
+    recovered = 0
+    for recording in find_orphans():
+        logger.info(f"Recovering interrupted recording {recording.output_file}")
+        if not recording.finalize():
+            continue
+        timestamp = datetime.fromtimestamp(recording.created_at).strftime("%Y%m%d_%H%M%S")
+        upload_manager.submit(spool.finish(recording.output_file), recording.folder_name,
+                              f"meeting_recording_{timestamp}{recording.profile.extension}",
+                              recording.profile.mime_type)
+        recovered += 1
+    return recovered
+
+def meeting_id_from_url(meeting_url: str) -> str:
+    """Meeting code of a Meet URL, its last path segment without query or fragment"""
+    return urlparse(meeting_url.strip()).path.rstrip("/").split("/")[-1].lower()
+
+async def record_meeting(meeting_url: str, duration_minutes: int, folder_name: str, upload_mode: str = None,
+                         encoding_profile: str = None, on_progress=None, start_at: datetime = None,
+                         on_upload_progress=None, on_monitor=None, on_captured=None):
+    """
+    Record a meeting session and upload to Google Drive
+
+    on_progress, when given, receives ffmpeg's progress reports while recording,
+    and on_upload_progress the upload's progress after every chunk.
+    on_monitor receives the MeetingMonitor when recording starts, which can
+    extend the recording past duration_minutes.
+    on_captured is called once the meeting is captured and the browser
+    released, before post-processing and the upload.
+    With start_at the browser is leased and logged in straight away but the
+    meeting is only joined at that time.
+    """
+    upload_mode = upload_mode or config.get_upload_mode()
+    profile = get_profile(encoding_profile)
+    # Phase the job is in, counted as the failure reason if it fails
+    stage = "credentials"
     try:
         logger.info(f"Starting recording for meeting: {meeting_url}")
         
@@ -80,78 +415,165 @@ async def record_meeting(meeting_url: str, duration_minutes: int, folder_name: s
         if not mail_address or not password:
             raise Exception("Gmail credentials not found in environment variables")
         
-        opt = config.get_chrome_options()
-        
-        try:
-            opt.binary_location = "/usr/bin/chromium"
-            service = Service("/usr/bin/chromedriver")
-            driver = webdriver.Chrome(service=service, options=opt)
-        except Exception as e:
-            logger.warning(f"Failed to use chromium-browser, trying default: {e}")
-            # Fallback to default Chrome
-            driver = webdriver.Chrome(options=opt)
+        # Lease a warm browser, waiting on the browser executor if every driver is busy
+        stage = "browser"
+        pooled = await run_browser(browser_pool.lease)
+        driver = pooled.driver
+        healthy = True
+
+        audio_sink = None
+        audio_follower = None
+        watcher = None
+        segments = None
+        capture = None
 
         try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            meeting_id = meeting_id_from_url(meeting_url)
+
             # Login to Google
             logger.info("Logging in to Google account")
-            if not google_login(driver, mail_address, password):
+            stage = "login"
+            with metrics.phase("login"):
+                logged_in = await run_browser(ensure_logged_in, driver, mail_address, password)
+            if not logged_in:
                 raise Exception("Failed to login to Google account")
             
+            # Route this browser's audio into a sink of its own before it joins
+            stage = "audio_sink"
+            audio_sink, audio_follower = await open_audio_sink(driver, f"{meeting_id}_{timestamp}")
+
+            if start_at:
+                delay = (start_at - datetime.now(start_at.tzinfo)).total_seconds()
+                if delay > 0:
+                    logger.info(f"Logged in, joining in {delay:.0f}s at {start_at.isoformat()}")
+                    await asyncio.sleep(delay)
+
             # Navigate to meeting
             logger.info("Joining meeting")
-            driver.get(meeting_url)
-            
-            # Wait for and click join button
-            join_btn = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.XPATH,
-                    "//span[contains(text(),'Join now') or contains(text(),'Ask to join')]/ancestor::button"
-                ))
-            )
-            join_btn.click()
+            stage = "join"
+            with metrics.phase("join"):
+                await run_browser(join_meeting, driver, meeting_url)
             
             # Start recording
             logger.info("Starting recording")
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            meeting_id = meeting_url.split("/")[-1]
-
-            output_file = f"{meeting_id}_{timestamp}.mp3"
+            output_file = spool.capture_path(f"{meeting_id}_{timestamp}{profile.extension}")
             duration_seconds = duration_minutes * 60
+            pulse_source = audio_sink.monitor if audio_sink else "default"
+
+            # Ends the recording after duration_minutes, or before once the meeting is over
+            monitor = MeetingMonitor(driver, duration_seconds)
+            if on_monitor:
+                on_monitor(monitor)
+            watcher = asyncio.create_task(monitor.watch())
+
+            stage = "recording"
+            # Trimming cuts by the speech index, it needs the tap even when the index is not uploaded
+            analyse = config.get_speech_index() or config.get_trim_silence()
+            speech_detector = await run_io(new_speech_detector) if analyse else None
+            on_pcm = speech_detector.feed if speech_detector else None
+            if upload_mode != "stream" and config.get_segment_seconds():
+                segments = SegmentedRecording(output_file, profile, folder_name)
+                await run_io(segments.start)
+            capture = segments.directory if segments else output_file
+            await run_io(spool.reserve, capture, profile.estimate_bytes(duration_seconds))
+            # No fixed limit for ffmpeg, the monitor ends the recording so it can be extended
+            try:
+                if upload_mode == "stream":
+                    logger.info("Streaming recording to Google Drive")
+                    with metrics.phase("recording"), metrics.ACTIVE_RECORDINGS.track_inprogress():
+                        recording_success, upload_result = await stream_to_drive(
+                            output_file, None, pulse_source, folder_name, profile, monitor,
+                            on_progress, on_pcm)
+                else:
+                    with metrics.phase("recording"), metrics.ACTIVE_RECORDINGS.track_inprogress():
+                        recording_success = await start_recording_async(output_file, None, pulse_source,
+                                                                        profile=profile, segments=segments,
+                                                                        on_progress=on_progress, on_pcm=on_pcm,
+                                                                        **_stop_signals(monitor))
+            finally:
+                watcher.cancel()
+                await asyncio.gather(watcher, return_exceptions=True)
+                await close_audio_sink(audio_sink, audio_follower)
+                audio_sink = None
+
+            if monitor.reason:
+                logger.info(f"Recording ended early: {monitor.reason}")
 
-            recording_success = await start_recording_async(output_file, duration_seconds)
+            if segments and recording_success:
+                stage = "finalize"
+                recording_success = await run_io(segments.finalize)
+            spool.release(capture)
+            output_file = await run_io(spool.finish, output_file)
+
+            # The browser is not needed for the upload, hand it to the next job
+            await run_browser(browser_pool.release, pooled, healthy)
+            pooled = None
+            if on_captured:
+                on_captured()
 
             if recording_success:
-                logger.info("Recording completed, uploading to Google Drive")
-                
-                upload_result = upload_to_drive(output_file, folder_name)
-                
+                # A stream Drive did not take is uploaded from its local copy like a file
+                streamed = upload_mode == "stream" and bool(upload_result)
+                if upload_mode == "stream" and not streamed:
+                    logger.warning("Streaming upload failed, uploading the recorded file instead")
+
+                stage = "postprocess"
+                attachments = await postprocess_recording(
+                    output_file, profile, normalize=not streamed,
+                    speech_index=speech_detector.index() if speech_detector else None)
+
+                stage = "upload"
+                if not streamed:
+                    logger.info("Recording completed, uploading to Google Drive")
+                    upload_result = await upload_to_drive(output_file, folder_name, profile, on_upload_progress)
+                else:
+                    await run_io(spool.uploaded, output_file, upload_result)
+
                 if upload_result:
                     logger.info("Upload completed successfully")
+                    await upload_attachments(attachments, folder_name,
+                                             upload_result.get("name") or os.path.basename(output_file))
                     return {
                         "success": True,
-                        "recording_file": output_file,
+                        "recording_file": os.path.basename(output_file),
                         "drive_link": upload_result.get('webViewLink'),
                         "message": "Recording completed and uploaded to Google Drive"
                     }
                 else:
+                    metrics.record_failure(stage)
                     return {
                         "success": False,
-                        "recording_file": output_file,
+                        "recording_file": os.path.basename(output_file),
                         "drive_link": None,
                         "message": "Recording completed but failed to upload to Google Drive"
                     }
             else:
+                metrics.record_failure(stage)
                 return {
                     "success": False,
                     "recording_file": None,
                     "drive_link": None,
                     "message": "Recording failed"
                 }
-                
+
+        except Exception:
+            if pooled:
+                healthy = await run_browser(browser_pool.is_healthy, pooled)
+            raise
         finally:
-            driver.quit()
+            if watcher:
+                watcher.cancel()
+            if audio_sink:
+                await close_audio_sink(audio_sink, audio_follower)
+            if capture:
+                spool.release(capture)
+            if pooled:
+                await run_browser(browser_pool.release, pooled, healthy)
             
     except Exception as e:
         logger.error(f"Recording failed: {str(e)}")
+        metrics.record_failure(stage)
         return {
             "success": False,
             "recording_file": None,
@@ -0,0 +1,472 @@
+import json
+import math
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+logger = config.get_logger()
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+# Columns holding JSON documents
+JSON_COLUMNS = ("progress", "upload")
+
+# Plain SQL for SQLite and Postgres both, times are DOUBLE PRECISION as Postgres' REAL is single precision
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        meeting_url TEXT NOT NULL,
+        duration_minutes INTEGER NOT NULL,
+        folder_name TEXT,
+        upload_mode TEXT,
+        encoding_profile TEXT,
+        start_at TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        message TEXT,
+        recording_file TEXT,
+        drive_link TEXT,
+        progress TEXT,
+        upload TEXT,
+        available_at DOUBLE PRECISION NOT NULL,
+        start_ts DOUBLE PRECISION,
+        deadline DOUBLE PRECISION,
+        node_id TEXT,
+        lease_expires DOUBLE PRECISION,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        meeting_key TEXT,
+        window_start DOUBLE PRECISION,
+        window_end DOUBLE PRECISION,
+        requests INTEGER NOT NULL DEFAULT 1
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, available_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_node ON jobs (node_id, status)",
+    """CREATE TABLE IF NOT EXISTS nodes (
+        node_id TEXT PRIMARY KEY,
+        capacity INTEGER NOT NULL,
+        running INTEGER NOT NULL,
+        started_at TEXT NOT NULL,
+        heartbeat_at DOUBLE PRECISION NOT NULL
+    )""",
+)
+
+# Columns added since the first schema, applied to existing stores
+MIGRATIONS = (
+    "ALTER TABLE jobs ADD COLUMN meeting_key TEXT",
+    "ALTER TABLE jobs ADD COLUMN window_start DOUBLE PRECISION",
+    "ALTER TABLE jobs ADD COLUMN window_end DOUBLE PRECISION",
+    "ALTER TABLE jobs ADD COLUMN requests INTEGER NOT NULL DEFAULT 1",
+    "CREATE INDEX IF NOT EXISTS jobs_meeting ON jobs (meeting_key, status)",
+    "ALTER TABLE jobs ADD COLUMN captured_at DOUBLE PRECISION",
+)
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+def open_job_store(url: str = None) -> "JobStore":
+    """
+    Open the job store at JOB_STORE_URL, the SQLite file at JOB_STORE_PATH when it is unset
+
+    Args:
+        url (str): postgresql:// DSN of a store shared by nodes on any host
+
+    Raises:
+        ValueError: For a URL of another database
+    """
+    url = url or config.get_job_store_url()
+    if not url:
+        return SQLiteJobStore()
+    if url.startswith(("postgresql://", "postgres://")):
+        # Imported on first use, psycopg is only needed for a Postgres store
+        from job_store_postgres import PostgresJobStore
+        return PostgresJobStore(url)
+    raise ValueError(f"Unsupported job store URL {url.split(':', 1)[0]}://, use a postgresql:// DSN")
+
+
+class JobStore:
+    """
+    Jobs and recorder nodes in a database shared by every node
+
+    Nodes claim queued jobs with a lease that their heartbeats renew and
+    release their leases when they stop. A job whose lease runs out, because
+    its node crashed or hung, is claimed again by any node, up to
+    JOB_MAX_ATTEMPTS times and only while its meeting is still on, and
+    reaped as failed otherwise. Every call is a short transaction, run them
+    on the I/O executor.
+
+    The statements are plain SQL that SQLite and Postgres both run, with ?
+    placeholders and rows read by column name. A backend supplies the
+    connections and transactions and how rows are locked, see SQLiteJobStore
+    and job_store_postgres.PostgresJobStore.
+    """
+
+    # Appended to selects of rows the transaction goes on to update
+    ROW_LOCK = ""
+    # Appended to selects of jobs to claim or reap, so concurrent claims pass over each other's rows
+    CLAIM_LOCK = ""
+
+    def __init__(self, lease_seconds: float = None, max_attempts: int = None):
+        """
+        Args:
+            lease_seconds (float): Seconds a claim lasts without a heartbeat
+            max_attempts (int): Claims of one job before it fails
+        """
+        self.lease_seconds = lease_seconds or config.get_job_lease_seconds()
+        self.max_attempts = max_attempts or config.get_job_max_attempts()
+
+    @contextmanager
+    def _connect(self):
+        """A connection whose execute(statement, params) returns a cursor of rows read by column name"""
+        raise NotImplementedError
+
+    @contextmanager
+    def _transaction(self):
+        """A connection in a transaction, committed when the block ends and rolled back when it raises"""
+        raise NotImplementedError
+
+    def _migrate(self, db, statement: str):
+        """Apply one of MIGRATIONS, ignoring a column that exists already"""
+        raise NotImplementedError
+
+    def _lock_meeting(self, db, meeting_key: str):
+        """Hold off other submits for the same meeting until the transaction ends"""
+
+    def _create_schema(self, db):
+        for statement in SCHEMA:
+            db.execute(statement)
+        for statement in MIGRATIONS:
+            self._migrate(db, statement)
+
+    @staticmethod
+    def _decode(row) -> dict:
+        record = dict(row)
+        for column in JSON_COLUMNS:
+            if record.get(column):
+                record[column] = json.loads(record[column])
+        return record
+
+    @staticmethod
+    def _encode(fields: dict) -> dict:
+        return {key: json.dumps(value) if key in JSON_COLUMNS and value is not None else value
+                for key, value in fields.items()}
+
+    def _insert(self, db, record: dict):
+        record = self._encode(record)
+        columns = ", ".join(record)
+        placeholders = ", ".join("?" for _ in record)
+        db.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(record.values()))
+
+    def submit(self, record: dict):
+        """
+        Add a job, or attach it to an unfinished job recording the same meeting at an overlapping time
+
+        The job attached to records until the later of both ends. A queued
+        job also starts at the earlier of both starts.
+
+        Args:
+            record (dict): Columns of the new job, with meeting_key, window_start and window_end
+
+        Returns:
+            tuple: (the job that will record the meeting, True when the request was attached to it)
+        """
+        with self._transaction() as db:
+            self._lock_meeting(db, record["meeting_key"])
+            row = self._attachable(db, record, self.ROW_LOCK)
+            if row is None:
+                self._insert(db, record)
+                return record, False
+
+            fields = {"requests": row["requests"] + 1}
+            window_start, window_end = row["window_start"], max(row["window_end"], record["window_end"])
+            if row["status"] == QUEUED and record["window_start"] < window_start:
+                window_start = record["window_start"]
+                fields.update(start_at=record["start_at"], start_ts=record["start_ts"],
+                              available_at=record["available_at"], window_start=window_start)
+            if window_end > row["window_end"]:
+                fields["window_end"] = window_end
+                if row["deadline"]:
+                    fields["deadline"] = row["deadline"] + window_end - row["window_end"]
+            duration_minutes = math.ceil(round(window_end - window_start) / 60)
+            if duration_minutes > row["duration_minutes"]:
+                fields["duration_minutes"] = duration_minutes
+
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            db.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), row["job_id"]))
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        return self._decode(row), True
+
+    def _attachable(self, db, record: dict, lock: str = ""):
+        """
+        The unfinished job a new job for the same meeting would attach to
+
+        A job whose recording already stopped, early or not, could not
+        record any longer, so it is left out even while it is still
+        post-processing or uploading.
+        """
+        return db.execute(
+            "SELECT * FROM jobs WHERE meeting_key = ? AND status IN (?, ?) AND window_start < ? AND window_end > ? "
+            f"AND captured_at IS NULL ORDER BY window_start LIMIT 1{lock}",
+            (record["meeting_key"], QUEUED, RUNNING, record["window_end"], record["window_start"])).fetchone()
+
+    def backlog(self, record: dict, now: float = None) -> tuple:
+        """
+        What a new job would wait behind, for admission control
+
+        Args:
+            record (dict): Columns of the new job, as passed to submit
+
+        Returns:
+            tuple: (whether it would attach to an unfinished job,
+                    queued jobs due now that start no later than it,
+                    sorted epoch times at which the running meetings end)
+        """
+        now = now or time.time()
+        with self._connect() as db:
+            attached = self._attachable(db, record) is not None
+            ahead = db.execute(
+                "SELECT COUNT(*) AS ahead FROM jobs WHERE status = ? AND available_at <= ? "
+                "AND COALESCE(window_start, available_at) <= ?",
+                (QUEUED, now, record["window_start"])).fetchone()["ahead"]
+            deadlines = [row["deadline"] for row in db.execute(
+                "SELECT deadline FROM jobs WHERE status = ? AND deadline IS NOT NULL ORDER BY deadline",
+                (RUNNING,)).fetchall()]
+        return attached, ahead, deadlines
+
+    def get(self, job_id: str):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def list(self) -> list:
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM jobs ORDER BY created_at").fetchall()
+        return [self._decode(row) for row in rows]
+
+    def claim(self, node_id: str, now: float = None):
+        """
+        Lease the next claimable job to a node, after reaping the jobs of lost nodes
+
+        Queued jobs are claimable from their available_at time, running jobs
+        once their lease has run out. The job whose meeting starts first is
+        claimed first, so a meeting starting now goes before one scheduled
+        for later that is already in its pre-warm lead.
+
+        Returns:
+            dict: The claimed job, None when there is nothing to claim
+        """
+        now = now or time.time()
+        with self._transaction() as db:
+            self._reap(db, now)
+            row = db.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?) "
+                f"ORDER BY COALESCE(window_start, available_at) LIMIT 1{self.CLAIM_LOCK}",
+                (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            # The meeting ends at the same time however often the job is claimed
+            deadline = row["deadline"] or max(row["start_ts"] or now, now) + row["duration_minutes"] * 60
+            db.execute(
+                "UPDATE jobs SET status = ?, node_id = ?, lease_expires = ?, attempts = attempts + 1, deadline = ?, "
+                "started_at = ?, progress = NULL, upload = NULL, captured_at = NULL WHERE job_id = ?",
+                (RUNNING, node_id, now + self.lease_seconds, deadline, _iso(now), row["job_id"]))
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        return self._decode(row)
+
+    def reap(self, now: float = None) -> int:
+        """
+        Fail the jobs of lost nodes once their meeting is over or they ran out of attempts
+
+        claim reaps first, call this to reap without claiming.
+
+        Returns:
+            int: Number of jobs failed
+        """
+        with self._transaction() as db:
+            return self._reap(db, now or time.time())
+
+    def _reap(self, db, now: float) -> int:
+        cursor = db.execute(
+            "UPDATE jobs SET status = ?, message = ?, finished_at = ?, node_id = NULL WHERE job_id IN ("
+            "SELECT job_id FROM jobs WHERE status = ? AND lease_expires < ? AND (attempts >= ? OR deadline < ?)"
+            f"{self.CLAIM_LOCK})",
+            (FAILED, "Recording failed: recorder node lost", _iso(now), RUNNING, now, self.max_attempts, now))
+        return cursor.rowcount
+
+    def update(self, job_id: str, node_id: str, fields: dict) -> bool:
+        """
+        Update a job leased to node_id
+
+        Returns:
+            bool: False when the node no longer holds the job
+        """
+        fields = self._encode(fields)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._transaction() as db:
+            cursor = db.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ? AND node_id = ? AND status = ?",
+                (*fields.values(), job_id, node_id, RUNNING))
+        return cursor.rowcount > 0
+
+    def cancel(self, job_id: str, now: float = None):
+        """
+        Withdraw one request for a job that is queued or waiting for its start time
+
+        The job is only cancelled once every request attached to it is withdrawn.
+
+        Returns:
+            str: CANCELLED, or QUEUED/RUNNING when other requests keep the job, None when it cannot be cancelled
+        """
+        now = now or time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT status, requests FROM jobs WHERE job_id = ? AND (status = ? OR (status = ? AND start_ts > ?))"
+                f"{self.ROW_LOCK}",
+                (job_id, QUEUED, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            if row["requests"] > 1:
+                db.execute("UPDATE jobs SET requests = requests - 1 WHERE job_id = ?", (job_id,))
+                return row["status"]
+            db.execute("UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE job_id = ?",
+                       (CANCELLED, "Cancelled", _iso(now), job_id))
+        return CANCELLED
+
+    def heartbeat(self, node_id: str, capacity: int, running: dict, now: float = None) -> tuple:
+        """
+        Renew the leases of a node's running jobs and advertise its capacity
+
+        Args:
+            node_id (str): Node sending the heartbeat
+            capacity (int): Jobs the node runs at once
+            running (dict): Columns to save per job ID the node is running, such as progress
+
+        Returns:
+            tuple: (IDs of jobs the node no longer holds, cancelled or claimed by another node,
+                    duration_minutes per job ID it still holds, which grows when requests are attached)
+        """
+        now = now or time.time()
+        lost = []
+        with self._transaction() as db:
+            for job_id, fields in running.items():
+                fields = {**self._encode(fields), "lease_expires": now + self.lease_seconds}
+                assignments = ", ".join(f"{column} = ?" for column in fields)
+                cursor = db.execute(
+                    f"UPDATE jobs SET {assignments} WHERE job_id = ? AND node_id = ? AND status = ?",
+                    (*fields.values(), job_id, node_id, RUNNING))
+                if cursor.rowcount == 0:
+                    lost.append(job_id)
+            durations = {row["job_id"]: row["duration_minutes"] for row in db.execute(
+                "SELECT job_id, duration_minutes FROM jobs WHERE node_id = ? AND status = ?",
+                (node_id, RUNNING)).fetchall()}
+            # Only the node itself writes its row, so an update or else an insert needs no upsert
+            cursor = db.execute("UPDATE nodes SET capacity = ?, running = ?, heartbeat_at = ? WHERE node_id = ?",
+                                (capacity, len(running), now, node_id))
+            if cursor.rowcount == 0:
+                db.execute(
+                    "INSERT INTO nodes (node_id, capacity, running, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+                    (node_id, capacity, len(running), _iso(now), now))
+        return lost, durations
+
+    def release(self, node_id: str, message: str):
+        """End the leases of a node's running jobs so other nodes claim them right away"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = 0, message = ? WHERE node_id = ? AND status = ?",
+                (message, node_id, RUNNING))
+            db.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+        if cursor.rowcount:
+            logger.info(f"Released {cursor.rowcount} job(s) of node {node_id}")
+
+    def nodes(self, now: float = None) -> list:
+        """Every node that sent a heartbeat, with its free capacity"""
+        now = now or time.time()
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM nodes ORDER BY node_id").fetchall()
+        return [{
+            "node_id": row["node_id"],
+            "capacity": row["capacity"],
+            "running": row["running"],
+            "free": max(0, row["capacity"] - row["running"]),
+            "started_at": row["started_at"],
+            "heartbeat_at": _iso(row["heartbeat_at"]),
+            "alive": row["heartbeat_at"] >= now - self.lease_seconds,
+        } for row in rows]
+
+    def prune(self, limit: int):
+        """Keep only the newest limit finished jobs"""
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ("
+                "SELECT finished_at FROM jobs WHERE status IN (?, ?, ?) "
+                "ORDER BY finished_at DESC LIMIT 1 OFFSET ?)",
+                (*FINISHED, *FINISHED, limit - 1))
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a SQLite file, for recorder nodes on one host and for tests
+
+    The nodes must run on the same host: SQLite's WAL mode keeps its index
+    in shared memory next to the file, and file locks over NFS or other
+    network filesystems are not reliable, so nodes on different hosts could
+    corrupt the store or claim one job twice. Every transaction takes the
+    write lock up front, so claims and submits run one at a time.
+    """
+
+    def __init__(self, path: str = None, lease_seconds: float = None, max_attempts: int = None):
+        """
+        Args:
+            path (str): SQLite database file
+            lease_seconds (float): Seconds a claim lasts without a heartbeat
+            max_attempts (int): Claims of one job before it fails
+        """
+        super().__init__(lease_seconds, max_attempts)
+        self.path = path or config.get_job_store_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            # Readers do not wait for writers, several nodes poll the same file
+            db.execute("PRAGMA journal_mode=WAL")
+            self._create_schema(db)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as db:
+            # Take the write lock up front so two nodes never claim the same job
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _migrate(self, db, statement: str):
+        try:
+            db.execute(statement)
+        except sqlite3.OperationalError:
+            # The column exists already
+            pass
@@ -0,0 +1,555 @@
+import asyncio
+import math
+import random
+import time
+import uuid
+from datetime import datetime
+
+import config
+
+from google_meet import record_meeting, meeting_id_from_url, spool as recorder_spool
+
+from encoding import get_profile
+
+from executors import run_io
+
+from job_store import JobStore, open_job_store, QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED, FINISHED
+
+from admission import AdmissionController, AdmissionError
+
+from spool import Spool
+
+logger = config.get_logger()
+
+UPLOAD_MODES = ("file", "stream")
+
+
+class Job:
+    """A single recording request and its outcome"""
+
+    def __init__(self, meeting_url: str, duration_minutes: int, folder_name: str, upload_mode: str,
+                 encoding_profile: str, start_at: datetime = None):
+        self.job_id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.meeting_url = meeting_url
+        self.duration_minutes = duration_minutes
+        self.folder_name = folder_name
+        self.upload_mode = upload_mode
+        self.encoding_profile = encoding_profile
+        self.start_at = start_at
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.message = "Waiting for a free recorder"
+        self.recording_file = None
+        self.drive_link = None
+        self.progress = None
+        self.upload = None
+        self.node_id = None
+        self.attempts = 0
+        # Requests attached to this job, see JobQueue.submit
+        self.requests = 1
+        # Epoch time the meeting ends, set when the job is first claimed
+        self.deadline = None
+        # Replaced on every change, watchers wait on the one they saw last
+        self.changed = asyncio.Event()
+        self.task = None
+        # Set once this node no longer owns the job, its result is not saved
+        self.released = False
+        # Set once the meeting is captured, the job then no longer holds a worker
+        self.captured = False
+        # Set once the recording stopped, saved as captured_at so no request attaches to the job any more
+        self.capture_ended = False
+        self.capture_tasks = []
+        self.monitor = None
+        # Seconds the job was extended by before its recording started
+        self.extension = 0
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        """Build a job from its row in the job store"""
+        start_at = datetime.fromisoformat(record["start_at"]) if record["start_at"] else None
+        job = cls(record["meeting_url"], record["duration_minutes"], record["folder_name"], record["upload_mode"],
+                  record["encoding_profile"], start_at)
+        for field in ("job_id", "status", "created_at", "started_at", "finished_at", "message", "recording_file",
+                      "drive_link", "progress", "upload", "node_id", "attempts", "deadline", "requests"):
+            setattr(job, field, record[field])
+        return job
+
+    def to_record(self) -> dict:
+        """Columns of a new job in the job store"""
+        record = {key: value for key, value in self.to_dict().items()
+                  if key not in ("node_id", "attempts", "requests")}
+        start_ts = self.start_at.timestamp() if self.start_at else None
+        # Jobs with a start time are claimed PREWARM_LEAD_SECONDS before it
+        record["available_at"] = start_ts - config.get_prewarm_lead_seconds() if start_ts else time.time()
+        record["start_ts"] = start_ts
+        # Requests for the same meeting at overlapping times share one job
+        record["meeting_key"] = meeting_id_from_url(self.meeting_url)
+        record["window_start"] = start_ts or time.time()
+        record["window_end"] = record["window_start"] + self.duration_minutes * 60
+        return record
+
+    def remaining_minutes(self) -> int:
+        """Minutes left to record, less than duration_minutes when the job is claimed again late"""
+        if not self.deadline:
+            return self.duration_minutes
+        start = max(time.time(), self.start_at.timestamp() if self.start_at else 0)
+        return max(1, min(self.duration_minutes, math.ceil((self.deadline - start) / 60)))
+
+    def touch(self):
+        """Wake everything watching this job"""
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "meeting_url": self.meeting_url,
+            "duration_minutes": self.duration_minutes,
+            "folder_name": self.folder_name,
+            "upload_mode": self.upload_mode,
+            "encoding_profile": self.encoding_profile,
+            "start_at": self.start_at.isoformat() if self.start_at else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "message": self.message,
+            "recording_file": self.recording_file,
+            "drive_link": self.drive_link,
+            "progress": self.progress,
+            "upload": self.upload,
+            "node_id": self.node_id,
+            "attempts": self.attempts,
+            "requests": self.requests,
+        }
+
+
+class JobQueue:
+    """
+    Recording jobs in the shared job store, run by this node's workers
+
+    Submitted jobs are written to the store and claimed by whichever node
+    sharing the job store has a free worker, see JobStore. The jobs this node
+    runs are kept in memory for live progress, and a heartbeat renews their
+    leases and advertises the node's free workers. Nodes with fewer free
+    workers than their peers poll less often, so new jobs spread over the
+    cluster without a coordinator. A worker only counts as free while the
+    node's memory and CPU have room for another recording, see
+    AdmissionController. A job frees its worker once the meeting is
+    captured, post-processing and the upload go on without one.
+    """
+
+    def __init__(self, worker_count: int = None, history_limit: int = None, store: JobStore = None,
+                 node_id: str = None, admission: AdmissionController = None, spool: Spool = None):
+        """
+        Args:
+            worker_count (int): Number of recordings allowed to run at once on this node
+            history_limit (int): Number of finished jobs kept for lookups
+            store (JobStore): Shared job store, opened from config on start when omitted
+            node_id (str): Name of this node in the store
+            admission (AdmissionController): Resource checks, from config when omitted
+            spool (Spool): Local storage checked for room before admitting a job, the recorder's when omitted
+        """
+        self.worker_count = worker_count or config.get_worker_count()
+        self.history_limit = history_limit or config.get_job_history_limit()
+        self.node_id = node_id or config.get_node_id()
+        self.poll_interval = config.get_job_poll_interval()
+        self.heartbeat_interval = config.get_job_heartbeat_interval()
+        self._store = store
+        if admission is None and config.get_admission_control():
+            admission = AdmissionController()
+        self.admission = admission
+        self.spool = spool or recorder_spool
+        # Jobs running on this node
+        self.running = {}
+        self._peer_free = 0
+        self._wake = None
+        self._tasks = []
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = open_job_store()
+        return self._store
+
+    def start(self):
+        """Start claiming jobs and sending heartbeats on the running event loop"""
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._claim_loop()), asyncio.create_task(self._heartbeat_loop())]
+        logger.info(f"Node {self.node_id} started {self.worker_count} recording workers")
+
+    async def stop(self):
+        """Stop the running jobs and hand their leases back to the other nodes"""
+        jobs = list(self.running.values())
+        for task in self._tasks + [job.task for job in jobs]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *[job.task for job in jobs], return_exceptions=True)
+        self._tasks = []
+        await run_io(self.store.release, self.node_id, "Recorder node stopped, waiting for another node")
+
+    def capturing(self) -> int:
+        """Jobs on this node that hold a worker, those still joining or recording their meeting"""
+        return sum(1 for job in self.running.values() if not job.captured)
+
+    def free_workers(self) -> int:
+        """Jobs this node can start now, limited by its workers and its memory and CPU"""
+        free = self.worker_count - self.capturing()
+        if self.admission is not None:
+            free = min(free, self.admission.headroom())
+        return max(0, free)
+
+    async def submit(self, meeting_url: str, duration_minutes: int, folder_name: str, upload_mode: str = None,
+                     encoding_profile: str = None, start_at: datetime = None, admit: bool = True) -> Job:
+        """
+        Queue a recording and return its job without waiting for it
+
+        A job with start_at is claimed PREWARM_LEAD_SECONDS before that time,
+        so the browser is logged in when the meeting starts.
+
+        Args:
+            admit (bool): Refuse the job when it cannot start in time or the spool has no room for it,
+                see AdmissionController.check and Spool.check
+
+        Raises:
+            ValueError: For invalid arguments
+            AdmissionError: When admit is set and the job was refused
+        """
+        upload_mode = upload_mode or config.get_upload_mode()
+        profile = get_profile(encoding_profile)
+        if not meeting_url or not meeting_url.strip():
+            raise ValueError("meeting_url must not be empty")
+        if duration_minutes <= 0:
+            raise ValueError("duration_minutes must be positive")
+        if upload_mode not in UPLOAD_MODES:
+            raise ValueError(f"upload_mode must be one of: {', '.join(UPLOAD_MODES)}")
+
+        job = Job(meeting_url.strip(), duration_minutes, folder_name, upload_mode, profile.name, start_at)
+        record = job.to_record()
+        if admit:
+            await self._admit(record)
+        record, attached = await run_io(self.store.submit, record)
+        if attached:
+            logger.info(f"Attached request for {job.meeting_url} to job {record['job_id']}, "
+                        f"{record['requests']} requests, {record['duration_minutes']} minutes")
+            local = self.running.get(record["job_id"])
+            if local is None:
+                # Queued, or running on another node which extends it on its next heartbeat
+                return Job.from_record(record)
+            local.requests = record["requests"]
+            self._extend(local, record["duration_minutes"])
+            return local
+
+        # Leave it to a node with more free workers when there is one
+        if self._wake is not None and self._peer_free <= self.free_workers():
+            self._wake.set()
+        logger.info(f"Queued job {job.job_id} for meeting: {job.meeting_url}")
+        return job
+
+    async def _admit(self, record: dict):
+        attached, ahead, deadlines = await run_io(self.store.backlog, record)
+        if attached:
+            # Costs nothing, the meeting is recorded anyway
+            return
+        try:
+            profile = get_profile(record["encoding_profile"])
+            await run_io(self.spool.check, profile.estimate_bytes(record["duration_minutes"] * 60))
+            if self.admission is not None:
+                nodes = await run_io(self.store.nodes)
+                free = self.free_workers() + sum(n["free"] for n in nodes
+                                                 if n["alive"] and n["node_id"] != self.node_id)
+                self.admission.check(record["available_at"] <= time.time(), ahead, free, deadlines)
+        except AdmissionError as e:
+            logger.warning(f"Refused recording of {record['meeting_url']}: {e}")
+            raise
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Withdraw a request for a job that has not started capturing audio yet, on any node
+
+        A job with several requests attached keeps running for the others.
+
+        Returns:
+            bool: True when the request was withdrawn
+        """
+        status = await run_io(self.store.cancel, job_id)
+        if status is None:
+            return False
+        job = self.running.get(job_id)
+        if status != CANCELLED:
+            if job is not None:
+                job.requests -= 1
+                job.touch()
+            logger.info(f"Withdrew a request for job {job_id}, others still want it")
+            return True
+        if job is not None:
+            self._drop(job, CANCELLED, "Cancelled")
+        # Other nodes notice on their next heartbeat
+        logger.info(f"Cancelled job {job_id}")
+        return True
+
+    async def get(self, job_id: str):
+        job = self.running.get(job_id)
+        if job is not None:
+            return job
+        record = await run_io(self.store.get, job_id)
+        return Job.from_record(record) if record else None
+
+    async def list(self):
+        records = await run_io(self.store.list)
+        return [self.running.get(record["job_id"]) or Job.from_record(record) for record in records]
+
+    async def nodes(self):
+        """Every recorder node sharing the job store and its free workers"""
+        return await run_io(self.store.nodes)
+
+    async def watch(self, job_id: str, keepalive: float = None):
+        """
+        Yield the job's state whenever it changes, until the job finishes
+
+        Jobs running on this node are followed live, others through the store.
+
+        Args:
+            job_id (str): Job to watch
+            keepalive (float): Seconds without a change after which None is yielded
+        """
+        # The event is taken before each state is read, a change made while the
+        # consumer handles that state then wakes the next wait instead of being missed
+        local = self.running.get(job_id)
+        changed = local.changed if local is not None else None
+        job = await self.get(job_id)
+        if job is None:
+            return
+        state = job.to_dict()
+        yield state
+        quiet = 0.0
+        while state["status"] not in FINISHED:
+            current = self.running.get(job_id)
+            if current is not None:
+                if current is not local:
+                    # Claimed by this node since the last state, catch up before waiting on it
+                    local, changed = current, current.changed
+                    if current.to_dict() != state:
+                        state = current.to_dict()
+                        yield state
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                changed = local.changed
+                state = local.to_dict()
+                yield state
+                continue
+            local = None
+
+            await asyncio.sleep(self.poll_interval)
+            job = await self.get(job_id)
+            if job is None:
+                return
+            if job.to_dict() != state:
+                state = job.to_dict()
+                quiet = 0.0
+                yield state
+            else:
+                quiet += self.poll_interval
+                if keepalive and quiet >= keepalive:
+                    quiet = 0.0
+                    yield None
+
+    async def _claim_loop(self):
+        # Jobs this node held before a restart are claimed again right away
+        await run_io(self.store.release, self.node_id, "Recorder node restarted, waiting for a free recorder")
+        while True:
+            self._wake.clear()
+            try:
+                while self.free_workers() > 0:
+                    record = await run_io(self.store.claim, self.node_id)
+                    if record is None:
+                        break
+                    self._start(Job.from_record(record))
+            except Exception as e:
+                logger.warning(f"Failed to claim jobs from the job store: {e}")
+            # Nodes with more free workers poll sooner, jitter keeps nodes from polling in step
+            timeout = self.poll_interval * random.uniform(0.5, 1.0)
+            if self._peer_free > self.free_workers():
+                timeout *= 2
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                logger.warning(f"Job store heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _heartbeat(self):
+        running = {
+            job.job_id: {"message": job.message, "progress": job.progress, "upload": job.upload}
+            for job in self.running.values() if job.status == RUNNING and not job.released
+        }
+        if self.admission is not None:
+            await run_io(self.admission.sample, self.capturing())
+        # Free workers are advertised as limited by memory and CPU
+        capacity = len(running) + self.free_workers()
+        lost, durations = await run_io(self.store.heartbeat, self.node_id, capacity, running)
+        for job_id, duration_minutes in durations.items():
+            job = self.running.get(job_id)
+            if job is not None and duration_minutes > job.duration_minutes:
+                # A request attached on another node
+                self._extend(job, duration_minutes)
+        for job_id in lost:
+            job = self.running.get(job_id)
+            if job is None or job.status != RUNNING:
+                # Finished since the heartbeat started
+                continue
+            record = await run_io(self.store.get, job_id)
+            if record and record["status"] == CANCELLED:
+                logger.info(f"Job {job_id} was cancelled on another node")
+                self._drop(job, CANCELLED, record["message"])
+            else:
+                logger.warning(f"Lost the lease of job {job_id}, stopping it")
+                self._drop(job, FAILED, "Lease lost, the job was handed to another node")
+
+        nodes = await run_io(self.store.nodes)
+        self._peer_free = max((n["free"] for n in nodes if n["alive"] and n["node_id"] != self.node_id), default=0)
+        await run_io(self.store.prune, self.history_limit)
+
+    def _start(self, job: Job):
+        if job.attempts > 1:
+            logger.warning(f"Job {job.job_id} claimed again (attempt {job.attempts}), its node was lost")
+        self.running[job.job_id] = job
+        if self.admission is not None:
+            self.admission.started()
+        job.task = asyncio.create_task(self._run(job))
+        job.task.add_done_callback(lambda _: self._finished(job))
+
+    def _finished(self, job: Job):
+        """Free the worker of a job that ended, whatever the reason"""
+        self.running.pop(job.job_id, None)
+        for task in job.capture_tasks:
+            if not task.done():
+                task.cancel()
+        if self._wake is not None:
+            self._wake.set()
+
+    def _extend(self, job: Job, duration_minutes: int):
+        """Record a running job for longer"""
+        seconds = (duration_minutes - job.duration_minutes) * 60
+        if seconds <= 0:
+            return
+        job.duration_minutes = duration_minutes
+        if job.monitor is not None:
+            job.monitor.extend(seconds)
+        else:
+            job.extension += seconds
+        job.touch()
+
+    def _captured(self, job: Job):
+        """Free the worker of a job whose meeting is captured, it post-processes and uploads without one"""
+        job.captured = True
+        job.message = "Processing and uploading the recording"
+        job.touch()
+        self._end_capture(job)
+        if self._wake is not None:
+            self._wake.set()
+
+    def _attach_monitor(self, job: Job, monitor):
+        job.monitor = monitor
+        monitor.extend(job.extension)
+        job.extension = 0
+        job.capture_tasks.append(asyncio.create_task(self._watch_capture(job, monitor)))
+
+    async def _watch_capture(self, job: Job, monitor):
+        """End the job's capture as soon as its recording is told to stop, early or at its end"""
+        await monitor.stop_event.wait()
+        self._end_capture(job)
+
+    def _end_capture(self, job: Job):
+        """Save once that a job's recording stopped, later requests for its meeting then get a job of their own"""
+        if job.capture_ended:
+            return
+        job.capture_ended = True
+        job.capture_tasks.append(asyncio.create_task(self._save_capture_end(job)))
+
+    async def _save_capture_end(self, job: Job):
+        try:
+            await run_io(self.store.update, job.job_id, self.node_id, {"captured_at": time.time()})
+        except Exception as e:
+            logger.warning(f"Failed to save the end of the capture of job {job.job_id}: {e}")
+
+    def _drop(self, job: Job, status: str, message: str):
+        """Stop a job this node no longer owns"""
+        job.released = True
+        job.status = status
+        job.message = message
+        job.finished_at = datetime.now().isoformat()
+        job.touch()
+        if job.task:
+            job.task.cancel()
+
+    async def _run(self, job: Job):
+        job.message = "Waiting for the meeting to start" if job.start_at else "Recording in progress"
+        job.touch()
+        try:
+            result = await record_meeting(
+                job.meeting_url, job.remaining_minutes(), job.folder_name, job.upload_mode, job.encoding_profile,
+                start_at=job.start_at, on_progress=lambda progress: self._set_progress(job, progress),
+                on_upload_progress=lambda progress: self._set_upload_progress(job, progress),
+                on_monitor=lambda monitor: self._attach_monitor(job, monitor),
+                on_captured=lambda: self._captured(job))
+        except asyncio.CancelledError:
+            if not job.released:
+                # The node itself is being stopped
+                raise
+            return
+        except Exception as e:
+            logger.error(f"Job {job.job_id} crashed: {str(e)}")
+            result = {
+                "success": False,
+                "recording_file": None,
+                "drive_link": None,
+                "message": f"Recording failed: {str(e)}"
+            }
+
+        job.status = COMPLETED if result["success"] else FAILED
+        job.message = result["message"]
+        job.recording_file = result["recording_file"]
+        job.drive_link = result["drive_link"]
+        job.finished_at = datetime.now().isoformat()
+        job.touch()
+        logger.info(f"Job {job.job_id} finished with status: {job.status}")
+        try:
+            saved = await run_io(self.store.update, job.job_id, self.node_id, {
+                "status": job.status,
+                "message": job.message,
+                "recording_file": job.recording_file,
+                "drive_link": job.drive_link,
+                "finished_at": job.finished_at,
+                "progress": job.progress,
+                "upload": job.upload,
+            })
+            if not saved:
+                logger.warning(f"Job {job.job_id} finished after its lease was lost, result not saved")
+        except Exception as e:
+            logger.error(f"Failed to save the result of job {job.job_id}: {e}")
+
+    @staticmethod
+    def _set_progress(job: Job, progress: dict):
+        job.progress = progress
+        job.message = "Recording in progress"
+        job.touch()
+
+    @staticmethod
+    def _set_upload_progress(job: Job, progress: dict):
+        job.upload = progress
+        job.message = "Uploading to Google Drive"
+        job.touch()
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import config
+
+from executors import run_browser
+
+logger = config.get_logger()
+
+# Texts Meet shows once the recorder is no longer in the call
+MEETING_ENDED_TEXTS = [
+    "You left the meeting",
+    "The meeting has ended",
+    "You've been removed from the meeting",
+    "You can't join this video call",
+    "Return to home screen",
+]
+
+# Returns whether the call is over and how many participants are on screen
+MEETING_STATE_SCRIPT = """
+const texts = arguments[0];
+const body = document.body ? document.body.innerText : "";
+const ids = new Set(Array.from(document.querySelectorAll('[data-participant-id]'),
+                               el => el.getAttribute('data-participant-id')));
+return {ended: texts.some(t => body.includes(t)), participants: ids.size};
+"""
+
+
+class MeetingMonitor:
+    """Decides when a recording stops: at its scheduled end, which can be extended, or earlier"""
+
+    def __init__(self, driver, duration_seconds: float = None, poll_interval: float = None,
+                 alone_timeout: float = None):
+        """
+        Args:
+            driver: WebDriver that joined the meeting
+            duration_seconds (float): Scheduled length of the recording from now, None for no limit
+            poll_interval (float): Seconds between checks of the Meet page
+            alone_timeout (float): Seconds the recorder may stay alone after others left
+        """
+        self.driver = driver
+        self.poll_interval = poll_interval or config.get_meeting_poll_interval()
+        self.alone_timeout = alone_timeout or config.get_meeting_alone_timeout()
+        self.ends_at = time.monotonic() + duration_seconds if duration_seconds else None
+        self.stop_event = asyncio.Event()
+        self.reason = None
+        self.peak_participants = 0
+        self._alone_since = None
+
+    def stop(self, reason: str):
+        """Ask the recording to stop now"""
+        if self.stop_event.is_set():
+            return
+        self.reason = reason
+        logger.info(f"Stopping recording early: {reason}")
+        self.stop_event.set()
+
+    def extend(self, seconds: float):
+        """Move the scheduled end of a recording that is still running"""
+        if self.ends_at is not None and seconds > 0 and not self.stop_event.is_set():
+            self.ends_at += seconds
+            logger.info(f"Recording extended by {seconds:.0f}s")
+
+    def on_silence(self):
+        """Called by the recorder once the captured audio has been silent for too long"""
+        self.stop("audio silent")
+
+    def check(self, state: dict):
+        """Apply one snapshot of the Meet page"""
+        if state.get("ended"):
+            self.stop("meeting ended")
+            return
+
+        participants = state.get("participants") or 0
+        self.peak_participants = max(self.peak_participants, participants)
+        # Only count as alone once somebody else was there, the recorder may join early
+        if self.peak_participants > 1 and participants <= 1:
+            self._alone_since = self._alone_since or time.monotonic()
+            if time.monotonic() - self._alone_since >= self.alone_timeout:
+                self.stop("everyone else left")
+        else:
+            self._alone_since = None
+
+    async def watch(self):
+        """Poll the Meet page until the recording is due to end, the meeting ends or the task is cancelled"""
+        while not self.stop_event.is_set():
+            if self.ends_at is not None and time.monotonic() >= self.ends_at:
+                # The scheduled end is not an early stop, leave reason unset
+                self.stop_event.set()
+                break
+            try:
+                state = await run_browser(self.driver.execute_script, MEETING_STATE_SCRIPT, MEETING_ENDED_TEXTS)
+                self.check(state or {})
+            except Exception as e:
+                logger.warning(f"Failed to read meeting state: {e}")
+            timeout = self.poll_interval
+            if self.ends_at is not None:
+                timeout = max(0, min(timeout, self.ends_at - time.monotonic()))
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,102 @@
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Browser, login and join phases take seconds, recordings take up to hours
+PHASE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+THROUGHPUT_BUCKETS = tuple(2 ** n * 64 * 1024 for n in range(12))
+
+# Process names counted by the process gauge, keyed by the label they are reported under
+PROCESS_NAMES = {
+    "chromium": ("chromium", "chrome"),
+    "chromedriver": ("chromedriver",),
+    "ffmpeg": ("ffmpeg",),
+}
+
+PHASE_SECONDS = Histogram(
+    "recorder_phase_seconds",
+    "Time spent in each phase of a recording job",
+    ["phase"],
+    buckets=PHASE_BUCKETS,
+)
+UPLOAD_THROUGHPUT = Histogram(
+    "recorder_upload_throughput_bytes_per_second",
+    "Bytes per second of finished file uploads, retries included",
+    buckets=THROUGHPUT_BUCKETS,
+)
+ACTIVE_RECORDINGS = Gauge("recorder_active_recordings", "Recordings currently capturing audio")
+PROCESSES = Gauge("recorder_processes", "Live processes on this node by name", ["name"])
+FAILURES = Counter("recorder_failures_total", "Failed recording jobs by the phase that failed", ["reason"])
+ADMISSION_REJECTIONS = Counter(
+    "recorder_admission_rejections_total",
+    "Recording requests refused by admission control by HTTP status",
+    ["status"],
+)
+ADMISSION_HEADROOM = Gauge(
+    "recorder_admission_headroom_jobs",
+    "Further recordings the container's memory and CPU have room for",
+)
+
+SPOOL_BYTES = Gauge(
+    "recorder_spool_bytes",
+    "Bytes in the local spool by state: capturing, pending upload or kept after upload",
+    ["state"],
+)
+SPOOL_FREE_BYTES = Gauge(
+    "recorder_spool_free_bytes",
+    "Bytes a new recording may use within the spool quota and free disk space",
+)
+SPOOL_EVICTED_BYTES = Counter(
+    "recorder_spool_evicted_bytes_total",
+    "Bytes of uploaded recordings deleted from the spool by eviction policy",
+    ["policy"],
+)
+
+
+def count_processes(names) -> int:
+    """Count running processes whose command name is one of names"""
+    try:
+        pids = os.listdir("/proc")
+    except OSError:
+        return 0
+    count = 0
+    for pid in pids:
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                comm = f.read().strip()
+        except OSError:
+            continue
+        if comm in names:
+            count += 1
+    return count
+
+
+for _label, _names in PROCESS_NAMES.items():
+    PROCESSES.labels(_label).set_function(lambda names=_names: count_processes(names))
+
+
+def phase(name: str):
+    """Context manager timing one phase of a job into PHASE_SECONDS"""
+    return PHASE_SECONDS.labels(name).time()
+
+
+def record_failure(reason: str):
+    """Count a failed job under the phase it failed in"""
+    FAILURES.labels(reason).inc()
+
+
+def record_rejection(status_code: int):
+    """Count a recording request refused by admission control"""
+    ADMISSION_REJECTIONS.labels(str(status_code)).inc()
+
+
+def render():
+    """
+    Render every metric in the Prometheus text format
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
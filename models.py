@@ -1,15 +1,48 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
 
 class MeetingRequest(BaseModel):
     meeting_url: str
     duration_minutes: Optional[int] = 30
     folder_name: Optional[str] = "Meeting Recordings"
+    upload_mode: Optional[str] = None
+    encoding_profile: Optional[str] = None
+    start_at: Optional[datetime] = None
 
-class MeetingResponse(BaseModel):
+class RecordingProgress(BaseModel):
+    out_time: Optional[str] = None
+    out_time_seconds: Optional[float] = None
+    size_bytes: Optional[int] = None
+    bitrate_kbps: Optional[float] = None
+    speed: Optional[float] = None
+
+class UploadProgress(BaseModel):
+    bytes_sent: int
+    total_bytes: int
+    bytes_per_second: Optional[int] = None
+    chunk_bytes: Optional[int] = None
+
+class JobResponse(BaseModel):
+    job_id: str
     status: str
-    message: str
     meeting_url: str
     duration_minutes: int
+    folder_name: str
+    upload_mode: str
+    encoding_profile: str
+    start_at: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    message: Optional[str] = None
     recording_file: Optional[str] = None
     drive_link: Optional[str] = None
+    progress: Optional[RecordingProgress] = None
+    upload: Optional[UploadProgress] = None
+    node_id: Optional[str] = None
+    attempts: int = 0
+    requests: int = 1
+
+class JobListResponse(BaseModel):
+    jobs: List[JobResponse]
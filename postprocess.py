@@ -0,0 +1,265 @@
+"""
+Post-processing of finished recordings, run in worker processes
+
+Every function here takes and returns plain values so it can be sent to
+executors.run_cpu. ffmpeg does the decoding and encoding, NumPy the peak
+detection.
+"""
+
+import json
+import os
+import re
+import subprocess
+
+from encoding import get_profile
+
+# Loudness range of the normalized recording in LU, EBU R128's recommendation for speech
+LOUDNESS_RANGE = 11
+# Sample rate the audio is decoded at for the waveform peaks
+PEAKS_SAMPLE_RATE = 16000
+# Pixels of peaks computed per read from ffmpeg
+PEAKS_BLOCK_PIXELS = 1024
+# Containers the concat demuxer cuts to within a packet, Ogg is cut to whole pages, up to a second off
+STREAM_COPY_CUTS = ("mp3", "flac")
+
+
+class PostProcessError(Exception):
+    """Raised when ffmpeg fails on a recording"""
+
+
+def _ffmpeg(args: list, path: str) -> str:
+    """Run ffmpeg and return its log, raising PostProcessError when it fails"""
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-nostats", *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise PostProcessError(f"ffmpeg failed on {path}: {result.stderr.strip()[-500:]}")
+    return result.stderr
+
+
+def normalize_loudness(path: str, profile_name: str, target_lufs: float, true_peak: float) -> dict:
+    """
+    Normalize a recording to EBU R128 loudness in place, in two passes
+
+    The first pass measures the recording, the second applies one linear
+    gain computed from it, so quiet passages are not pumped up. Silent
+    recordings are left as they are.
+
+    Args:
+        path (str): Recording to normalize
+        profile_name (str): Encoding profile the recording was written with
+        target_lufs (float): Integrated loudness to reach
+        true_peak (float): Highest true peak allowed, in dBTP
+
+    Returns:
+        dict: Loudness measured before normalization, as printed by ffmpeg's loudnorm filter
+
+    Raises:
+        PostProcessError: When ffmpeg fails
+    """
+    profile = get_profile(profile_name)
+    target = f"I={target_lufs}:TP={true_peak}:LRA={LOUDNESS_RANGE}"
+    log = _ffmpeg(["-i", path, "-af", f"loudnorm={target}:print_format=json", "-f", "null", "-"], path)
+    measured = json.loads(log[log.rindex("{"):log.rindex("}") + 1])
+    if measured["input_i"] in ("-inf", "inf"):
+        return measured
+
+    # loudnorm outputs 192 kHz, keep the rate of the recording unless the profile sets one
+    rate = re.search(r"Audio: .*?(\d+) Hz", log)
+    resample = [] if "-ar" in profile.codec_args or not rate else ["-ar", rate.group(1)]
+    gain = (f"loudnorm={target}:measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+            f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+            f":offset={measured['target_offset']}:linear=true")
+    normalized = f"{path}.normalized{profile.extension}"
+    try:
+        _ffmpeg(["-loglevel", "error", "-y", "-i", path, "-af", gain, *resample, *profile.codec_args,
+                 "-f", profile.container, normalized], path)
+        os.replace(normalized, path)
+    finally:
+        if os.path.exists(normalized):
+            os.remove(normalized)
+    return measured
+
+
+def trim(path: str, profile_name: str, ranges: list) -> bool:
+    """
+    Cut a recording down to the given parts in place
+
+    For the containers in STREAM_COPY_CUTS the parts are joined by ffmpeg's
+    concat demuxer with a stream copy, so the audio is not re-encoded and
+    each cut falls on a packet boundary, keeping up to a packet more. Other
+    containers, and a copy that fails, are cut to the sample with the atrim
+    and concat filters and re-encoded with the recording's encoding profile.
+
+    Args:
+        path (str): Recording to cut
+        profile_name (str): Encoding profile the recording was written with
+        ranges (list): [start, end] in seconds of every part to keep, in order
+
+    Returns:
+        bool: True when the parts were stream copied, False when re-encoded
+
+    Raises:
+        PostProcessError: When ffmpeg fails
+    """
+    profile = get_profile(profile_name)
+    trimmed = f"{path}.trimmed{profile.extension}"
+    concat_list = f"{path}.trim.txt"
+    try:
+        copied = profile.container in STREAM_COPY_CUTS
+        if copied:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            with open(concat_list, "w") as f:
+                for start, end in ranges:
+                    f.write(f"file '{escaped}'\ninpoint {start}\noutpoint {end}\n")
+            try:
+                _ffmpeg(["-loglevel", "error", "-y", "-f", "concat", "-safe", "0", "-i", concat_list,
+                         "-c", "copy", "-f", profile.container, trimmed], path)
+            except PostProcessError:
+                copied = False
+        if not copied:
+            parts = "".join(f"[0:a]atrim={start}:{end},asetpts=PTS-STARTPTS[p{n}];"
+                            for n, (start, end) in enumerate(ranges))
+            joined = "".join(f"[p{n}]" for n in range(len(ranges)))
+            _ffmpeg(["-loglevel", "error", "-y", "-i", path,
+                     "-filter_complex", f"{parts}{joined}concat=n={len(ranges)}:v=0:a=1",
+                     *profile.codec_args, "-f", profile.container, trimmed], path)
+        os.replace(trimmed, path)
+    finally:
+        for leftover in (concat_list, trimmed):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return copied
+
+
+def transcode(path: str, profile_name: str) -> str:
+    """
+    Write a copy of a recording in another encoding profile, next to it
+
+    Returns:
+        str: Path of the copy, named <recording>.<profile><extension>
+
+    Raises:
+        PostProcessError: When ffmpeg fails
+    """
+    profile = get_profile(profile_name)
+    output = f"{os.path.splitext(path)[0]}.{profile.name}{profile.extension}"
+    _ffmpeg(["-loglevel", "error", "-y", "-i", path, *profile.codec_args, "-f", profile.container, output], path)
+    return output
+
+
+def waveform_peaks(path: str, peaks_per_second: int, sample_rate: int = PEAKS_SAMPLE_RATE) -> dict:
+    """
+    Minimum and maximum sample of every pixel of a recording's waveform
+
+    The audio is decoded to mono 16-bit PCM by ffmpeg and read in blocks,
+    each reshaped to one row per pixel and reduced with NumPy, so memory
+    stays flat however long the recording is.
+
+    Args:
+        path (str): Recording to read
+        peaks_per_second (int): Pixels per second of audio
+        sample_rate (int): Rate the audio is decoded at
+
+    Returns:
+        dict: Peaks in the audiowaveform JSON format (version 2, 8 bits), with data holding
+            a min and a max per pixel
+
+    Raises:
+        PostProcessError: When ffmpeg fails
+    """
+    # Imported here so the API process does not load NumPy, only the worker processes do
+    import numpy as np
+
+    samples_per_pixel = max(1, sample_rate // peaks_per_second)
+    process = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path, "-ac", "1", "-ar", str(sample_rate),
+         "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    minimums, maximums = [], []
+    rest = np.empty(0, dtype=np.int16)
+    try:
+        while True:
+            data = process.stdout.read(samples_per_pixel * PEAKS_BLOCK_PIXELS * 2)
+            if not data:
+                break
+            samples = np.concatenate((rest, np.frombuffer(data, dtype="<i2")))
+            whole = samples.size - samples.size % samples_per_pixel
+            pixels = samples[:whole].reshape(-1, samples_per_pixel)
+            minimums.append(pixels.min(axis=1))
+            maximums.append(pixels.max(axis=1))
+            rest = samples[whole:]
+        error = process.stderr.read().decode(errors="replace").strip()
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+    if process.returncode != 0:
+        raise PostProcessError(f"ffmpeg failed on {path}: {error[-500:]}")
+    if rest.size:
+        # The last, shorter pixel
+        minimums.append(rest.min(keepdims=True))
+        maximums.append(rest.max(keepdims=True))
+
+    # 16-bit samples to the 8-bit range, interleaved as min, max, min, max...
+    peaks = np.empty(2 * sum(block.size for block in minimums), dtype=np.int8)
+    if peaks.size:
+        peaks[0::2] = np.concatenate(minimums) >> 8
+        peaks[1::2] = np.concatenate(maximums) >> 8
+    return {
+        "version": 2,
+        "channels": 1,
+        "sample_rate": sample_rate,
+        "samples_per_pixel": samples_per_pixel,
+        "bits": 8,
+        "length": peaks.size // 2,
+        "data": peaks.tolist(),
+    }
+
+
+def speech_index(path: str, threshold_db: float) -> dict:
+    """
+    Speech index of a recording, measured from the file like the PCM tap while recording
+
+    Returns:
+        dict: speech.SpeechDetector index of the recording
+
+    Raises:
+        PostProcessError: When ffmpeg fails
+    """
+    # Imported here so the API process does not load NumPy, only the worker processes do
+    from recording import PCM_TAP_RATE, READ_SIZE
+    from speech import SpeechDetector
+
+    detector = SpeechDetector(threshold_db, PCM_TAP_RATE)
+    process = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path, "-ac", "1", "-ar", str(PCM_TAP_RATE),
+         "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(READ_SIZE)
+            if not data:
+                break
+            detector.feed(data)
+        error = process.stderr.read().decode(errors="replace").strip()
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+    if process.returncode != 0:
+        raise PostProcessError(f"ffmpeg failed on {path}: {error[-500:]}")
+    return detector.index()
+
+
+def write_peaks(path: str, peaks_per_second: int) -> str:
+    """
+    Compute a recording's waveform peaks and save them next to it
+
+    Returns:
+        str: Path of the peaks file, named <recording>.peaks.json
+    """
+    peaks = waveform_peaks(path, peaks_per_second)
+    output = f"{os.path.splitext(path)[0]}.peaks.json"
+    with open(f"{output}.tmp", "w") as f:
+        json.dump(peaks, f, separators=(",", ":"))
+    os.replace(f"{output}.tmp", output)
+    return output
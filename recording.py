@@ -1,32 +1,177 @@
 import asyncio
 import os
 
-async def start_recording_async(output_file: str, duration_seconds: int, pulse_source: str = "default"):
-    """Start FFmpeg recording asynchronously"""
+from encoding import get_profile
+
+import config
+
+logger = config.get_logger()
+
+# Bytes read from ffmpeg's stdout at a time when streaming
+READ_SIZE = 64 * 1024
+# Rate of the mono 16-bit PCM tap handed to on_pcm
+PCM_TAP_RATE = 8000
+
+async def start_recording_async(output_file: str, duration_seconds: int, pulse_source: str = "default",
+                                on_data=None, profile=None, stop_event: asyncio.Event = None,
+                                on_silence=None, segments=None, on_progress=None, on_pcm=None):
+    """
+    Start FFmpeg recording asynchronously
+
+    Recording lasts at most duration_seconds (no limit when None) and ends
+    earlier when stop_event is set or ffmpeg exits by itself.
+
+    When on_data is given, ffmpeg writes the encoded audio to stdout and every
+    chunk is both appended to output_file and passed to on_data as it arrives.
+    profile is an encoding.EncodingProfile, the configured default when omitted.
+    on_silence is called once the audio stays below SILENCE_THRESHOLD_DB for
+    SILENCE_TIMEOUT seconds. With segments (a segments.SegmentedRecording)
+    ffmpeg writes that recording's segments instead of output_file.
+    on_progress receives a dict of out_time, out_time_seconds, size_bytes,
+    bitrate_kbps and speed about twice a second.
+    With on_pcm, ffmpeg also writes the audio as PCM_TAP_RATE mono 16-bit
+    little-endian samples to a pipe of its own, and every chunk read from it
+    is passed to on_pcm, for analysis while recording.
+    """
+    profile = profile or get_profile()
     cmd = [
         "ffmpeg",
         "-y",
-        "-f", "pulse", 
+        "-nostats",
+        "-progress", "pipe:2",
+        "-f", "pulse",
         "-i", pulse_source,
-        "-c:a", "libmp3lame",
-        "-b:a", "192k",
-        output_file
     ]
-    
+    silence_timeout = config.get_silence_timeout()
+    if on_silence and silence_timeout:
+        cmd += ["-af", f"silencedetect=noise={config.get_silence_threshold_db()}dB:d={silence_timeout}"]
+    cmd += profile.codec_args
+    if on_data:
+        cmd += ["-f", profile.container, "pipe:1"]
+    elif segments:
+        cmd += segments.output_args()
+    else:
+        cmd.append(output_file)
+    tap_read, tap_write = os.pipe() if on_pcm else (None, None)
+    if on_pcm:
+        cmd += pcm_tap_args(tap_write)
+
     print(f"Starting recording: {' '.join(cmd)}")
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    
     try:
-        await asyncio.sleep(duration_seconds)
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=(tap_write,) if on_pcm else ()
+        )
+    except BaseException:
+        if on_pcm:
+            os.close(tap_read)
+        raise
+    finally:
+        # Only ffmpeg writes to the tap, it reaches end of file when ffmpeg exits
+        if on_pcm:
+            os.close(tap_write)
+
+    reader = asyncio.create_task(_tee_output(process.stdout, output_file, on_data)) if on_data else None
+    # Always drain stderr and the tap, a full pipe would stall ffmpeg
+    log_reader = asyncio.create_task(_watch_log(process.stderr, on_silence, on_progress))
+    tap_reader = asyncio.create_task(read_pcm_tap(tap_read, on_pcm)) if on_pcm else None
+
+    stop_event = stop_event or asyncio.Event()
+    waiters = [asyncio.create_task(stop_event.wait()), asyncio.create_task(process.wait())]
+    try:
+        await asyncio.wait(waiters, timeout=duration_seconds, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        process.terminate()
+        for waiter in waiters:
+            waiter.cancel()
+        if process.returncode is None:
+            process.terminate()
         try:
             await asyncio.wait_for(process.wait(), timeout=10)
         except asyncio.TimeoutError:
             process.kill()
-    
+        # ffmpeg flushes its last frames on exit, read them before returning
+        await asyncio.gather(*[r for r in (reader, log_reader, tap_reader) if r], return_exceptions=True)
+
+    if segments:
+        return bool(segments.segments())
     return os.path.exists(output_file)
+
+async def _tee_output(stream, output_file: str, on_data):
+    """Copy ffmpeg's stdout into the output file and hand each chunk to on_data"""
+    with open(output_file, "wb") as f:
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                break
+            f.write(data)
+            on_data(data)
+
+def pcm_tap_args(fd: int) -> list:
+    """ffmpeg output arguments writing the input's audio as mono PCM at PCM_TAP_RATE to file descriptor fd"""
+    return ["-map", "0:a", "-ac", "1", "-ar", str(PCM_TAP_RATE), "-c:a", "pcm_s16le", "-f", "s16le", f"pipe:{fd}"]
+
+async def read_pcm_tap(fd: int, on_pcm):
+    """Read the PCM tap until ffmpeg closes it, handing each chunk to on_pcm while it does not fail"""
+    loop = asyncio.get_running_loop()
+    stream = asyncio.StreamReader(limit=READ_SIZE)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream),
+                                                os.fdopen(fd, "rb", buffering=0))
+    try:
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                break
+            if on_pcm:
+                try:
+                    on_pcm(data)
+                except Exception as e:
+                    # Keep draining, ffmpeg would stall on a full pipe
+                    logger.warning(f"PCM tap analysis failed, ignoring the rest of the tap: {e}")
+                    on_pcm = None
+    finally:
+        transport.close()
+
+def _number(value: str, suffix: str = ""):
+    """Parse a -progress value such as "192.0kbits/s" or "1.01x", None when N/A"""
+    try:
+        return float(value[:-len(suffix)] if suffix and value.endswith(suffix) else value)
+    except ValueError:
+        return None
+
+def parse_progress(fields: dict) -> dict:
+    """Turn one block of ffmpeg -progress key=value pairs into a progress report"""
+    out_time_us = _number(fields.get("out_time_us", ""))
+    size = _number(fields.get("total_size", ""))
+    return {
+        "out_time": fields.get("out_time"),
+        "out_time_seconds": out_time_us / 1_000_000 if out_time_us is not None else None,
+        "size_bytes": int(size) if size is not None else None,
+        "bitrate_kbps": _number(fields.get("bitrate", ""), "kbits/s"),
+        "speed": _number(fields.get("speed", "").strip(), "x"),
+    }
+
+async def _watch_log(stream, on_silence, on_progress=None):
+    """Read ffmpeg's log and -progress output, reporting silence and progress"""
+    pending = b""
+    fields = {}
+    while True:
+        data = await stream.read(READ_SIZE)
+        if not data:
+            break
+        *lines, pending = (pending + data).replace(b"\r", b"\n").split(b"\n")
+        for line in lines:
+            if on_silence and b"silence_start" in line:
+                on_silence()
+                continue
+            key, sep, value = line.decode(errors="replace").partition("=")
+            if not sep or " " in key:
+                continue
+            # "progress" closes each block of -progress output
+            if key == "progress":
+                if on_progress:
+                    on_progress(parse_progress(fields))
+                fields = {}
+            else:
+                fields[key] = value
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import re
+
+import config
+
+from executors import run_io
+
+logger = config.get_logger()
+
+# Drive requires every chunk except the last to be a multiple of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+
+UPLOAD_FIELDS = "id,name,webViewLink,size"
+
+
+class ResumableUploadError(Exception):
+    """Raised when Drive rejects a resumable upload request"""
+
+    def __init__(self, message, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ResumableSession:
+    """Client for one Drive resumable upload session"""
+
+    def __init__(self, http, upload_url: str = None, uri: str = None):
+        """
+        Args:
+            http: requests-compatible session that adds the Authorization header
+            upload_url (str): Drive upload endpoint, taken from config when omitted
+            uri (str): URI of an existing session to continue
+        """
+        self.http = http
+        self.upload_url = upload_url or config.get_drive_upload_url()
+        self.uri = uri
+
+    def start(self, metadata: dict, mime_type: str, total_size: int = None) -> str:
+        """Open the session and return its URI"""
+        headers = {
+            "Content-Type": "application/json; charset=UTF-8",
+            "X-Upload-Content-Type": mime_type,
+        }
+        if total_size is not None:
+            headers["X-Upload-Content-Length"] = str(total_size)
+
+        response = self.http.post(
+            self.upload_url,
+            params={"uploadType": "resumable", "fields": UPLOAD_FIELDS},
+            headers=headers,
+            data=json.dumps(metadata),
+        )
+        if response.status_code != 200 or "Location" not in response.headers:
+            raise ResumableUploadError(f"Failed to start upload session: {response.status_code} {response.text}",
+                                       response.status_code)
+        self.uri = response.headers["Location"]
+        return self.uri
+
+    def send(self, data: bytes, offset: int, total_size: int = None):
+        """
+        Upload one chunk
+
+        Args:
+            data (bytes): Chunk content, empty to only finalize the upload
+            offset (int): Byte offset of the chunk in the file
+            total_size (int): File size once the last chunk is sent, None while streaming
+
+        Returns:
+            tuple: (bytes acknowledged by Drive, file metadata once the upload is complete)
+        """
+        total = "*" if total_size is None else str(total_size)
+        if data:
+            content_range = f"bytes {offset}-{offset + len(data) - 1}/{total}"
+        else:
+            content_range = f"bytes */{total}"
+
+        response = self.http.put(self.uri, headers={"Content-Range": content_range}, data=data)
+        return self._parse(response)
+
+    def query(self, total_size: int = None):
+        """Ask Drive how many bytes it has stored, used after a failed chunk"""
+        total = "*" if total_size is None else str(total_size)
+        response = self.http.put(self.uri, headers={"Content-Range": f"bytes */{total}"}, data=b"")
+        return self._parse(response)
+
+    def _parse(self, response):
+        if response.status_code in (200, 201):
+            result = response.json()
+            return int(result.get("size") or 0), result
+        if response.status_code == 308:
+            match = re.match(r"bytes=0-(\d+)", response.headers.get("Range", ""))
+            return (int(match.group(1)) + 1 if match else 0), None
+        raise ResumableUploadError(f"Chunk rejected by Drive: {response.status_code} {response.text}",
+                                   response.status_code)
+
+
+def align_chunk(size: int) -> int:
+    """Round a chunk size down to a multiple of 256 KiB, at least 256 KiB"""
+    return max(CHUNK_ALIGNMENT, int(size) - int(size) % CHUNK_ALIGNMENT)
+
+
+class ChunkSizer:
+    """
+    Picks the size of the next upload chunk from the measured link
+
+    Every chunk is sized to take about target_seconds at the smoothed
+    throughput, and never so short that the round trip is more than
+    MAX_RTT_SHARE of the request. The size at most doubles from one chunk
+    to the next and halves after a failed one, after which it only grows by
+    RECOVERY_GROWTH per chunk. A fast link ramps up quickly while a poor one
+    settles on small requests that are cheap to repeat. Pass the same value
+    for every bound to get fixed chunks.
+    """
+
+    MAX_RTT_SHARE = 0.05
+    RECOVERY_GROWTH = 1.25
+    # Weight of the newest sample in the throughput average
+    SMOOTHING = 0.3
+
+    def __init__(self, initial: int = None, minimum: int = None, maximum: int = None,
+                 target_seconds: float = None):
+        """
+        Args:
+            initial (int): Size of the first chunk in bytes
+            minimum (int): Smallest chunk in bytes
+            maximum (int): Largest chunk in bytes
+            target_seconds (float): Wanted duration of one request
+        """
+        self.minimum = align_chunk(minimum or config.get_upload_chunk_min_size())
+        self.maximum = max(self.minimum, align_chunk(maximum or config.get_upload_chunk_max_size()))
+        self.target_seconds = target_seconds or config.get_upload_chunk_target_seconds()
+        self.size = self._clamp(initial or config.get_upload_chunk_size())
+        self.throughput = None
+        self.rtt = None
+        self.failures = 0
+
+    def _clamp(self, size) -> int:
+        return min(self.maximum, max(self.minimum, align_chunk(size)))
+
+    def observe_rtt(self, seconds: float):
+        """Record the duration of a request that carried no file data"""
+        if seconds > 0:
+            self.rtt = seconds if self.rtt is None else min(self.rtt, seconds)
+
+    def record(self, sent: int, seconds: float) -> int:
+        """
+        Record a chunk acknowledged by Drive
+
+        Args:
+            sent (int): Bytes Drive acknowledged for the request
+            seconds (float): Duration of the request
+
+        Returns:
+            int: Size of the next chunk
+        """
+        if sent <= 0 or seconds <= 0:
+            return self.size
+        # The round trip is paid once per request, leave it out of the transfer rate
+        transfer = max(seconds - (self.rtt or 0), seconds * 0.1)
+        rate = sent / transfer
+        if self.throughput is None:
+            self.throughput = rate
+        else:
+            self.throughput += self.SMOOTHING * (rate - self.throughput)
+
+        target = self.target_seconds
+        if self.rtt:
+            target = max(target, self.rtt / self.MAX_RTT_SHARE)
+        growth = self.RECOVERY_GROWTH if self.failures else 2
+        self.size = self._clamp(min(self.throughput * target, self.size * growth))
+        return self.size
+
+    def failed(self) -> int:
+        """Record a failed request, returns the smaller size to retry with"""
+        self.failures += 1
+        self.size = self._clamp(self.size // 2)
+        return self.size
+
+
+class StreamingUpload:
+    """Feeds a growing stream of bytes into a Drive resumable session"""
+
+    def __init__(self, http, metadata: dict, mime_type: str, chunk_size: int = None,
+                 upload_url: str = None, max_retries: int = 5):
+        """
+        Args:
+            http: requests-compatible session that adds the Authorization header
+            metadata (dict): Drive file metadata (name, parents)
+            mime_type (str): MIME type of the uploaded stream
+            chunk_size (int): Bytes sent per request, rounded down to 256 KiB
+            upload_url (str): Drive upload endpoint, taken from config when omitted
+            max_retries (int): Attempts per chunk before the upload is abandoned
+        """
+        self.chunk_size = align_chunk(chunk_size or config.get_stream_chunk_size())
+        self.session = ResumableSession(http, upload_url)
+        self.metadata = metadata
+        self.mime_type = mime_type
+        self.max_retries = max_retries
+        self.offset = 0
+        self._buffer = bytearray()
+        self._queue = asyncio.Queue()
+        # Set once run() returned or failed, nothing reads the queue after that
+        self.closed = False
+
+    def feed(self, data: bytes):
+        """Queue bytes for upload, never blocks the caller, dropped once the upload has ended"""
+        if data and not self.closed:
+            self._queue.put_nowait(bytes(data))
+
+    def finish(self):
+        """Mark the end of the stream, the session is finalized once the queue drains"""
+        self._queue.put_nowait(None)
+
+    async def run(self):
+        """
+        Upload the stream until finish() is called
+
+        Returns:
+            dict: Metadata of the uploaded Drive file
+        """
+        try:
+            return await self._upload()
+        finally:
+            # A failed upload must not keep buffering the rest of the recording in memory
+            self.closed = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._buffer.clear()
+
+    async def _upload(self):
+        await run_io(self.session.start, self.metadata, self.mime_type)
+        logger.info(f"Streaming upload started: {self.metadata.get('name')}")
+
+        while True:
+            data = await self._queue.get()
+            if data is None:
+                break
+            self._buffer += data
+            while len(self._buffer) >= self.chunk_size:
+                await self._send(self.chunk_size, None)
+
+        # Send what is left as the final chunk with the now known total size
+        total_size = self.offset + len(self._buffer)
+        result = None
+        while result is None:
+            before = self.offset
+            result = await self._send(len(self._buffer), total_size)
+            if result is None and self.offset == before:
+                raise ResumableUploadError("Drive did not accept the final chunk")
+        logger.info(f"Streaming upload finished: {total_size} bytes")
+        return result
+
+    async def _send(self, length: int, total_size):
+        chunk = bytes(self._buffer[:length])
+        for attempt in range(self.max_retries):
+            try:
+                acked, result = await run_io(self.session.send, chunk, self.offset, total_size)
+                break
+            except Exception as e:
+                logger.warning(f"Streaming upload chunk at {self.offset} failed: {e}")
+                if attempt == self.max_retries - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+                try:
+                    acked, result = await run_io(self.session.query, total_size)
+                except Exception:
+                    continue
+                if result is not None or acked > self.offset:
+                    break
+
+        # Drive may store less than it was sent, keep the rest for the next request
+        sent = max(0, acked - self.offset)
+        del self._buffer[:sent]
+        self.offset += sent
+        return result
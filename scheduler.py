@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from datetime import datetime
+
+import config
+
+from drive_client import get_drive_oauth
+
+from executors import run_io
+
+logger = config.get_logger()
+
+# Seconds the scheduler waits after a failed pass, doubled on each failure in a row up to the poll interval
+ERROR_BACKOFF_SECONDS = 1
+
+
+def parse_event_time(value: str):
+    """Parse a Calendar dateTime, None for all-day dates and missing values"""
+    if not value or "T" not in value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class ScheduledMeeting:
+    """A calendar event with a Meet link waiting to be recorded"""
+
+    def __init__(self, key: str, meeting_url: str, start_at: datetime, end_at: datetime, summary: str):
+        self.key = key
+        self.meeting_url = meeting_url
+        self.start_at = start_at
+        self.end_at = end_at
+        self.summary = summary
+        self.job_id = None
+
+
+class CalendarScheduler:
+    """
+    Turns upcoming calendar events into recording jobs
+
+    Events are kept in a heap ordered by start time and submitted to the job
+    queue PREWARM_LEAD_SECONDS before they start. Polls are deduplicated by
+    event ID, moved events are rescheduled and events that disappear from the
+    calendar are cancelled as long as their recording has not started. A
+    pass that fails, on a job store error for one, is logged and retried
+    after a backoff, and meetings it could not submit stay in the heap.
+    """
+
+    def __init__(self, job_queue, fetch_events=None, calendar_ids: list = None, poll_interval: float = None,
+                 lookahead_minutes: int = None, lead_seconds: float = None, folder_name: str = None):
+        """
+        Args:
+            job_queue: JobQueue the recordings are submitted to
+            fetch_events (callable): Returns the upcoming events of a calendar ID,
+                in the format of GoogleDriveOAuth.fetch_upcoming_events
+            calendar_ids (list): Calendars to read
+            poll_interval (float): Seconds between polls
+            lookahead_minutes (int): How far ahead to read events
+            lead_seconds (float): Seconds before the start at which a job is submitted
+            folder_name (str): Drive folder for the recordings
+        """
+        self.job_queue = job_queue
+        self.fetch_events = fetch_events or self._fetch_from_google
+        self.calendar_ids = calendar_ids or config.get_calendar_ids()
+        self.poll_interval = poll_interval or config.get_calendar_poll_interval()
+        self.lookahead_minutes = lookahead_minutes or config.get_calendar_lookahead_minutes()
+        self.lead_seconds = config.get_prewarm_lead_seconds() if lead_seconds is None else lead_seconds
+        self.folder_name = folder_name or config.get_calendar_folder_name()
+        self.meetings = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._poll_requested = False
+        self._task = None
+        self._stats = {"polls": 0, "poll_errors": 0, "errors": 0, "added": 0, "rescheduled": 0, "cancelled": 0,
+                       "submitted": 0}
+
+    def start(self):
+        """Start polling on the running event loop"""
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Calendar scheduler watching: {', '.join(self.calendar_ids)}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        """Poll right away, e.g. after a calendar push notification"""
+        self._poll_requested = True
+        self._wake.set()
+
+    def stats(self):
+        return {**self._stats, "tracked": len(self.meetings)}
+
+    def watch_calendars(self, webhook_url: str):
+        """Ask Google to notify webhook_url when the calendars change"""
+        for calendar_id in self.calendar_ids:
+            get_drive_oauth().start_calendar_watch(webhook_url, calendar_id)
+
+    def _fetch_from_google(self, calendar_id: str):
+        return get_drive_oauth().fetch_upcoming_events(calendar_id, self.lookahead_minutes)
+
+    async def poll(self):
+        """Read every calendar and update the schedule"""
+        self._stats["polls"] += 1
+        for calendar_id in self.calendar_ids:
+            try:
+                events = await run_io(self.fetch_events, calendar_id)
+            except Exception as e:
+                # Leave this calendar's meetings alone, a failed poll is not a cancellation
+                self._stats["poll_errors"] += 1
+                logger.warning(f"Failed to read calendar {calendar_id}: {e}")
+                continue
+            await self.apply(calendar_id, events)
+
+    async def apply(self, calendar_id: str, events: list):
+        """Merge one calendar's current events into the schedule"""
+        seen = set()
+        for event in events:
+            try:
+                start_at = parse_event_time(event.get("start"))
+                if event.get("status") == "cancelled" or start_at is None:
+                    continue
+                end_at = parse_event_time(event.get("end"))
+                key = f"{calendar_id}/{event['id']}"
+                meeting_url = event["hangoutLink"]
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed event on calendar {calendar_id}: {e!r}")
+                # Leave its meeting alone, an unreadable event is not a cancellation
+                if isinstance(event, dict) and event.get("id"):
+                    seen.add(f"{calendar_id}/{event['id']}")
+                continue
+
+            # The same meeting on another calendar is recorded once
+            if any(m.key != key and m.meeting_url == meeting_url and m.start_at == start_at
+                   for m in self.meetings.values()):
+                continue
+            seen.add(key)
+
+            meeting = self.meetings.get(key)
+            if meeting is None:
+                meeting = ScheduledMeeting(key, meeting_url, start_at, end_at, event.get("summary"))
+                self.meetings[key] = meeting
+                self._push(meeting)
+                self._stats["added"] += 1
+                logger.info(f"Scheduled '{meeting.summary}' at {start_at.isoformat()}")
+            elif meeting.start_at != start_at or meeting.meeting_url != meeting_url:
+                if meeting.job_id and not await self.job_queue.cancel(meeting.job_id):
+                    # Already recording, let it run
+                    continue
+                meeting.start_at, meeting.meeting_url, meeting.end_at = start_at, meeting_url, end_at
+                meeting.job_id = None
+                self._push(meeting)
+                self._stats["rescheduled"] += 1
+                logger.info(f"Rescheduled '{meeting.summary}' to {start_at.isoformat()}")
+            elif not meeting.job_id:
+                meeting.end_at = end_at
+
+        prefix = f"{calendar_id}/"
+        for key in [k for k in self.meetings if k.startswith(prefix) and k not in seen]:
+            meeting = self.meetings.pop(key)
+            # Events also drop out once they are over, only count real cancellations
+            if meeting.job_id is None or await self.job_queue.cancel(meeting.job_id):
+                self._stats["cancelled"] += 1
+                logger.info(f"Cancelled '{meeting.summary}' at {meeting.start_at.isoformat()}")
+
+    async def dispatch_due(self, now: float = None):
+        """Submit every meeting whose start is within the lead time"""
+        now = now or time.time()
+        while self._heap and self._heap[0][0] - self.lead_seconds <= now:
+            start, _, key = heapq.heappop(self._heap)
+            meeting = self.meetings.get(key)
+            # Entries of moved, cancelled or submitted meetings are skipped here
+            if meeting is None or meeting.job_id or meeting.start_at.timestamp() != start:
+                continue
+            end = meeting.end_at.timestamp() if meeting.end_at else None
+            if end is not None and end <= now:
+                continue
+            duration_minutes = math.ceil((end - max(start, now)) / 60) if end else 30
+            # Calendar meetings are never refused, they wait for a recorder with room
+            try:
+                job = await self.job_queue.submit(meeting.meeting_url, max(duration_minutes, 1), self.folder_name,
+                                                  start_at=meeting.start_at, admit=False)
+            except Exception:
+                # Keep the entry for the next pass
+                self._push(meeting)
+                raise
+            meeting.job_id = job.job_id
+            self._stats["submitted"] += 1
+
+    def _push(self, meeting: ScheduledMeeting):
+        heapq.heappush(self._heap, (meeting.start_at.timestamp(), next(self._seq), meeting.key))
+
+    async def _run(self):
+        next_poll = 0
+        failures = 0
+        while True:
+            self._wake.clear()
+            try:
+                if self._poll_requested or time.time() >= next_poll:
+                    self._poll_requested = False
+                    await self.poll()
+                    next_poll = time.time() + self.poll_interval
+                await self.dispatch_due()
+                failures = 0
+            except Exception:
+                # A locked job store or a bad event must not end scheduling for good
+                failures += 1
+                self._stats["errors"] += 1
+                delay = min(ERROR_BACKOFF_SECONDS * 2 ** (failures - 1), self.poll_interval)
+                logger.exception(f"Calendar scheduler pass failed, retrying in {delay:g}s")
+                await asyncio.sleep(delay)
+                continue
+            next_due = self._heap[0][0] - self.lead_seconds if self._heap else float("inf")
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0, min(next_poll, next_due) - time.time()))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,128 @@
+import glob
+import json
+import os
+import shutil
+import subprocess
+import time
+
+import config
+
+from encoding import get_profile
+
+logger = config.get_logger()
+
+MANIFEST = "manifest.json"
+SEGMENT_PATTERN = "part_%05d"
+
+
+class SegmentedRecording:
+    """A recording written as fixed-length segments and joined once it ends"""
+
+    def __init__(self, output_file: str, profile=None, folder_name: str = None, directory: str = None,
+                 segment_seconds: int = None, created_at: float = None):
+        """
+        Args:
+            output_file (str): Final recording file the segments are joined into
+            profile: encoding.EncodingProfile of the segments
+            folder_name (str): Drive folder the recording is uploaded to
+            directory (str): Root directory for segment sets
+            segment_seconds (int): Length of one segment
+            created_at (float): When the recording started
+        """
+        self.output_file = os.path.abspath(output_file)
+        self.profile = profile or get_profile()
+        self.folder_name = folder_name
+        self.segment_seconds = segment_seconds or config.get_segment_seconds()
+        self.created_at = created_at or time.time()
+        name = os.path.splitext(os.path.basename(output_file))[0]
+        self.directory = os.path.join(directory or config.get_segment_dir(), name)
+
+    @classmethod
+    def load(cls, directory: str):
+        """Read a segment set back from its manifest"""
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        recording = cls(manifest["output_file"], get_profile(manifest["profile"]), manifest.get("folder_name"),
+                        segment_seconds=manifest.get("segment_seconds"), created_at=manifest.get("created_at"))
+        recording.directory = directory
+        return recording
+
+    def start(self):
+        """Create the segment directory and write the manifest"""
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {
+            "output_file": self.output_file,
+            "profile": self.profile.name,
+            "folder_name": self.folder_name,
+            "segment_seconds": self.segment_seconds,
+            "created_at": self.created_at,
+        }
+        tmp_path = os.path.join(self.directory, f"{MANIFEST}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.directory, MANIFEST))
+
+    def output_args(self) -> list:
+        """ffmpeg output options writing this recording's segments"""
+        return [
+            "-f", "segment",
+            "-segment_time", str(self.segment_seconds),
+            "-segment_format", self.profile.container,
+            "-reset_timestamps", "1",
+            os.path.join(self.directory, f"{SEGMENT_PATTERN}{self.profile.extension}"),
+        ]
+
+    def segments(self) -> list:
+        """Every non-empty segment on disk in recording order, the last one may be incomplete"""
+        paths = glob.glob(os.path.join(self.directory, f"part_*{self.profile.extension}"))
+        return sorted(p for p in paths if os.path.getsize(p) > 0)
+
+    def finalize(self) -> bool:
+        """
+        Join the segments into output_file without re-encoding and remove them
+
+        Returns:
+            bool: True when output_file was written
+        """
+        segments = self.segments()
+        if not segments:
+            logger.warning(f"No segments recorded in {self.directory}")
+            self.discard()
+            return False
+
+        if len(segments) == 1:
+            shutil.move(segments[0], self.output_file)
+        else:
+            concat_list = os.path.join(self.directory, "concat.txt")
+            with open(concat_list, "w") as f:
+                for path in segments:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            cmd = [
+                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", concat_list,
+                "-c", "copy", "-f", self.profile.container, self.output_file,
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                logger.error(f"Failed to join segments in {self.directory}: {result.stderr.strip()}")
+                return False
+
+        logger.info(f"Joined {len(segments)} segments into {self.output_file}")
+        self.discard()
+        return True
+
+    def discard(self):
+        """Remove the segment directory"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def find_orphans(directory: str = None) -> list:
+    """Segment sets left behind by recordings that never finished, e.g. after a crash"""
+    orphans = []
+    for manifest in sorted(glob.glob(os.path.join(directory or config.get_segment_dir(), "*", MANIFEST))):
+        try:
+            orphans.append(SegmentedRecording.load(os.path.dirname(manifest)))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable segment manifest {manifest}: {e}")
+    return orphans
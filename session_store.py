@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import config
+
+logger = config.get_logger()
+
+# Cookies that carry the Google sign-in, their expiry bounds the session
+AUTH_COOKIES = {"SID", "HSID", "SSID", "__Secure-1PSID", "__Secure-3PSID"}
+
+
+class SessionStore:
+    """Caches authenticated Google cookies per account on disk"""
+
+    def __init__(self, directory: str = None, max_age_seconds: int = None):
+        """
+        Args:
+            directory (str): Directory holding one cookie file per account
+            max_age_seconds (int): Longest time a saved session is trusted
+        """
+        self.directory = directory or config.get_session_dir()
+        self.max_age_seconds = max_age_seconds or config.get_session_max_age_seconds()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def _path(self, account: str) -> str:
+        digest = hashlib.sha256(account.lower().encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def load(self, account: str):
+        """
+        Get the saved cookies for an account
+
+        Returns:
+            list: Cookies in CDP format, None if missing or expired
+        """
+        path = self._path(account)
+        try:
+            with open(path) as f:
+                session = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable session file {path}: {e}")
+            self.invalidate(account)
+            return None
+
+        if session.get("expires_at", 0) <= time.time():
+            logger.info(f"Saved session for {account} has expired")
+            self.invalidate(account)
+            return None
+        return session.get("cookies") or None
+
+    def save(self, account: str, cookies: list):
+        """Save the cookies of a freshly authenticated browser"""
+        now = time.time()
+        expires_at = now + self.max_age_seconds
+        for cookie in cookies:
+            if cookie.get("name") in AUTH_COOKIES and cookie.get("expires", -1) > 0:
+                expires_at = min(expires_at, cookie["expires"])
+
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self._path(account)
+        tmp_path = f"{path}.tmp"
+        # Cookies are credentials, keep them readable by the owner only
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"account": account, "saved_at": now, "expires_at": expires_at, "cookies": cookies}, f)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, account: str):
+        """Forget the saved session for an account"""
+        try:
+            os.remove(self._path(account))
+        except FileNotFoundError:
+            pass
+
+    def record(self, hit: bool, seconds: float):
+        """Count a login attempt served from the cache or by a full login"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_seconds": round(self.hit_seconds, 3),
+                "miss_seconds": round(self.miss_seconds, 3),
+            }
@@ -0,0 +1,143 @@
+"""
+Speech activity of a recording, detected from ffmpeg's PCM tap while capturing
+
+SpeechDetector measures the RMS level of fixed frames of the tap with NumPy
+and keeps the runs of frames above a threshold as speech segments. The
+resulting index is saved as <recording>.speech.json and can be used to cut
+the silences out of the recording once it is captured, after which the
+index is measured again from the trimmed file.
+
+NumPy is loaded with this module, import it on first use so the API process
+starts without it.
+"""
+
+import json
+import os
+
+import numpy as np
+
+import config
+
+from recording import PCM_TAP_RATE
+
+INDEX_VERSION = 1
+# Length of the frames the level is measured over
+FRAME_MS = 30
+# Pauses shorter than this are part of the speech around them
+MERGE_GAP_SECONDS = 0.5
+# Speech shorter than this is a click or a cough, left out of the index
+MIN_SPEECH_SECONDS = 0.2
+# Full scale of 16-bit samples
+FULL_SCALE = 32768
+
+
+class SpeechDetector:
+    """
+    Speech segments of a mono 16-bit PCM stream, fed as it arrives
+
+    Each frame's mean square is compared with the threshold's, so the level
+    of a chunk is one reshape and one dot product per frame, without a
+    logarithm or a Python loop over samples. Runs of speech frames are found
+    with np.diff and merged across pauses shorter than MERGE_GAP_SECONDS, a
+    chunk boundary included.
+    """
+
+    def __init__(self, threshold_db: float = None, sample_rate: int = PCM_TAP_RATE, frame_ms: int = FRAME_MS):
+        """
+        Args:
+            threshold_db (float): RMS level in dBFS above which a frame is speech, SPEECH_THRESHOLD_DB when omitted
+            sample_rate (int): Rate of the PCM fed in
+            frame_ms (int): Length of the frames the level is measured over
+        """
+        self.threshold_db = config.get_speech_threshold_db() if threshold_db is None else threshold_db
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        # Frames measured so far
+        self.frames = 0
+        self._threshold_power = (FULL_SCALE * 10 ** (self.threshold_db / 20)) ** 2
+        self._gap_frames = round(MERGE_GAP_SECONDS * 1000 / frame_ms)
+        # Bytes of an unfinished frame, kept for the next chunk
+        self._rest = b""
+        # [first frame, frame after the last] of every speech segment
+        self._segments = []
+
+    def feed(self, data: bytes):
+        """Measure a chunk of PCM, any length"""
+        data = self._rest + data
+        frame_bytes = self.frame_samples * 2
+        whole = len(data) - len(data) % frame_bytes
+        self._rest = data[whole:]
+        if not whole:
+            return
+
+        samples = np.frombuffer(data, dtype="<i2", count=whole // 2).astype(np.float32)
+        frames = samples.reshape(-1, self.frame_samples)
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_samples
+        speech = (power > self._threshold_power).astype(np.int8)
+        # Starts and ends of the runs of speech frames, alternating
+        edges = np.flatnonzero(np.diff(speech, prepend=0, append=0)) + self.frames
+        for start, end in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+            if self._segments and start - self._segments[-1][1] <= self._gap_frames:
+                self._segments[-1][1] = end
+            else:
+                self._segments.append([start, end])
+        self.frames += frames.shape[0]
+
+    def segments(self) -> list:
+        """[start, end] in seconds of every speech segment so far"""
+        seconds = self.frame_ms / 1000
+        shortest = MIN_SPEECH_SECONDS / seconds
+        return [[round(start * seconds, 2), round(end * seconds, 2)]
+                for start, end in self._segments if end - start >= shortest]
+
+    def index(self) -> dict:
+        """The speech index of the audio fed so far, as saved next to the recording"""
+        segments = self.segments()
+        return {
+            "version": INDEX_VERSION,
+            "frame_ms": self.frame_ms,
+            "threshold_db": self.threshold_db,
+            "duration_seconds": round(self.frames * self.frame_ms / 1000, 2),
+            "speech_seconds": round(sum(end - start for start, end in segments), 2),
+            "segments": segments,
+        }
+
+
+def keep_ranges(index: dict, min_silence: float, padding: float) -> list:
+    """
+    Parts of a recording to keep when cutting its silences
+
+    Leading and trailing silence is cut, and so is every internal silence of
+    at least min_silence seconds. padding seconds stay around the speech, so
+    a silence shorter than twice the padding is kept whatever min_silence,
+    and the ranges never overlap.
+
+    Returns:
+        list: [start, end] in seconds of every part to keep, empty when the index has no speech
+    """
+    duration = index["duration_seconds"]
+    ranges = []
+    previous_end = None
+    for start, end in index["segments"]:
+        padded = [max(0.0, start - padding), min(duration, end + padding)]
+        if ranges and (start - previous_end < min_silence or padded[0] <= ranges[-1][1]):
+            ranges[-1][1] = padded[1]
+        else:
+            ranges.append(padded)
+        previous_end = end
+    return [[round(start, 2), round(end, 2)] for start, end in ranges]
+
+
+def write_index(path: str, index: dict) -> str:
+    """
+    Save a recording's speech index next to it
+
+    Returns:
+        str: Path of the index, named <recording>.speech.json
+    """
+    output = f"{os.path.splitext(path)[0]}.speech.json"
+    with open(f"{output}.tmp", "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(f"{output}.tmp", output)
+    return output
@@ -0,0 +1,273 @@
+import json
+import math
+import os
+import shutil
+import threading
+import time
+
+import config
+import metrics
+
+from admission import AdmissionError, DEFAULT_RETRY_AFTER
+
+logger = config.get_logger()
+
+EVICTION_POLICIES = ("uploaded", "lru")
+# Uploaded recordings kept by the "lru" policy and when each was last used
+INDEX = "kept.json"
+MIB = 1024 ** 2
+# Seconds the usage measured for one metrics scrape is reused, every gauge of a scrape shares it
+METRICS_MAX_AGE = 1
+
+
+class Spool:
+    """
+    Local storage for recordings until Drive has them
+
+    Recordings are written to the capture directory, which can be a tmpfs
+    mount, and moved to the spool directory once they end. An upload counts
+    as verified when Drive reports the file's full size. Verified recordings
+    are deleted right away with the "uploaded" policy, or kept with the
+    "lru" policy until the kept ones exceed SPOOL_KEEP_MB, the least recently
+    used going first. Recordings that were not uploaded are never evicted.
+
+    New recordings are refused while the estimated size of one does not fit
+    in the quota or on the disk, counting what running captures are still
+    expected to write.
+    """
+
+    def __init__(self, directory: str = None, capture_dir: str = None, quota: int = None, eviction: str = None,
+                 keep: int = None):
+        """
+        Args:
+            directory (str): Directory finished recordings are moved to
+            capture_dir (str): Directory recordings are written to while capturing, directory when omitted
+            quota (int): Bytes both directories may use together, 0 for no limit but the disk
+            eviction (str): "uploaded" or "lru"
+            keep (int): Bytes of uploaded recordings the "lru" policy keeps
+        """
+        self.directory = os.path.abspath(directory or config.get_spool_dir())
+        self.capture_dir = os.path.abspath(capture_dir or (directory or config.get_spool_capture_dir()))
+        self.quota = config.get_spool_quota() if quota is None else quota
+        self.eviction = eviction or config.get_spool_eviction()
+        self.keep = config.get_spool_keep() if keep is None else keep
+        if self.eviction not in EVICTION_POLICIES:
+            raise ValueError(f"SPOOL_EVICTION must be one of: {', '.join(EVICTION_POLICIES)}")
+        self._lock = threading.Lock()
+        # Paths being captured and the bytes each is expected to reach
+        self._reserved = {}
+        self._kept = self._load_index()
+        # (monotonic time, usage by state, free bytes) last measured for the metrics
+        self._measured = (-math.inf, {}, 0)
+
+        for state in ("capturing", "pending", "kept"):
+            metrics.SPOOL_BYTES.labels(state).set_function(lambda state=state: self._metrics()[0][state])
+        metrics.SPOOL_FREE_BYTES.set_function(lambda: self._metrics()[1])
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, INDEX)
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_path()) as f:
+                kept = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable spool index: {e}")
+            return {}
+        return {path: used for path, used in kept.items() if os.path.exists(path)}
+
+    def _save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._index_path()
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self._kept, f)
+        os.replace(f"{path}.tmp", path)
+
+    def capture_path(self, name: str) -> str:
+        """Path a new recording is written to"""
+        os.makedirs(self.capture_dir, exist_ok=True)
+        return os.path.join(self.capture_dir, name)
+
+    def reserve(self, path: str, expected_bytes: int):
+        """
+        Count a capture that is starting, evicting kept recordings if it would not fit
+
+        Args:
+            path (str): File or segment directory the capture writes to
+            expected_bytes (int): Size the recording is expected to reach
+        """
+        with self._lock:
+            self._make_room(expected_bytes)
+            self._reserved[path] = expected_bytes
+
+    def release(self, path: str):
+        """Stop counting a capture, once it ended or failed"""
+        with self._lock:
+            self._reserved.pop(path, None)
+
+    def finish(self, path: str) -> str:
+        """
+        Move a recording that was captured into the spool directory
+
+        Returns:
+            str: Path of the recording in the spool directory
+        """
+        if not os.path.exists(path) or os.path.dirname(os.path.abspath(path)) == self.directory:
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        destination = os.path.join(self.directory, os.path.basename(path))
+        shutil.move(path, destination)
+        return destination
+
+    def uploaded(self, path: str, result: dict):
+        """
+        Evict a recording by policy once Drive holds all of it
+
+        Args:
+            path (str): Recording that was uploaded
+            result (dict): Drive file metadata returned by the upload, None when it failed
+        """
+        if not result:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if str(result.get("size")) != str(size):
+            logger.warning(f"Drive reports {result.get('size')} of {size} bytes of {path}, keeping it")
+            return
+
+        if self.eviction == "uploaded":
+            self._delete(path, "uploaded")
+            return
+        with self._lock:
+            self._kept[path] = time.time()
+            self._evict_kept(self.keep)
+            self._save_index()
+
+    def check(self, expected_bytes: int):
+        """
+        Refuse a recording that would not fit
+
+        Raises:
+            AdmissionError: 507 when the quota and disk have no room for expected_bytes,
+                even after evicting every kept recording
+        """
+        free = self.free()
+        room = free + self.usage_by_state()["kept"]
+        if expected_bytes <= room:
+            return
+        metrics.record_rejection(507)
+        raise AdmissionError(
+            f"Recording spool full, {free // MIB} MiB free where a recording of this length needs about "
+            f"{expected_bytes // MIB} MiB, retry in {DEFAULT_RETRY_AFTER} seconds", 507, DEFAULT_RETRY_AFTER)
+
+    def usage(self) -> int:
+        """Bytes in the spool and capture directories"""
+        return sum(_size(root) for root in self._roots())
+
+    def usage_by_state(self) -> dict:
+        """Bytes being captured, waiting for or failed to upload, and kept after upload"""
+        with self._lock:
+            capturing = sum(_size(path) for path in self._reserved)
+            kept = sum(_size(path) for path in self._kept)
+        return {"capturing": capturing, "pending": max(0, self.usage() - capturing - kept), "kept": kept}
+
+    def free(self) -> int:
+        """Bytes a new recording may use, after what running captures are still expected to write"""
+        with self._lock:
+            return self._free()
+
+    def stats(self):
+        with self._lock:
+            kept_files = len(self._kept)
+            capturing = len(self._reserved)
+        return {
+            "directory": self.directory,
+            "capture_directory": self.capture_dir,
+            "eviction": self.eviction,
+            "quota_bytes": self.quota or None,
+            "free_bytes": self.free(),
+            "bytes": self.usage_by_state(),
+            "capturing": capturing,
+            "kept_files": kept_files,
+        }
+
+    def _metrics(self) -> tuple:
+        """
+        Usage by state and free bytes for the gauges, walking the directories once per scrape
+
+        Called while /metrics is rendered on the I/O executor.
+        """
+        measured_at, usage, free = self._measured
+        if time.monotonic() - measured_at > METRICS_MAX_AGE:
+            usage, free = self.usage_by_state(), self.free()
+            self._measured = (time.monotonic(), usage, free)
+        return usage, free
+
+    def _roots(self) -> list:
+        """The spool and capture directories, without one that lies inside the other"""
+        roots = sorted({self.directory, self.capture_dir})
+        return [root for root in roots if not any(root.startswith(other + os.sep) for other in roots)]
+
+    def _make_room(self, needed: int):
+        """Evict kept recordings, least recently used first, until needed bytes fit"""
+        evicted = False
+        while self._kept and self._free() < needed:
+            oldest = min(self._kept, key=self._kept.get)
+            self._kept.pop(oldest)
+            self._delete(oldest, "lru")
+            evicted = True
+        if evicted:
+            self._save_index()
+
+    def _free(self) -> int:
+        outstanding = sum(max(0, expected - _size(path)) for path, expected in self._reserved.items())
+        free = math.inf
+        if self.quota:
+            free = self.quota - self.usage() - outstanding
+        for root in {self.directory, self.capture_dir}:
+            free = min(free, shutil.disk_usage(_existing(root)).free - outstanding)
+        return max(0, int(free))
+
+    def _evict_kept(self, limit: int):
+        """Evict kept recordings, least recently used first, until they take at most limit bytes"""
+        while self._kept and sum(_size(path) for path in self._kept) > limit:
+            oldest = min(self._kept, key=self._kept.get)
+            self._kept.pop(oldest)
+            self._delete(oldest, "lru")
+
+    def _delete(self, path: str, policy: str):
+        size = _size(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        metrics.SPOOL_EVICTED_BYTES.labels(policy).inc(size)
+        logger.info(f"Evicted {os.path.basename(path)} from the spool ({size // MIB} MiB, policy {policy})")
+
+
+def _size(path: str) -> int:
+    """Bytes of a file, or of every file below a directory"""
+    if os.path.isfile(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def _existing(path: str) -> str:
+    """path, or its closest parent that exists, for disk usage before the directory is created"""
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
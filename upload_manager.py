@@ -0,0 +1,270 @@
+import asyncio
+import json
+import mimetypes
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+
+from drive_client import get_drive, get_authorized_session
+
+from resumable_upload import ChunkSizer, ResumableSession, ResumableUploadError
+
+logger = config.get_logger()
+
+# Status codes after which the whole upload is abandoned instead of retried
+FATAL_STATUS_CODES = {400, 401}
+# Status codes meaning the session URI expired and a new session is needed
+EXPIRED_STATUS_CODES = {404, 410}
+
+
+class UploadCancelled(Exception):
+    """Raised inside a worker when the manager shuts down mid-upload"""
+
+
+class UploadManager:
+    """
+    Uploads files to Drive on a bounded worker pool
+
+    The resumable session URI and acknowledged offset of every upload are
+    written to UPLOAD_STATE_DIR, so a failed or interrupted upload continues
+    from the last chunk Drive stored, including after a process restart.
+    Chunk sizes adapt to the throughput and round trip time measured during
+    each upload, see ChunkSizer.
+    """
+
+    def __init__(self, workers: int = None, state_dir: str = None, max_attempts: int = None,
+                 chunk_size: int = None, min_chunk_size: int = None, max_chunk_size: int = None,
+                 chunk_target_seconds: float = None, http_factory=get_authorized_session, on_uploaded=None):
+        """
+        Args:
+            workers (int): Uploads running at once
+            state_dir (str): Directory holding one state file per pending upload
+            max_attempts (int): Failed attempts in a row before an upload is given up
+            chunk_size (int): Bytes sent in the first request, rounded down to 256 KiB
+            min_chunk_size (int): Smallest chunk once the link is measured
+            max_chunk_size (int): Largest chunk once the link is measured
+            chunk_target_seconds (float): Wanted duration of one request
+            http_factory (callable): Returns the authorized requests session
+            on_uploaded (callable): Called on the upload worker with the file path and Drive metadata
+                after every finished upload, resumed ones included
+        """
+        self.workers = workers or config.get_upload_workers()
+        self.state_dir = state_dir or config.get_upload_state_dir()
+        self.max_attempts = max_attempts or config.get_upload_max_attempts()
+        self.chunk_size = chunk_size or config.get_upload_chunk_size()
+        self.min_chunk_size = min_chunk_size or config.get_upload_chunk_min_size()
+        self.max_chunk_size = max_chunk_size or config.get_upload_chunk_max_size()
+        self.chunk_target_seconds = chunk_target_seconds or config.get_upload_chunk_target_seconds()
+        self.base_delay = config.get_upload_retry_base_delay()
+        self.max_delay = config.get_upload_retry_max_delay()
+        self.http_factory = http_factory
+        self.on_uploaded = on_uploaded
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="upload")
+        self._stopping = threading.Event()
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, folder_name: str = None, file_name: str = None, mime_type: str = None,
+               on_progress=None):
+        """
+        Queue a file for upload
+
+        on_progress, when given, is called on the upload worker after every
+        chunk with bytes_sent, total_bytes, bytes_per_second and chunk_bytes.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the Drive file metadata, or None on failure
+        """
+        state = {
+            "upload_id": uuid.uuid4().hex,
+            "file_path": os.path.abspath(file_path),
+            "folder_name": folder_name,
+            "file_name": file_name or os.path.basename(file_path),
+            "mime_type": mime_type or mimetypes.guess_type(file_path)[0] or "application/octet-stream",
+            "session_uri": None,
+            "offset": 0,
+            "attempts": 0,
+            "created_at": time.time(),
+        }
+        self._save(state)
+        return self._submit_state(state, on_progress)
+
+    async def upload(self, file_path: str, folder_name: str = None, file_name: str = None, mime_type: str = None,
+                     on_progress=None):
+        """Upload a file without blocking the event loop, on_progress is called on the loop"""
+        if on_progress:
+            loop = asyncio.get_running_loop()
+            callback = on_progress
+            on_progress = lambda progress: loop.call_soon_threadsafe(callback, progress)  # noqa: E731
+        return await asyncio.wrap_future(self.submit(file_path, folder_name, file_name, mime_type, on_progress))
+
+    def resume_pending(self):
+        """Queue every upload left unfinished by a previous process"""
+        if not os.path.isdir(self.state_dir):
+            return []
+        futures = []
+        for name in sorted(os.listdir(self.state_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable upload state {name}: {e}")
+                continue
+            with self._lock:
+                if state["upload_id"] in self._active:
+                    continue
+            logger.info(f"Resuming upload of {state['file_path']} from byte {state['offset']}")
+            futures.append(self._submit_state(state))
+        return futures
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._active)
+
+    def shutdown(self):
+        """Stop after the current chunks, unfinished uploads resume on the next start"""
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_state(self, state, on_progress=None):
+        with self._lock:
+            self._active.add(state["upload_id"])
+        return self._executor.submit(self._run, state, on_progress)
+
+    def _state_path(self, state):
+        return os.path.join(self.state_dir, f"{state['upload_id']}.json")
+
+    def _save(self, state):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._state_path(state)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _forget(self, state):
+        try:
+            os.remove(self._state_path(state))
+        except FileNotFoundError:
+            pass
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _run(self, state, on_progress=None):
+        try:
+            return self._upload_with_retries(state, on_progress)
+        finally:
+            with self._lock:
+                self._active.discard(state["upload_id"])
+
+    def _upload_with_retries(self, state, on_progress=None):
+        if not os.path.exists(state["file_path"]):
+            logger.error(f"Upload source missing, dropping upload: {state['file_path']}")
+            self._forget(state)
+            return None
+
+        started = time.monotonic()
+        first_offset = state["offset"]
+        # Shared by every attempt, so retries start from what was measured
+        sizer = ChunkSizer(self.chunk_size, self.min_chunk_size, self.max_chunk_size, self.chunk_target_seconds)
+        while True:
+            start_offset = state["offset"]
+            try:
+                with metrics.phase("upload"):
+                    result = self._upload(state, sizer, on_progress)
+                self._forget(state)
+                sent = os.path.getsize(state["file_path"]) - first_offset
+                metrics.UPLOAD_THROUGHPUT.observe(sent / max(time.monotonic() - started, 1e-3))
+                logger.info(f"Uploaded {state['file_name']} after {state['attempts'] + 1} attempt(s)")
+                if self.on_uploaded:
+                    try:
+                        self.on_uploaded(state["file_path"], result)
+                    except Exception as e:
+                        logger.warning(f"After uploading {state['file_name']}: {e}")
+                return result
+            except UploadCancelled:
+                logger.info(f"Upload of {state['file_name']} paused at byte {state['offset']}")
+                return None
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                # Only consecutive failures without progress count towards the limit
+                if state["offset"] > start_offset:
+                    state["attempts"] = 0
+                state["attempts"] += 1
+                sizer.failed()
+                if status_code in FATAL_STATUS_CODES or state["attempts"] >= self.max_attempts:
+                    logger.error(f"Upload of {state['file_name']} failed for good: {e}")
+                    self._forget(state)
+                    return None
+                if status_code in EXPIRED_STATUS_CODES:
+                    logger.warning(f"Upload session for {state['file_name']} expired, starting over")
+                    state["session_uri"] = None
+                    state["offset"] = 0
+                self._save(state)
+
+                delay = self._backoff(state["attempts"])
+                logger.warning(f"Upload of {state['file_name']} failed ({e}), retry {state['attempts']} in {delay:.1f}s")
+                if self._stopping.wait(delay):
+                    return None
+
+    def _upload(self, state, sizer: ChunkSizer, on_progress=None):
+        size = os.path.getsize(state["file_path"])
+        session = ResumableSession(self.http_factory(), uri=state["session_uri"])
+        sent_at = time.monotonic()
+
+        if not state["session_uri"]:
+            metadata = {"name": state["file_name"]}
+            if state["folder_name"]:
+                with metrics.phase("create_folder"):
+                    folder = get_drive().create_folder(state["folder_name"])
+                if folder:
+                    metadata["parents"] = [folder["id"]]
+            try:
+                sent_at = time.monotonic()
+                state["session_uri"] = session.start(metadata, state["mime_type"], size)
+            except ResumableUploadError as e:
+                if e.status_code == 404 and state["folder_name"]:
+                    # The cached parent folder is gone, resolve it again on the retry
+                    get_drive().folder_cache.invalidate(state["folder_name"])
+                raise
+            state["offset"] = 0
+            self._save(state)
+        else:
+            # Ask Drive what it stored, the saved offset may be behind it
+            state["offset"], result = session.query(size)
+            if result is not None:
+                return result
+        # Neither request carries file data, so they time the round trip
+        sizer.observe_rtt(time.monotonic() - sent_at)
+
+        with open(state["file_path"], "rb") as f:
+            while True:
+                if self._stopping.is_set():
+                    raise UploadCancelled()
+                f.seek(state["offset"])
+                chunk = f.read(sizer.size)
+                offset = state["offset"]
+                sent_at = time.monotonic()
+                state["offset"], result = session.send(chunk, offset, size)
+                sizer.record(state["offset"] - offset, time.monotonic() - sent_at)
+                if on_progress:
+                    on_progress({
+                        "bytes_sent": size if result is not None else state["offset"],
+                        "total_bytes": size,
+                        "bytes_per_second": round(sizer.throughput or 0),
+                        "chunk_bytes": sizer.size,
+                    })
+                if result is not None:
+                    return result
+                self._save(state)
+                if not chunk:
+                    raise ResumableUploadError("Drive did not complete the upload after the last chunk")